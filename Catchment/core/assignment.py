@@ -0,0 +1,68 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from qgis.core import (
+    QgsFeatureRequest,
+    QgsFeatureSource,
+    QgsGeometry,
+    QgsGeometryEngine,
+    QgsPointXY,
+    QgsRectangle,
+    QgsSpatialIndex,
+)
+
+
+class CatchmentIndex:
+    """
+    Spatial index of isochrones, telling which catchments contain a point.
+
+    Only the isochrones whose bounding box contains the point are tested
+    exactly, against geometries prepared on first use, so points are assigned
+    without testing each point against every isochrone.
+    """
+
+    def __init__(self, isochrones: QgsFeatureSource, id_field: str) -> None:
+        self.index = QgsSpatialIndex()
+        self.catchments: Dict[int, Tuple[Any, float]] = {}
+        self.geometries: Dict[int, QgsGeometry] = {}
+        self.engines: Dict[int, QgsGeometryEngine] = {}
+        request = QgsFeatureRequest().setSubsetOfAttributes(
+            [id_field, "isochrone_distance"], isochrones.fields()
+        )
+        for feature in isochrones.getFeatures(request):
+            if not feature.hasGeometry():
+                continue
+            self.index.addFeature(feature)
+            self.catchments[feature.id()] = (
+                feature[id_field],
+                feature["isochrone_distance"],
+            )
+            self.geometries[feature.id()] = feature.geometry()
+
+    def assign(self, point: QgsPointXY) -> Tuple[List[Any], Optional[float]]:
+        """
+        Ids of the catchments containing the point, nearest first, and the
+        smallest isochrone distance, or None if no catchment contains the point.
+        """
+        geometry = QgsGeometry.fromPointXY(point)
+        matches = sorted(
+            (
+                self.catchments[fid]
+                for fid in self.index.intersects(QgsRectangle(point, point))
+                if self.__engine(fid).intersects(geometry.constGet())
+            ),
+            key=lambda catchment: catchment[1],
+        )
+        ids: List[Any] = []
+        for catchment_id, _ in matches:
+            # a catchment may contain the point at several distances
+            if catchment_id not in ids:
+                ids.append(catchment_id)
+        return ids, matches[0][1] if matches else None
+
+    def __engine(self, fid: int) -> QgsGeometryEngine:
+        engine = self.engines.get(fid)
+        if engine is None:
+            engine = QgsGeometry.createGeometryEngine(self.geometries[fid].constGet())
+            engine.prepareGeometry()
+            self.engines[fid] = engine
+        return engine
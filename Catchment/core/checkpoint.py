@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# finished point id with the hashes of its geometry and attributes
+FinishedPoint = Tuple[int, Optional[str], Optional[str]]
+
+
+def geometry_hash(wkb: bytes) -> str:
+    return hashlib.sha1(wkb).hexdigest()
+
+
+def feature_ids_hash(feature_ids: Iterable[int]) -> str:
+    """Same for the same features, in whatever order they are given"""
+    return hashlib.sha1(
+        ",".join(str(fid) for fid in sorted(feature_ids)).encode("ascii")
+    ).hexdigest()
+
+
+def _json_value(value: Any) -> Optional[str]:
+    """NULL as None, and dates and other Qt values as their representation"""
+    if hasattr(value, "isNull") and value.isNull():
+        return None
+    return repr(value)
+
+
+def attribute_hash(attributes: List[Any]) -> str:
+    return hashlib.sha1(
+        json.dumps(attributes, default=_json_value).encode("utf-8")
+    ).hexdigest()
+
+
+class RunCheckpoint:
+    """
+    Keeps track of the points that have been finished in a run writing to a
+    geopackage, so that a cancelled or crashed run can be resumed.
+
+    The checkpoint is saved next to the geopackage. It is only valid for the
+    same job, i.e. the same input layer, selection and request parameters.
+
+    The hashes of the finished points and the isochrones written for each
+    point are saved too, so that a complete run can later be updated with the
+    points that have changed since.
+    """
+
+    def __init__(self, geopackage_file: str, job: Dict[str, Any]) -> None:
+        self.path = os.path.splitext(geopackage_file)[0] + ".checkpoint.sqlite"
+        self.job = json.dumps(job, sort_keys=True)
+        self._connection = sqlite3.connect(self.path)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS finished_points (fid INTEGER PRIMARY KEY)"
+            )
+            # checkpoints of older versions have no hashes
+            columns = {
+                row[1]
+                for row in self._connection.execute(
+                    "PRAGMA table_info(finished_points)"
+                )
+            }
+            for column in ("geometry_hash", "attribute_hash"):
+                if column not in columns:
+                    self._connection.execute(
+                        f"ALTER TABLE finished_points ADD COLUMN {column} TEXT"
+                    )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS isochrones "
+                "(fid INTEGER PRIMARY KEY, point_fid INTEGER NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS isochrones_point_fid "
+                "ON isochrones (point_fid)"
+            )
+        meta = dict(self._connection.execute("SELECT key, value FROM meta"))
+        self.resumable = meta.get("job") == self.job and meta.get("complete") == "0"
+        self.updatable = meta.get("job") == self.job and meta.get("complete") == "1"
+
+    def reset(self) -> None:
+        """Starts the checkpoint from scratch for a new run"""
+        with self._connection:
+            self._connection.execute("DELETE FROM finished_points")
+            self._connection.execute("DELETE FROM isochrones")
+            self._connection.execute("DELETE FROM meta")
+            self._connection.executemany(
+                "INSERT INTO meta VALUES (?, ?)",
+                [("job", self.job), ("complete", "0")],
+            )
+        self.resumable = False
+        self.updatable = False
+
+    def finished_ids(self) -> Set[int]:
+        return {
+            fid
+            for (fid,) in self._connection.execute("SELECT fid FROM finished_points")
+        }
+
+    def point_hashes(self) -> Dict[int, Tuple[Optional[str], Optional[str]]]:
+        """Geometry and attribute hashes of the finished points"""
+        return {
+            fid: (geometry, attributes)
+            for fid, geometry, attributes in self._connection.execute(
+                "SELECT fid, geometry_hash, attribute_hash FROM finished_points"
+            )
+        }
+
+    def isochrone_ids(self, point_ids: Iterable[int]) -> Dict[int, List[int]]:
+        """Ids of the isochrones written for each of the given points"""
+        isochrones: Dict[int, List[int]] = {}
+        for point_fid in point_ids:
+            isochrones[point_fid] = [
+                fid
+                for (fid,) in self._connection.execute(
+                    "SELECT fid FROM isochrones WHERE point_fid = ?", (point_fid,)
+                )
+            ]
+        return isochrones
+
+    def mark_finished(
+        self,
+        points: Iterable[FinishedPoint],
+        isochrones: Iterable[Tuple[int, int]] = (),
+    ) -> None:
+        """
+        Saves the finished points, and the ids of the isochrones written with
+        the id of the point each isochrone was fetched for.
+        """
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO isochrones VALUES (?, ?)", isochrones
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO finished_points VALUES (?, ?, ?)", points
+            )
+
+    def forget_points(self, point_ids: Iterable[int]) -> List[int]:
+        """
+        Marks the points unfinished, so that they will be fetched again.
+        Returns the ids of their isochrones, which should be deleted.
+        """
+        point_ids = list(point_ids)
+        isochrone_ids = [
+            fid for fids in self.isochrone_ids(point_ids).values() for fid in fids
+        ]
+        with self._connection:
+            self._connection.executemany(
+                "DELETE FROM isochrones WHERE point_fid = ?",
+                ((fid,) for fid in point_ids),
+            )
+            self._connection.executemany(
+                "DELETE FROM finished_points WHERE fid = ?",
+                ((fid,) for fid in point_ids),
+            )
+        return isochrone_ids
+
+    def forget_unfinished(self, isochrone_ids: Iterable[int]) -> List[int]:
+        """
+        Forgets the isochrones written for points that were not finished.
+        Returns their ids, together with the ids of the given isochrones that
+        were written after the last isochrone saved in the checkpoint. Both
+        are left behind by a run that stopped between writing isochrones and
+        saving them here, and should be deleted, since their points will be
+        fetched again.
+        """
+        unfinished_query = (
+            "FROM isochrones WHERE point_fid NOT IN (SELECT fid FROM finished_points)"
+        )
+        (last,) = self._connection.execute("SELECT MAX(fid) FROM isochrones").fetchone()
+        unfinished = [
+            fid for (fid,) in self._connection.execute(f"SELECT fid {unfinished_query}")
+        ]
+        with self._connection:
+            self._connection.execute(f"DELETE {unfinished_query}")
+        if last is None:
+            if self.finished_ids():
+                # checkpoints of older versions have no isochrones
+                return unfinished
+            last = -1
+        return unfinished + [fid for fid in isochrone_ids if fid > last]
+
+    def start_update(self) -> None:
+        """Marks a complete run unfinished, so an interrupted update is resumed"""
+        with self._connection:
+            self._connection.execute(
+                "UPDATE meta SET value = '0' WHERE key = 'complete'"
+            )
+        self.updatable = False
+
+    def mark_complete(self) -> None:
+        """Marks the whole run complete, so it will not be resumed"""
+        with self._connection:
+            self._connection.execute(
+                "UPDATE meta SET value = '1' WHERE key = 'complete'"
+            )
+
+    def close(self) -> None:
+        self._connection.close()
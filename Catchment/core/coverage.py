@@ -0,0 +1,110 @@
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from PyQt5.QtCore import QVariant
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransformContext,
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+    QgsWkbTypes,
+)
+
+from ..qgis_plugin_tools.tools.resources import plugin_name
+
+TASK_LOGGER = logging.getLogger(f"{plugin_name()}_task")
+
+
+def union_geometries(geometries: List[QgsGeometry]) -> QgsGeometry:
+    """
+    Merges the geometries with a cascaded union. GEOS builds a spatial tree of
+    the geometries and unions neighbouring ones first, so the intermediate
+    results stay small, unlike a dissolve that grows a single polygon by adding
+    one overlapping isochrone at a time.
+    """
+    union = QgsGeometry.unaryUnion(geometries)
+    if union.isNull() and geometries:
+        # a single invalid isochrone makes the whole union fail
+        union = QgsGeometry.unaryUnion(
+            [geometry.makeValid() for geometry in geometries]
+        )
+    return union
+
+
+def coverage_fields() -> QgsFields:
+    fields = QgsFields()
+    fields.append(
+        QgsField(name="isochrone_distance", type=QVariant.Double, typeName="double")
+    )
+    fields.append(QgsField(name="isochrones", type=QVariant.Int, typeName="int"))
+    return fields
+
+
+def coverage_features(
+    isochrones: Iterable[QgsFeature], fields: QgsFields
+) -> List[QgsFeature]:
+    """
+    Unions the isochrones of each distance, returning a multipolygon for each
+    distance together with the number of isochrones it covers.
+    """
+    geometries: Dict[float, List[QgsGeometry]] = defaultdict(list)
+    for isochrone in isochrones:
+        if isochrone.hasGeometry():
+            geometries[isochrone["isochrone_distance"]].append(isochrone.geometry())
+    features = []
+    for distance in sorted(geometries):
+        union = union_geometries(geometries[distance])
+        union.convertToMultiType()
+        feature = QgsFeature(fields)
+        feature.setGeometry(union)
+        feature.setAttributes([distance, len(geometries[distance])])
+        features.append(feature)
+    return features
+
+
+def create_coverage_layer(
+    isochrone_layer: QgsVectorLayer, name: str, directory: str = ""
+) -> Optional[QgsVectorLayer]:
+    """
+    Creates a layer with the area covered by any isochrone of each distance.
+    The layer is saved to a geopackage if a directory is given, otherwise it
+    is kept in memory.
+    """
+    fields = coverage_fields()
+    request = QgsFeatureRequest().setSubsetOfAttributes(
+        ["isochrone_distance"], isochrone_layer.fields()
+    )
+    features = coverage_features(isochrone_layer.getFeatures(request), fields)
+    if not directory:
+        layer = QgsVectorLayer("MultiPolygon?crs=epsg:4326", name, "memory")
+        layer.dataProvider().addAttributes(fields)
+        layer.updateFields()
+        layer.dataProvider().addFeatures(features)
+        layer.updateExtents()
+        return layer
+
+    geopackage_file = os.path.join(directory, f"{name}.gpkg")
+    save_options = QgsVectorFileWriter.SaveVectorOptions()
+    save_options.driverName = "GPKG"
+    writer = QgsVectorFileWriter.create(
+        geopackage_file,
+        fields,
+        QgsWkbTypes.MultiPolygon,
+        QgsCoordinateReferenceSystem("EPSG:4326"),
+        QgsCoordinateTransformContext(),
+        save_options,
+    )
+    if writer.hasError():
+        TASK_LOGGER.error(f"Could not save file: {writer.errorMessage()}")
+        return None
+    writer.addFeatures(features)
+    # the file is closed once the writer is deleted
+    del writer
+    return QgsVectorLayer(geopackage_file, name, "ogr")
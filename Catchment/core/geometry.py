@@ -0,0 +1,107 @@
+import struct
+from itertools import chain
+from typing import Dict, List
+
+from qgis.core import QgsGeometry, QgsWkbTypes
+
+try:
+    import numpy as np
+except ImportError:  # numpy is bundled with most, but not all QGIS installations
+    np = None
+
+# little endian WKB polygon header: byte order, geometry type, ring count
+WKB_POLYGON_HEADER = struct.Struct("<BII")
+WKB_LITTLE_ENDIAN = 1
+WKB_POLYGON = 3
+WKB_MULTIPOLYGON = 6
+WKB_RING_HEADER = struct.Struct("<I")
+WKB_HEADER = struct.Struct("<BI")
+WKB_COUNT = struct.Struct("<I")
+
+
+def _ring_to_wkb(ring: List[List[float]]) -> bytes:
+    """Packs the x and y of each vertex to a WKB linear ring"""
+    if np is not None:
+        coordinates = np.asarray(ring, dtype="<f8")
+        # GeoJSON positions may have a third coordinate, which we don't need
+        if coordinates.ndim == 2 and coordinates.shape[1] != 2:
+            coordinates = np.ascontiguousarray(coordinates[:, :2])
+        return WKB_RING_HEADER.pack(len(ring)) + coordinates.tobytes()
+    return WKB_RING_HEADER.pack(len(ring)) + struct.pack(
+        f"<{2 * len(ring)}d", *chain.from_iterable(vertex[:2] for vertex in ring)
+    )
+
+
+def polygon_to_wkb(rings: List[List[List[float]]]) -> bytes:
+    """Converts GeoJSON polygon coordinates to WKB"""
+    return WKB_POLYGON_HEADER.pack(
+        WKB_LITTLE_ENDIAN, WKB_POLYGON, len(rings)
+    ) + b"".join(_ring_to_wkb(ring) for ring in rings)
+
+
+def geometry_from_geojson(geojson: Dict) -> QgsGeometry:
+    """
+    Creates a geometry from a GeoJSON polygon, including its interior rings.
+
+    The coordinates are packed to WKB directly, without creating a Python
+    object for each vertex.
+    """
+    if geojson["type"] != "Polygon":
+        raise ValueError(f"Unsupported isochrone geometry type {geojson['type']}")
+    geometry = QgsGeometry()
+    geometry.fromWkb(polygon_to_wkb(geojson["coordinates"]))
+    return geometry
+
+
+def polygon_rings(geometry: QgsGeometry) -> List["np.ndarray"]:
+    """
+    Rings of all the parts of a polygon or multipolygon as arrays of x and y,
+    read from the WKB without creating a Python object for each vertex.
+    """
+    wkb = bytes(geometry.asWkb())
+    _, geometry_type = WKB_HEADER.unpack_from(wkb)
+    if geometry_type == WKB_POLYGON:
+        polygon_count, offset = 1, 0
+    elif geometry_type == WKB_MULTIPOLYGON:
+        (polygon_count,) = WKB_COUNT.unpack_from(wkb, WKB_HEADER.size)
+        offset = WKB_HEADER.size + WKB_COUNT.size
+    else:
+        raise ValueError(f"Unsupported polygon WKB type {geometry_type}")
+    rings = []
+    for _ in range(polygon_count):
+        (ring_count,) = WKB_COUNT.unpack_from(wkb, offset + WKB_HEADER.size)
+        offset += WKB_HEADER.size + WKB_COUNT.size
+        for _ in range(ring_count):
+            (vertex_count,) = WKB_COUNT.unpack_from(wkb, offset)
+            offset += WKB_COUNT.size
+            rings.append(
+                np.frombuffer(wkb, "<f8", 2 * vertex_count, offset).reshape(-1, 2)
+            )
+            offset += 16 * vertex_count
+    return rings
+
+
+def simplify_geometry(geometry: QgsGeometry, tolerance: float) -> QgsGeometry:
+    """
+    Removes vertices closer than the tolerance to the simplified outline and
+    rounds the coordinates to a grid of a tenth of the tolerance. The
+    simplification preserves topology, so rings stay valid and holes are kept.
+
+    Rounding may still make narrow parts of a ring touch or cross, in which
+    case the polygon is made valid again. If that splits the polygon, the
+    simplified polygon is kept without rounding.
+    """
+    simplified = geometry.simplify(tolerance)
+    if simplified.isEmpty():
+        # tiny isochrones may collapse completely, better keep them as they were
+        return geometry
+    grid = tolerance / 10
+    snapped = simplified.snappedToGrid(grid, grid)
+    if snapped.isEmpty():
+        return simplified
+    if snapped.isGeosValid():
+        return snapped
+    valid = snapped.makeValid()
+    if QgsWkbTypes.flatType(valid.wkbType()) == QgsWkbTypes.Polygon:
+        return valid
+    return simplified
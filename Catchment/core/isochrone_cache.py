@@ -0,0 +1,159 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Union
+
+from ..qgis_plugin_tools.tools.resources import plugin_name, plugin_path
+
+TASK_LOGGER = logging.getLogger(f"{plugin_name()}_task")
+
+DEFAULT_CACHE_SIZE_MB = 200
+# seconds to wait for other processes sharing the cache to finish writing
+CACHE_TIMEOUT = 30
+# 6 decimals is roughly 10 cm, well below the accuracy of any school layer
+COORDINATE_PRECISION = 6
+# request parameters that affect the returned isochrones
+CACHE_KEY_PARAMS = [
+    "profile",
+    "time_limit",
+    "distance_limit",
+    "buckets",
+    "reverse_flow",
+]
+
+
+def cache_path() -> str:
+    """Default cache location, next to the plugin log files"""
+    return plugin_path("logs", "isochrone_cache.sqlite")
+
+
+class IsochroneCache:
+    """
+    Persistent on-disk cache for isochrone responses.
+
+    Responses are stored compressed in SQLite and the least recently used
+    responses are evicted once the cache grows over its maximum size. The cache
+    may be shared between threads and processes.
+
+    Errors reading or writing an open cache are logged, and the response is
+    then fetched or left uncached, since the cache is never needed for a run.
+    """
+
+    def __init__(
+        self, path: str = "", max_size_mb: int = DEFAULT_CACHE_SIZE_MB
+    ) -> None:
+        self.path = path or cache_path()
+        self.max_size = max_size_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connection = sqlite3.connect(
+            self.path, timeout=CACHE_TIMEOUT, check_same_thread=False
+        )
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, "
+                "response BLOB NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "last_used REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_used "
+                "ON responses (last_used)"
+            )
+        self._size: int = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    @staticmethod
+    def key(url: str, params: Dict[str, Union[str, int, bool]]) -> str:
+        """Cache key for a request. The API key is deliberately left out."""
+        lat, lon = (float(coord) for coord in str(params["point"]).split(","))
+        key_params = {name: params.get(name) for name in CACHE_KEY_PARAMS}
+        key_params["url"] = url
+        key_params["point"] = [
+            round(lat, COORDINATE_PRECISION),
+            round(lon, COORDINATE_PRECISION),
+        ]
+        return hashlib.sha1(
+            json.dumps(key_params, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, url: str, params: Dict[str, Union[str, int, bool]]) -> Optional[str]:
+        key = self.key(url, params)
+        with self._lock:
+            try:
+                row = self._connection.execute(
+                    "SELECT response FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    with self._connection:
+                        self._connection.execute(
+                            "UPDATE responses SET last_used = ? WHERE key = ?",
+                            (time.time(), key),
+                        )
+            except sqlite3.Error as e:
+                TASK_LOGGER.warning(f"Could not read isochrone cache: {e}")
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def put(
+        self, url: str, params: Dict[str, Union[str, int, bool]], response: str
+    ) -> None:
+        key = self.key(url, params)
+        compressed = zlib.compress(response.encode("utf-8"))
+        with self._lock:
+            try:
+                old = self._connection.execute(
+                    "SELECT size FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                with self._connection:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                        (key, compressed, len(compressed), time.time()),
+                    )
+                self._size += len(compressed) - (old[0] if old else 0)
+                if self._size > self.max_size:
+                    self.__evict()
+            except sqlite3.Error as e:
+                TASK_LOGGER.warning(f"Could not write isochrone cache: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            with self._connection:
+                self._connection.execute("DELETE FROM responses")
+            self._connection.execute("VACUUM")
+            self._size = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def __evict(self) -> None:
+        """Removes least recently used responses until the cache fits its size"""
+        # leave some room so that we don't have to evict on every insert
+        target = int(0.9 * self.max_size)
+        keys = []
+        remaining = self._size
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM responses ORDER BY last_used"
+        ):
+            if remaining <= target:
+                break
+            keys.append((key,))
+            remaining -= size
+        with self._connection:
+            self._connection.executemany("DELETE FROM responses WHERE key = ?", keys)
+        self._size = remaining
+        TASK_LOGGER.debug(f"Evicted {len(keys)} isochrones from cache")
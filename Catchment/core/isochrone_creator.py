@@ -1,38 +1,121 @@
+import cProfile
 import json
 import logging
 import os
-from dataclasses import dataclass
-from typing import Dict, List, Optional
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from functools import reduce
+from math import cos, floor, gcd, hypot, isclose, radians
+from typing import Dict, List, Optional, Set, Tuple, Union
 
-import qgis.processing
 from PyQt5.QtCore import QVariant
 from PyQt5.QtNetwork import QNetworkReply
 from qgis.core import (
     QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
     QgsCoordinateTransformContext,
+    QgsCsException,
     QgsFeature,
+    QgsFeatureRequest,
+    QgsFeatureSink,
+    QgsFeatureSource,
+    QgsFeedback,
     QgsField,
     QgsFields,
-    QgsGeometry,
     QgsLayerTreeLayer,
     QgsPointXY,
-    QgsProcessing,
     QgsProject,
+    QgsRasterLayer,
     QgsTask,
     QgsVectorFileWriter,
     QgsVectorLayer,
+    QgsVectorLayerFeatureSource,
+    QgsWkbTypes,
 )
 
-from ..definitions.constants import Profile, Unit
-from ..qgis_plugin_tools.tools.exceptions import QgsPluginNetworkException
-from ..qgis_plugin_tools.tools.network import fetch
-from ..qgis_plugin_tools.tools.resources import plugin_name
+from ..definitions.constants import Engine, Profile, Unit
+from ..qgis_plugin_tools.tools.exceptions import (
+    QgsPluginException,
+    QgsPluginNetworkException,
+)
+from ..qgis_plugin_tools.tools.resources import plugin_name, plugin_path
+from .checkpoint import (
+    FinishedPoint,
+    RunCheckpoint,
+    attribute_hash,
+    feature_ids_hash,
+    geometry_hash,
+)
+from .coverage import create_coverage_layer
+from .geometry import geometry_from_geojson, simplify_geometry
+from .isochrone_cache import DEFAULT_CACHE_SIZE_MB, IsochroneCache
+from .metrics import RunMetrics
+from .network import (
+    RETRY_BASE_DELAY,
+    CircuitBreaker,
+    HttpSession,
+    RetryPolicy,
+    fetch,
+    is_retryable,
+)
+from .run_history import RunHistory
+from .spt_contouring import (
+    SPT_COLUMNS,
+    SPT_LIMIT_MARGIN,
+    ShortestPathTree,
+    SptContouringException,
+)
+from .zonal_statistics import PopulationRaster, ZonalStatisticsException
 
 # from qgis.PyQt.QtCore import QCoreApplication
 
 MAIN_LOGGER = logging.getLogger(plugin_name())
 TASK_LOGGER = logging.getLogger(f"{plugin_name()}_task")
 
+MAX_CONCURRENT_REQUESTS = 32
+# number of features committed to the result layer at once
+FEATURE_BATCH_SIZE = 1000
+METERS_PER_DEGREE = 111320
+# Graphhopper does not allow more buckets in a single request
+MAX_BUCKETS = 20
+
+# points are read from a Processing feature source or a snapshot of the layer
+PointSource = Union[QgsFeatureSource, QgsVectorLayerFeatureSource]
+
+
+class InvalidDistancesException(QgsPluginException):
+    pass
+
+
+def meters_between(start: Tuple[float, float], end: Tuple[float, float]) -> float:
+    """Approximate distance between nearby WGS 84 coordinates in meters"""
+    latitude = radians((start[1] + end[1]) / 2)
+    return METERS_PER_DEGREE * hypot(
+        (end[0] - start[0]) * cos(latitude), end[1] - start[1]
+    )
+
+
+def parse_distances(text: str) -> List[int]:
+    """Parses a comma or space separated list of distances, e.g. 15, 30, 45"""
+    distances = []
+    for value in re.split(r"[,;\s]+", text.strip()):
+        if not value:
+            continue
+        try:
+            distance = int(value)
+        except ValueError:
+            raise InvalidDistancesException(f"Invalid distance: {value}")
+        if distance <= 0:
+            raise InvalidDistancesException("Distances must be positive")
+        distances.append(distance)
+    return distances
+
 
 @dataclass
 class IsochroneOpts:
@@ -43,83 +126,212 @@ class IsochroneOpts:
     distance: Optional[int] = None
     unit: Optional[Unit] = None
     buckets: int = 1
+    # if distances are given, distance and buckets are ignored
+    distances: List[int] = field(default_factory=list)
     profile: Optional[Profile] = None
     write_to_directory: bool = False
     directory: str = ""
+    # a complete earlier run to the same file is updated with the changed points
+    update_existing: bool = False
+    max_concurrent_requests: int = 1
+    # start points closer than this many meters to the first point of a
+    # request share it
+    snap_tolerance: float = 0.0
+    # isochrones are simplified and quantised with this tolerance in meters
+    simplify_tolerance: float = 0.0
+    use_cache: bool = False
+    cache_size_mb: int = DEFAULT_CACHE_SIZE_MB
+    # transient network errors are retried this many times for each request
+    max_retries: int = 3
+    # some proxies do not handle HTTP/2, requests fall back to HTTP/1.1 anyway
+    http2: bool = True
+    # timings of the run are written to a file, optionally with a profile
+    write_metrics: bool = False
+    profile_run: bool = False
+    # the isochrones of each distance are also merged to a coverage layer
+    coverage: bool = False
+    # population within each isochrone is summed from this raster if set
+    population_layer: Optional[QgsRasterLayer] = None
+    # Isochrones may also be contoured locally from the shortest path tree of
+    # each point, which supports any number of distances from a single request.
+    engine: Engine = Engine.ISOCHRONE
+    # only these features are processed if set, used by worker processes
+    feature_ids: Optional[List[int]] = None
 
     def check_if_opts_set(self) -> bool:
-        if None in [self.layer, self.distance, self.unit, self.profile]:
+        if None in [self.layer, self.unit, self.profile]:
+            return False
+        if self.distance is None and not self.distances:
             return False
         if self.url == "":
             return False
+        try:
+            self.get_request_limit_and_buckets()
+        except InvalidDistancesException:
+            return False
         return True
 
+    def get_distances(self) -> List[float]:
+        """Returns all requested isochrone distances in ascending order"""
+        if self.distances:
+            return sorted(set(self.distances))
+        return [
+            (bucket + 1) * self.distance / self.buckets  # type: ignore
+            for bucket in range(self.buckets)
+        ]
+
+    def get_request_limit_and_buckets(self) -> Tuple[int, int]:
+        """
+        Returns the limit and the number of buckets needed to get all the
+        requested distances from a single request.
+
+        The buckets are exact divisions of the limit, so all the requested
+        distances must be multiples of the bucket size. Contoured shortest path
+        trees are not limited to any number of buckets.
+        """
+        if not self.distances:
+            return self.distance, self.buckets  # type: ignore
+        distances = self.get_distances()
+        limit = int(distances[-1])
+        buckets = limit // reduce(gcd, (int(distance) for distance in distances))
+        if buckets > MAX_BUCKETS and self.engine == Engine.ISOCHRONE:
+            raise InvalidDistancesException(
+                f"Distances need {buckets} divisions of {limit}, "
+                f"at most {MAX_BUCKETS} are supported"
+            )
+        return limit, buckets
+
+    def get_distances_string(self) -> str:
+        if self.distances:
+            return ", ".join(str(distance) for distance in self.get_distances())
+        return str(self.distance)
+
+    def get_isochrone_url(self) -> str:
+        url = self.url
+        if not url.startswith("http://") and not url.startswith("https://"):
+            # our instance does not support https out of the box
+            url = "http://" + url
+        if not url[-1] == "/":
+            url += "/"
+        return url + self.engine.value
+
+    def get_layer_name(self) -> str:
+        """Name of the resulting isochrone layer"""
+        profile_string = (
+            f" by {self.profile.value}" if self.unit == Unit.MINUTES else ""  # type: ignore  # noqa
+        )
+        # isochrones are always fetched with reverse flow, i.e. to the points
+        selected_string = "selected " if self.selected_only else ""
+        return f"{self.get_distances_string()} {self.unit.value} to {selected_string}{self.layer.name()}{profile_string}"  # type: ignore  # noqa
+
 
 class IsochroneCreator(QgsTask):
-    def __init__(self, opts: IsochroneOpts) -> None:
+    def __init__(
+        self,
+        opts: IsochroneOpts,
+        request_slots: Optional[threading.Semaphore] = None,
+        cache: Optional[IsochroneCache] = None,
+        feedback: Optional[Union[QgsFeedback, QgsTask]] = None,
+        source: Optional[QgsFeatureSource] = None,
+    ) -> None:
+        """
+        Runs sharing a budget of concurrent requests acquire a slot from
+        request_slots for each request. A cache shared with other runs may be
+        given, which is used instead of opening the cache, if caching is on.
+
+        Runs outside the task manager, e.g. in a Processing algorithm, may be
+        cancelled through the given feedback instead. Jobs of a queue are
+        cancelled with the queue, which is given as the feedback.
+
+        Processing gives the feature source of the points, which already
+        contains only the selected features if so chosen. Otherwise the points
+        are read from a snapshot of the layer. Either way, the layer is only
+        used in the thread the creator is created in.
+        """
         self.opts = opts
+        self.feedback = feedback
         self.result_layer: Optional[QgsVectorLayer] = None
-        self.points = []
+        self.coverage_layer: Optional[QgsVectorLayer] = None
+        self.cache: Optional[IsochroneCache] = None
+        self.shared_cache = cache
+        self.request_slots = request_slots or nullcontext()
+        self.checkpoint: Optional[RunCheckpoint] = None
+        self.transform: Optional[QgsCoordinateTransform] = None
+        self.metrics = RunMetrics()
+        # number of features isochrones are requested for, known once run starts
+        self.point_count = 0
+        self.source: Optional[PointSource] = None
+        self.point_fields = QgsFields()
+        self.selected_ids: Optional[Set[int]] = None
+        # saved with the finished points, when writing to a geopackage
+        self.geometry_hashes: Dict[int, str] = {}
+        self.population: Optional[PopulationRaster] = None
+        self.retry_policy = RetryPolicy(
+            max_retries=self.opts.max_retries, base_delay=RETRY_BASE_DELAY
+        )
+        self.circuit_breaker = CircuitBreaker()
+        self.session = HttpSession(http2=self.opts.http2)
         # no type checking needed, since we check if options are set
         if self.opts.check_if_opts_set():
-            self.base_url = self.opts.url
-            if not self.base_url.startswith("http://") and not self.base_url.startswith(
-                "https://"
-            ):
-                # our instance does not support https out of the box
-                self.base_url = "http://" + self.base_url
-            if not self.base_url[-1] == "/":
-                self.base_url += "/"
-            self.base_url += "isochrone"
+            self.base_url = self.opts.get_isochrone_url()
+            # all distances are fetched with a single request
+            self.limit, self.buckets = self.opts.get_request_limit_and_buckets()
             self.params = {
                 "profile": self.opts.profile.value,  # type: ignore
-                "buckets": self.opts.buckets,
                 "reverse_flow": True,
             }
+            request_limit: float = self.limit
+            if self.opts.engine == Engine.SPT:
+                # the buckets are contoured locally from the tree
+                self.params["columns"] = SPT_COLUMNS
+                request_limit = self.limit * SPT_LIMIT_MARGIN
+            else:
+                self.params["buckets"] = self.buckets
             if self.opts.api_key:
                 self.params["key"] = self.opts.api_key
             if self.opts.unit == Unit.METERS:
-                self.params["distance_limit"] = self.opts.distance
+                self.params["distance_limit"] = round(request_limit)
                 self.params["time_limit"] = -1
             else:
-                self.params["time_limit"] = 60 * self.opts.distance  # type: ignore
+                self.params["time_limit"] = round(60 * request_limit)
 
-            # reproject layer if needed
             layer: QgsVectorLayer = self.opts.layer
+            crs = source.sourceCrs() if source else layer.crs()
             wgs84 = QgsCoordinateReferenceSystem("EPSG:4326")
-            if layer.crs() != wgs84:
-                selected_ids = [
-                    feature.attribute("fid") for feature in layer.getSelectedFeatures()
-                ]
+            # only the requested points are transformed, when they are grouped
+            if crs != wgs84:
                 MAIN_LOGGER.info(
-                    f"Layer in {layer.crs().authid()}, reprojecting to WGS 84 first."
+                    f"Layer in {crs.authid()}, transforming points to WGS 84."
                 )
-                alg_params = {
-                    "INPUT": layer,
-                    "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-                    "TARGET_CRS": wgs84,
-                }
-                layer = qgis.processing.run("native:reprojectlayer", alg_params)[
-                    "OUTPUT"
-                ]
-                layer.select(selected_ids)
-            # QgsVectorLayer from main thread may not be used in other threads?
-            # How about the QgsFeatures we list here, seems to work fine?
-            self.points = (
-                list(layer.getSelectedFeatures())
-                if self.opts.selected_only
-                else list(layer.getFeatures())
-            )
-        profile_string = (
-            f" by {self.opts.profile.value}" if self.opts.unit == Unit.MINUTES else ""  # type: ignore  # noqa
-        )
-        direction_string = "to" if self.params["reverse_flow"] else "from"
-        selected_string = "selected " if self.opts.selected_only else ""
-        self.name = f"{self.opts.distance} {self.opts.unit.value} {direction_string} {selected_string}{self.opts.layer.name()}{profile_string}"  # type: ignore  # noqa
+                self.transform = QgsCoordinateTransform(
+                    crs, wgs84, QgsProject.instance()
+                )
+            self.point_fields = QgsFields(source.fields() if source else layer.fields())
+            if source:
+                self.source = source
+            else:
+                # The layer may not be used in other threads, but a snapshot of
+                # its features can. The features are only read when the task is
+                # run.
+                self.source = QgsVectorLayerFeatureSource(layer)
+                if self.opts.selected_only:
+                    self.selected_ids = set(layer.selectedFeatureIds())
+            if self.opts.population_layer:
+                self.population = PopulationRaster(self.opts.population_layer)
+        self.name = self.opts.get_layer_name()
 
         super().__init__(description=f"Fetching GraphHopper isochrones: {self.name}")
         self.setProgress(0.0)
 
+    def isCanceled(self) -> bool:  # noqa N802
+        """
+        The feedback is polled, since its canceled signal cannot reach a run
+        that is blocking the thread it was started in, and tasks have none.
+        """
+        return super().isCanceled() or bool(
+            self.feedback and self.feedback.isCanceled()
+        )
+
     def run(self) -> bool:
         """
         This method MUST return True or False.
@@ -137,10 +349,13 @@ class IsochroneCreator(QgsTask):
                 f"Network request failed, aborting run. Error: {e.message}"  # noqa
             )
             return False
+        except SptContouringException as e:
+            TASK_LOGGER.error(f"Could not contour isochrones: {e.message}")
+            return False
         count = self.result_layer.featureCount()
         TASK_LOGGER.info(f"Total of {count} isochrones generated.")
         TASK_LOGGER.info(
-            f"{self.opts.buckets*len(self.points)-count} isochrones could not be generated."  # noqa
+            f"{len(self.opts.get_distances())*self.point_count-count} isochrones could not be generated."  # noqa
         )
         # don't know if this is really needed or done automatically?
         # finished will run in the main thread anyway
@@ -164,7 +379,7 @@ class IsochroneCreator(QgsTask):
                         "details": "Please check your Graphhopper url and your Internet connection."  # noqa
                     },
                 )
-            elif len(self.points):
+            elif self.point_count:
                 MAIN_LOGGER.error(
                     "No results, no roads found close to any of the points",
                     extra={
@@ -182,125 +397,700 @@ class IsochroneCreator(QgsTask):
             QgsProject.instance().addMapLayer(self.result_layer, False)
             root = QgsProject.instance().layerTreeRoot()
             root.insertChildNode(1, QgsLayerTreeLayer(self.result_layer))
+            if self.coverage_layer:
+                QgsProject.instance().addMapLayer(self.coverage_layer, False)
+                root.insertChildNode(1, QgsLayerTreeLayer(self.coverage_layer))
 
-    def __fetch_bucketed_isochrones(self, point: QgsFeature) -> List[Dict]:
-        # the API may return multiple isochrones for a single point (buckets)
-        geometry = point.geometry()
-        isochrones = []
-        # the geometry may be multipoint, handle each point
-        for point in geometry.parts():
-            isochrone_params = self.params
-            isochrone_params["point"] = f"{point.y()},{point.x()}"
+    def __sleep(self, seconds: float) -> None:
+        """Sleeps, unless the task is cancelled"""
+        end = time.monotonic() + seconds
+        while not self.isCanceled() and time.monotonic() < end:
+            time.sleep(min(0.1, end - time.monotonic()))
+
+    def __fetch_with_retries(self, point: QgsPointXY) -> Optional[List[Dict]]:
+        """
+        Fetches the isochrones, retrying transient network errors with backoff.
+        Returns None if the request still fails, so that it may be retried at
+        the end of the run. Other network errors are raised.
+        """
+        for attempt in range(self.retry_policy.max_retries + 1):
+            pause = self.circuit_breaker.wait_time()
+            if pause:
+                self.__sleep(pause)
+            if self.isCanceled():
+                return None
             try:
-                isochrone_json = fetch(self.base_url, params=isochrone_params)
+                with self.request_slots:
+                    isochrones = self.__fetch_bucketed_isochrones(point)
             except QgsPluginNetworkException as e:
-                # In case we have a bad request, it is usually due to missing roads.
-                # Inform the user and continue.
-                if e.error == QNetworkReply.ProtocolInvalidOperationError:
-                    error_message = e.message  # noqa
-                    try:
-                        # Graphhopper will return json error message. However,
-                        # error content will be empty in older QGIS versions:
-                        # https://github.com/qgis/QGIS/issues/42442
-                        # In this case, the error message will be the default string.
-                        error_message = json.loads(error_message)["message"]
-                    except json.decoder.JSONDecodeError:
-                        pass
+                if not is_retryable(e):
+                    raise e
+                self.metrics.record_failure()
+                if self.circuit_breaker.record_failure():
                     TASK_LOGGER.warning(
-                        f"Request failed for point {point.y()},{point.x()}: {error_message}. "  # noqa
+                        f"{self.circuit_breaker.consecutive_failures} requests failed in a row, pausing requests for {self.circuit_breaker.cooldown:.0f} s."  # noqa
                     )
-                    return []
-                # All other network exceptions should be raised
-                raise e
-            isochrones.extend(json.loads(isochrone_json)["polygons"])
-        return isochrones
-
-    def __add_isochrones_to_layer(self, layer: QgsVectorLayer) -> None:
-        TASK_LOGGER.info("Starting isochrone fetch...")
-        for idx, point in enumerate(self.points):
-            bucketed_isochrones = self.__fetch_bucketed_isochrones(point)
-            for polygon_in_bucket in bucketed_isochrones:
-                feature = QgsFeature(layer.fields())
-                # save the original feature id separately
-                # setAttributes cannot be used, will destroy any extra fields!!
-                for index, attribute in enumerate(point.attributes()):
-                    feature.setAttribute(index, attribute)
-                # set the added distance field separately
-                bucket = polygon_in_bucket["properties"]["bucket"]
-                distance = (bucket + 1) * (
-                    self.opts.distance / self.opts.buckets  # type: ignore
-                )
-                feature.setAttribute("isochrone_distance", distance)
-
-                feature.setGeometry(
-                    QgsGeometry.fromPolygonXY(
-                        [
-                            [
-                                QgsPointXY(pt[0], pt[1])
-                                for pt in polygon_in_bucket["geometry"]["coordinates"][
-                                    0
-                                ]
-                            ]
-                        ]
+                if attempt == self.retry_policy.max_retries:
+                    TASK_LOGGER.warning(
+                        f"Request failed for point {point.y()},{point.x()}: {e.message}. Retrying at the end of the run."  # noqa
                     )
+                    return None
+                delay = self.retry_policy.delay(
+                    attempt, getattr(e, "retry_after", None)
                 )
-                layer.dataProvider().addFeature(feature)
-            if idx and idx % 10 == 0:
                 TASK_LOGGER.info(
-                    f"{idx} out of {len(self.points)} objects fetched"  # type: ignore  # noqa
+                    f"Request failed for point {point.y()},{point.x()}: {e.message}. Retrying in {delay:.1f} s."  # noqa
                 )
-            if self.isCanceled():
+                self.__sleep(delay)
+            else:
+                self.circuit_breaker.record_success()
+                return isochrones
+        return None
+
+    def __fetch_bucketed_isochrones(self, point: QgsPointXY) -> List[Dict]:
+        # the API may return multiple isochrones for a single point (buckets)
+        # requests may run in parallel threads, so each needs its own params
+        isochrone_params = dict(self.params)
+        isochrone_params["point"] = f"{point.y()},{point.x()}"
+        if self.cache:
+            with self.metrics.phase("cache"):
+                isochrone_json = self.cache.get(self.base_url, isochrone_params)
+            self.metrics.record_cache_lookup(isochrone_json is not None)
+            if isochrone_json is not None:
+                return self.__parse_polygons(isochrone_json)
+        start = time.perf_counter()
+        try:
+            with self.metrics.phase("http"):
+                isochrone_json = fetch(
+                    self.base_url, params=isochrone_params, session=self.session
+                )
+        except QgsPluginNetworkException as e:
+            # In case we have a bad request, it is usually due to missing roads.
+            # Inform the user and continue.
+            if e.error == QNetworkReply.ProtocolInvalidOperationError:
+                error_message = e.message  # noqa
+                try:
+                    # Graphhopper will return json error message. However,
+                    # error content will be empty in older QGIS versions:
+                    # https://github.com/qgis/QGIS/issues/42442
+                    # In this case, the error message will be the default string.
+                    error_message = json.loads(error_message)["message"]
+                except json.decoder.JSONDecodeError:
+                    pass
                 TASK_LOGGER.warning(
-                    f"Task cancelled, only {idx} out of {len(self.points)} isochrones calculated"  # type: ignore  # noqa
+                    f"Request failed for point {point.y()},{point.x()}: {error_message}. "  # noqa
+                )
+                return []
+            # All other network exceptions should be raised
+            raise e
+        self.metrics.record_request(
+            time.perf_counter() - start, len(isochrone_json.encode("utf-8"))
+        )
+        if self.cache:
+            with self.metrics.phase("cache"):
+                self.cache.put(self.base_url, isochrone_params, isochrone_json)
+        return self.__parse_polygons(isochrone_json)
+
+    def __parse_polygons(self, isochrone_json: str) -> List[Dict]:
+        if self.opts.engine == Engine.SPT:
+            with self.metrics.phase("contour"):
+                return self.__contour_polygons(isochrone_json)
+        with self.metrics.phase("json"):
+            return json.loads(isochrone_json)["polygons"]
+
+    def __contour_polygons(self, spt_csv: str) -> List[Dict]:
+        """
+        Contours the requested distances from the shortest path tree, in the
+        same format as the polygons of the isochrone endpoint
+        """
+        if self.opts.unit == Unit.METERS:
+            tree = ShortestPathTree.from_csv(spt_csv, "distance")
+        else:
+            # milliseconds to minutes
+            tree = ShortestPathTree.from_csv(spt_csv, "time", 1 / 60000)
+        bucket_size = self.limit / self.buckets
+        polygons = []
+        for distance in self.opts.get_distances():
+            rings = tree.contour_rings(distance)
+            if rings:
+                polygons.append(
+                    {
+                        "type": "Feature",
+                        "geometry": {"type": "Polygon", "coordinates": rings},
+                        "properties": {"bucket": round(distance / bucket_size) - 1},
+                    }
                 )
+        return polygons
+
+    def __group_key(
+        self,
+        point: QgsPointXY,
+        cells: Dict[Tuple[int, int], List[Tuple[float, float]]],
+    ) -> Tuple[float, float]:
+        """
+        Returns the start point of the request the point shares: the nearest
+        earlier start point closer than the snapping tolerance, or the point
+        itself, which then starts a new request.
+        """
+        key = (point.x(), point.y())
+        if self.opts.snap_tolerance <= 0:
+            return key
+        # The start points are kept in cells at least as large as the
+        # tolerance, so any point close enough is in a neighbouring cell.
+        lat_step = self.opts.snap_tolerance / METERS_PER_DEGREE
+        row = floor(point.y() / lat_step)
+        nearest: Optional[Tuple[float, float]] = None
+        nearest_distance = self.opts.snap_tolerance
+        for cell_row in range(row - 1, row + 2):
+            column = floor(point.x() / self.__lon_step(cell_row, lat_step))
+            for cell_column in range(column - 1, column + 2):
+                for start in cells.get((cell_row, cell_column), []):
+                    distance = meters_between(key, start)
+                    if distance < nearest_distance:
+                        nearest, nearest_distance = start, distance
+        if nearest is not None:
+            return nearest
+        column = floor(point.x() / self.__lon_step(row, lat_step))
+        cells.setdefault((row, column), []).append(key)
+        return key
+
+    @staticmethod
+    def __lon_step(row: int, lat_step: float) -> float:
+        """
+        Width of the cells in the row. Degrees of longitude get shorter towards
+        the poles, so the width is taken beyond the row, where it is shortest.
+        """
+        latitude = min((abs(row) + 2) * lat_step, 89.0)
+        return lat_step / cos(radians(latitude))
+
+    def __requested_ids(self) -> Optional[Set[int]]:
+        """Ids of the features to be processed, or None for all features"""
+        ids = self.selected_ids
+        if self.opts.feature_ids is not None:
+            ids = (
+                set(self.opts.feature_ids)
+                if ids is None
+                else ids.intersection(self.opts.feature_ids)
+            )
+        return ids
+
+    def __point_request(self, attributes: bool = False) -> QgsFeatureRequest:
+        """Request for the geometries of all the features to be processed"""
+        request = QgsFeatureRequest()
+        if not attributes:
+            request.setNoAttributes()
+        ids = self.__requested_ids()
+        if ids is not None:
+            request.setFilterFids(list(ids))
+        return request
+
+    def __group_start_points(
+        self, skipped_ids: Set[int]
+    ) -> List[Tuple[QgsPointXY, List[int]]]:
+        """
+        Groups identical start points, and points closer than the snapping
+        tolerance to the first point of a group, so that only one request is
+        needed for each group.
+
+        Only the geometries are read here, the attributes are read once the
+        isochrones of each group arrive. The first point of each group is used
+        in the request.
+        """
+        groups: Dict[Tuple[float, float], Tuple[QgsPointXY, List[int]]] = {}
+        cells: Dict[Tuple[int, int], List[Tuple[float, float]]] = {}
+        part_count = 0
+        for feature in self.source.getFeatures(self.__point_request()):  # type: ignore
+            if self.isCanceled():
                 break
-            self.setProgress(100 * (idx / len(self.points)))
+            self.point_count += 1
+            if feature.id() in skipped_ids:
+                continue
+            geometry = feature.geometry()
+            if self.checkpoint:
+                self.geometry_hashes[feature.id()] = geometry_hash(
+                    bytes(geometry.asWkb())
+                )
+            # the geometry may be multipoint, handle each point
+            for part in geometry.parts():
+                part_count += 1
+                point = QgsPointXY(part.x(), part.y())
+                if self.transform:
+                    try:
+                        point = self.transform.transform(point)
+                    except QgsCsException:
+                        TASK_LOGGER.warning(
+                            f"Could not transform point {point.x()},{point.y()} to WGS 84, skipping."  # noqa
+                        )
+                        continue
+                _, ids = groups.setdefault(self.__group_key(point, cells), (point, []))
+                # several parts of a multipoint may end up in the same group
+                if not ids or ids[-1] != feature.id():
+                    ids.append(feature.id())
+        if part_count > len(groups):
+            TASK_LOGGER.info(
+                f"{part_count} start points merged to {len(groups)} requests, "
+                f"saving {part_count - len(groups)} requests."
+            )
+        return list(groups.values())
 
-    def create_isochrone_layer(self) -> QgsVectorLayer:
-        """Creates a polygon QgsVectorLayer containing isochrones for points"""
-        isochrone_layer = QgsVectorLayer(
-            "Polygon?crs=epsg:4326&index=yes", self.name, "memory"
+    def __read_attributes(self, ids: Set[int]) -> Dict[int, QgsFeature]:
+        """Reads the attributes of the given features, without geometries"""
+        request = (
+            QgsFeatureRequest()
+            .setFilterFids(list(ids))
+            .setFlags(QgsFeatureRequest.NoGeometry)
+        )
+        with self.metrics.phase("read attributes"):
+            return {
+                feature.id(): feature
+                for feature in self.source.getFeatures(request)  # type: ignore
+            }
+
+    def __add_isochrones_to_sink(self, sink: QgsFeatureSink, fields: QgsFields) -> None:
+        TASK_LOGGER.info("Starting isochrone fetch...")
+        max_workers = min(
+            max(self.opts.max_concurrent_requests, 1), MAX_CONCURRENT_REQUESTS
+        )
+        already_finished = self.checkpoint.finished_ids() if self.checkpoint else set()
+        if already_finished:
+            TASK_LOGGER.info(
+                f"Resuming previous run, {len(already_finished)} points already finished"  # noqa
+            )
+        with self.metrics.phase("read points"):
+            groups = self.__group_start_points(already_finished)
+        # a point is finished once all the requests for its parts are done
+        remaining_requests = Counter(fid for _, ids in groups for fid in ids)
+        requests = iter(groups)
+        # requests that fail even after retries are retried once more in the end
+        retry_queue: List[Tuple[QgsPointXY, List[int]]] = []
+        retrying = False
+        failed = 0
+        finished = 0
+        features: List[QgsFeature] = []
+        # the point each feature was created for
+        feature_points: List[int] = []
+        finished_points: List[FinishedPoint] = []
+        # Keep at most max_workers requests in flight. Results are added to the
+        # layer in this thread as soon as each request completes, in any order.
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight: Dict[Future, Tuple[QgsPointXY, List[int]]] = {}
+            while True:
+                while len(in_flight) < max_workers and not self.isCanceled():
+                    request = next(requests, None)
+                    if request is None:
+                        break
+                    future = executor.submit(self.__fetch_with_retries, request[0])
+                    in_flight[future] = request
+                if not in_flight:
+                    if retry_queue and not retrying and not self.isCanceled():
+                        TASK_LOGGER.info(
+                            f"Retrying {len(retry_queue)} failed requests..."
+                        )
+                        requests = iter(retry_queue)
+                        retrying = True
+                        continue
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                results = {future: in_flight.pop(future) for future in done}
+                # attributes are only read for the groups that have arrived
+                points = self.__read_attributes(
+                    {
+                        fid
+                        for future, (_, ids) in results.items()
+                        if future.result() is not None
+                        for fid in ids
+                    }
+                )
+                for future, request in results.items():
+                    bucketed_isochrones = future.result()
+                    if bucketed_isochrones is None:
+                        if retrying:
+                            failed += 1
+                        else:
+                            retry_queue.append(request)
+                        continue
+                    # each feature at the start point gets its own isochrones
+                    for fid in request[1]:
+                        point_features = self.__create_point_features(
+                            fields, points[fid], bucketed_isochrones
+                        )
+                        features.extend(point_features)
+                        feature_points.extend([fid] * len(point_features))
+                        remaining_requests[fid] -= 1
+                        if not remaining_requests[fid]:
+                            finished_points.append(self.__finished_point(points[fid]))
+                    if len(features) >= FEATURE_BATCH_SIZE:
+                        self.__write_features(
+                            sink, features, feature_points, finished_points
+                        )
+                        features = []
+                        feature_points = []
+                        finished_points = []
+                    finished += 1
+                    if finished % 10 == 0:
+                        TASK_LOGGER.info(
+                            f"{finished} out of {len(groups)} requests fetched"
+                        )
+                    self.setProgress(100 * (finished / len(groups)))
+        self.__write_features(sink, features, feature_points, finished_points)
+        if self.isCanceled():
+            TASK_LOGGER.warning(
+                f"Task cancelled, only {finished} out of {len(groups)} requests fetched"  # noqa
+            )
+        elif failed:
+            TASK_LOGGER.warning(
+                f"{failed} requests failed even after retrying. Run again to retry them."  # noqa
+            )
+        elif self.checkpoint:
+            self.checkpoint.mark_complete()
+
+    def __finished_point(self, point: QgsFeature) -> FinishedPoint:
+        """Point id with the hashes used to find changed points in later runs"""
+        if not self.checkpoint:
+            return point.id(), None, None
+        return (
+            point.id(),
+            self.geometry_hashes.pop(point.id(), None),
+            attribute_hash(point.attributes()),
+        )
+
+    def __write_features(
+        self,
+        sink: QgsFeatureSink,
+        features: List[QgsFeature],
+        feature_points: List[int],
+        finished_points: List[FinishedPoint],
+    ) -> None:
+        with self.metrics.phase("write"):
+            # the added features get the ids they were saved with
+            _, features = sink.addFeatures(features)
+            # Points are marked finished only after their isochrones have been
+            # saved. Should the run crash in between, the isochrones are deleted
+            # and the points fetched again when the run is resumed.
+            if self.checkpoint:
+                self.checkpoint.mark_finished(
+                    finished_points,
+                    zip((feature.id() for feature in features), feature_points),
+                )
+        self.metrics.features_written += len(features)
+
+    def __delete_unfinished(self, isochrone_layer: QgsVectorLayer) -> None:
+        """
+        Deletes the isochrones of points that were not finished, so that they
+        are not saved twice when the points are fetched again.
+        """
+        checkpoint: RunCheckpoint = self.checkpoint  # type: ignore
+        unfinished = checkpoint.forget_unfinished(isochrone_layer.allFeatureIds())
+        if unfinished:
+            isochrone_layer.dataProvider().deleteFeatures(unfinished)
+            TASK_LOGGER.info(
+                f"Deleted {len(unfinished)} isochrones of unfinished points"
+            )
+
+    def __update_changed_points(
+        self, isochrone_layer: QgsVectorLayer, fields: QgsFields
+    ) -> None:
+        """
+        Compares the points to the points of the complete earlier run. The
+        isochrones of removed and moved points are deleted, and the attributes
+        of changed points are updated in their isochrones. The moved and new
+        points are then fetched like in a resumed run.
+
+        Points outside the selection are not taken as removed, since only a
+        run on the same selection may update the earlier run.
+        """
+        checkpoint: RunCheckpoint = self.checkpoint  # type: ignore
+        previous = checkpoint.point_hashes()
+        current: Set[int] = set()
+        moved: List[int] = []
+        changed: Dict[int, FinishedPoint] = {}
+        changed_attributes: Dict[int, List] = {}
+        request = self.__point_request(attributes=True)
+        for feature in self.source.getFeatures(request):  # type: ignore
+            current.add(feature.id())
+            if feature.id() not in previous:
+                continue
+            previous_geometry, previous_attributes = previous[feature.id()]
+            if geometry_hash(bytes(feature.geometry().asWkb())) != previous_geometry:
+                moved.append(feature.id())
+                continue
+            attributes = attribute_hash(feature.attributes())
+            if attributes != previous_attributes:
+                changed[feature.id()] = (feature.id(), previous_geometry, attributes)
+                changed_attributes[feature.id()] = feature.attributes()
+        removed = [fid for fid in previous if fid not in current]
+
+        provider = isochrone_layer.dataProvider()
+        provider.deleteFeatures(checkpoint.forget_points(removed + moved))
+        offset = fields.indexOf("original_fid")
+        provider.changeAttributeValues(
+            {
+                isochrone_fid: {
+                    index + offset: attribute
+                    for index, attribute in enumerate(changed_attributes[fid])
+                }
+                for fid, isochrone_fids in checkpoint.isochrone_ids(changed).items()
+                for isochrone_fid in isochrone_fids
+            }
+        )
+        checkpoint.mark_finished(changed.values())
+        checkpoint.start_update()
+        TASK_LOGGER.info(
+            f"Since the previous run, {len(current.difference(previous))} points added, {len(removed)} removed, {len(moved)} moved and {len(changed)} otherwise changed."  # noqa
         )
 
+    def __create_point_features(
+        self,
+        fields: QgsFields,
+        point: QgsFeature,
+        bucketed_isochrones: List[Dict],
+    ) -> List[QgsFeature]:
+        features = []
+        for polygon_in_bucket in bucketed_isochrones:
+            bucket = polygon_in_bucket["properties"]["bucket"]
+            distance = (bucket + 1) * self.limit / self.buckets
+            requested = [
+                requested
+                for requested in self.opts.get_distances()
+                if isclose(requested, distance)
+            ]
+            # buckets between the requested distances are not needed
+            if not requested:
+                continue
+            feature = QgsFeature(fields)
+            # save the original feature id separately
+            # setAttributes cannot be used, will destroy any extra fields!!
+            # Geopackage layers have their own fid field before the copied fields.
+            offset = fields.indexOf("original_fid")
+            for index, attribute in enumerate(point.attributes()):
+                feature.setAttribute(index + offset, attribute)
+            # set the added distance field separately
+            feature.setAttribute("isochrone_distance", requested[0])
+
+            with self.metrics.phase("geometry"):
+                geometry = geometry_from_geojson(polygon_in_bucket["geometry"])
+                vertices = geometry.constGet().nCoordinates()
+                self.metrics.vertices_received += vertices
+                if self.opts.simplify_tolerance > 0:
+                    geometry = simplify_geometry(
+                        geometry, self.opts.simplify_tolerance / METERS_PER_DEGREE
+                    )
+                    vertices = geometry.constGet().nCoordinates()
+                self.metrics.vertices_written += vertices
+            feature.setGeometry(geometry)
+            features.append(feature)
+        return features
+
+    def __create_geopackage_layer(self, fields: QgsFields) -> Optional[QgsVectorLayer]:
+        """
+        Creates an empty geopackage in the result directory, so that features
+        can be written directly to disk as they arrive.
+
+        If a previous run of the same job did not finish, its geopackage is
+        opened instead, so that the run can be resumed. The geopackage of a
+        finished run is opened too, if the run should be updated.
+        """
+        geopackage_file = os.path.join(self.opts.directory, f"{self.name}.gpkg")
+        params = {key: value for key, value in self.params.items() if key != "key"}
+        # a run on another selection of the layer writes to the same file
+        ids = self.__requested_ids()
+        job = {
+            "url": self.base_url,
+            "params": params,
+            "distances": self.opts.get_distances(),
+            "layer": self.opts.layer.source(),  # type: ignore
+            "selected_only": self.opts.selected_only,
+            "feature_ids": None if ids is None else feature_ids_hash(ids),
+            "snap_tolerance": self.opts.snap_tolerance,
+            "simplify_tolerance": self.opts.simplify_tolerance,
+        }
+        try:
+            self.checkpoint = RunCheckpoint(geopackage_file, job)
+        except sqlite3.Error as e:
+            # the file may still be writable, it just cannot be resumed
+            TASK_LOGGER.warning(f"Could not save checkpoint of the run: {e}")
+        if self.checkpoint:
+            update = self.opts.update_existing and self.checkpoint.updatable
+            resume = self.checkpoint.resumable or update
+            if resume and os.path.exists(geopackage_file):
+                layer = QgsVectorLayer(geopackage_file, self.name, "ogr")
+                if layer.isValid():
+                    self.__delete_unfinished(layer)
+                    if update:
+                        TASK_LOGGER.info(
+                            f"Updating previous run in file {geopackage_file}"
+                        )
+                        self.__update_changed_points(layer, layer.fields())
+                    else:
+                        TASK_LOGGER.info(
+                            f"Continuing previous run in file {geopackage_file}"
+                        )
+                    return layer
+            self.checkpoint.reset()
+
+        save_options = QgsVectorFileWriter.SaveVectorOptions()
+        save_options.driverName = "GPKG"
+        writer = QgsVectorFileWriter.create(
+            geopackage_file,
+            fields,
+            QgsWkbTypes.Polygon,
+            QgsCoordinateReferenceSystem("EPSG:4326"),
+            QgsCoordinateTransformContext(),
+            save_options,
+        )
+        if writer.hasError():
+            TASK_LOGGER.error(f"Could not save file: {writer.errorMessage()}")
+            if self.checkpoint:
+                self.checkpoint.close()
+                self.checkpoint = None
+            return None
+        # the file is closed once the writer is deleted
+        del writer
+        TASK_LOGGER.info(f"Saving to file {geopackage_file}")
+        return QgsVectorLayer(geopackage_file, self.name, "ogr")
+
+    def output_fields(self) -> QgsFields:
+        """Fields of the isochrone features"""
         # add all the required fields to the new layer
-        fields = QgsFields(self.opts.layer.fields())  # type: ignore
+        fields = QgsFields(self.point_fields)
         # save original feature id separate from new feature id
         fields.rename(0, "original_fid")
         distance_field = QgsField(
             name="isochrone_distance", type=QVariant.Double, typeName="double"
         )
         fields.append(distance_field)
-        provider = isochrone_layer.dataProvider()
-        provider.addAttributes(fields)
-        isochrone_layer.updateFields()
+        return fields
 
-        self.__add_isochrones_to_layer(isochrone_layer)
-        # update layer's extent when new features have been added
-        isochrone_layer.updateExtents()
+    def write_isochrones(self, sink: QgsFeatureSink, fields: QgsFields) -> None:
+        """
+        Fetches isochrones for all points and adds them to the sink.
 
-        # in case a directory was specified, save the layer to geopackage
-        geopackage_file = None
-        if (
-            isochrone_layer.featureCount()
-            and self.opts.write_to_directory
-            and self.opts.directory
-        ):
-            geopackage_file = os.path.join(self.opts.directory, f"{self.name}.gpkg")
-            save_options = QgsVectorFileWriter.SaveVectorOptions()
-            error = QgsVectorFileWriter.writeAsVectorFormatV2(
-                isochrone_layer,
-                geopackage_file,
-                QgsCoordinateTransformContext(),
-                save_options,
-            )
-            if error[0]:
-                TASK_LOGGER.error(
-                    f"Could not save file: {error}",
+        Fields must contain the output fields, in the same order.
+        """
+        if self.opts.use_cache:
+            try:
+                self.cache = self.shared_cache or IsochroneCache(
+                    max_size_mb=self.opts.cache_size_mb
                 )
-            else:
-                # in case the layer was saved, return the saved layer instead
-                TASK_LOGGER.info(f"Saved to file {geopackage_file}")
-                isochrone_layer = QgsVectorLayer(geopackage_file, self.name, "ogr")
+            except (OSError, sqlite3.Error) as e:
+                TASK_LOGGER.warning(f"Could not open isochrone cache: {e}")
+        self.metrics.start()
+        profiler = cProfile.Profile() if self.opts.profile_run else None
+        if profiler:
+            # only profiles this thread, requests are seen as waiting for results
+            profiler.enable()
+        try:
+            self.__add_isochrones_to_sink(sink, fields)
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(self.__run_output_path("prof"))
+            if self.opts.simplify_tolerance > 0:
+                TASK_LOGGER.info(
+                    f"Isochrones simplified from {self.metrics.vertices_received} to {self.metrics.vertices_written} vertices."  # noqa
+                )
+            if self.checkpoint:
+                self.checkpoint.close()
+            if self.metrics.latencies:
+                self.__record_request_seconds()
+            if self.cache:
+                if self.cache is not self.shared_cache:
+                    self.cache.close()
+                TASK_LOGGER.info(
+                    f"{self.metrics.cached_responses} out of {self.metrics.cache_lookups} "  # noqa
+                    "requests served from cache."
+                )
+            self.metrics.wire_bytes = self.session.bytes_received
+            self.metrics.connections = self.session.connections
+            self.metrics.http2_requests = self.session.http2_requests
+            self.metrics.finish()
+            TASK_LOGGER.info(self.metrics.summary())
+            if self.opts.write_metrics:
+                self.metrics.write(self.__run_output_path("metrics.json"))
+
+    def __run_output_path(self, extension: str) -> str:
+        """Path for files describing the run, next to the result if possible"""
+        if self.opts.write_to_directory and self.opts.directory:
+            directory = self.opts.directory
+        else:
+            directory = plugin_path("logs")
+        return os.path.join(directory, f"{self.name}.{extension}")
+
+    def __record_request_seconds(self) -> None:
+        """Saves the request durations, so that later runs can be estimated"""
+        try:
+            history = RunHistory()
+            try:
+                history.record(
+                    self.base_url,
+                    self.opts.profile.value,  # type: ignore
+                    self.opts.unit.value,  # type: ignore
+                    self.limit,
+                    len(self.metrics.latencies),
+                    sum(self.metrics.latencies),
+                )
+            finally:
+                history.close()
+        except sqlite3.Error as e:
+            TASK_LOGGER.warning(f"Could not save request durations: {e}")
+
+    def create_isochrone_layer(self) -> QgsVectorLayer:
+        """Creates a polygon QgsVectorLayer containing isochrones for points"""
+        fields = self.output_fields()
+
+        # in case a directory was specified, write features to geopackage directly
+        isochrone_layer = None
+        if self.opts.write_to_directory and self.opts.directory:
+            isochrone_layer = self.__create_geopackage_layer(fields)
+        in_memory = isochrone_layer is None
+        if in_memory:
+            # the spatial index is created once all features have been added
+            isochrone_layer = QgsVectorLayer(
+                "Polygon?crs=epsg:4326", self.name, "memory"
+            )
+            isochrone_layer.dataProvider().addAttributes(fields)
+            isochrone_layer.updateFields()
+
+        self.write_isochrones(isochrone_layer.dataProvider(), isochrone_layer.fields())
+        if in_memory:
+            isochrone_layer.dataProvider().createSpatialIndex()
+        # update layer's extent when new features have been added
+        isochrone_layer.updateExtents()
+        if isochrone_layer.featureCount() and not self.isCanceled():
+            if self.population:
+                self.__add_population(isochrone_layer)
+            if self.opts.coverage:
+                self.coverage_layer = self.__create_coverage_layer(isochrone_layer)
+                if self.population and self.coverage_layer:
+                    self.__add_population(self.coverage_layer)
 
         isochrone_layer.renderer().symbol().setOpacity(0.15)
         return isochrone_layer
+
+    def __add_population(self, layer: QgsVectorLayer) -> None:
+        """Adds the population within each polygon of the layer"""
+        start = time.perf_counter()
+        try:
+            self.population.add_population(layer, self.isCanceled)  # type: ignore
+        except ZonalStatisticsException as e:
+            TASK_LOGGER.error(f"Could not calculate population: {e.message}")
+            return
+        TASK_LOGGER.info(
+            f"Population of {layer.featureCount()} polygons in {layer.name()} calculated in {time.perf_counter() - start:.1f} s."  # noqa
+        )
+
+    def __create_coverage_layer(
+        self, isochrone_layer: QgsVectorLayer
+    ) -> Optional[QgsVectorLayer]:
+        """Merges the isochrones of each distance, next to the isochrones"""
+        start = time.perf_counter()
+        directory = self.opts.directory if self.opts.write_to_directory else ""
+        coverage_layer = create_coverage_layer(
+            isochrone_layer, f"{self.name} coverage", directory
+        )
+        if coverage_layer:
+            TASK_LOGGER.info(
+                f"Coverage of {isochrone_layer.featureCount()} isochrones merged in {time.perf_counter() - start:.1f} s."  # noqa
+            )
+            coverage_layer.renderer().symbol().setOpacity(0.3)
+        return coverage_layer
@@ -0,0 +1,123 @@
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import List, Optional, Sequence
+
+from qgis.core import QgsTask, QgsVectorLayer
+
+from ..definitions.constants import Profile
+from ..qgis_plugin_tools.tools.resources import plugin_name
+from .isochrone_cache import IsochroneCache
+from .isochrone_creator import MAX_CONCURRENT_REQUESTS, IsochroneCreator, IsochroneOpts
+
+MAIN_LOGGER = logging.getLogger(plugin_name())
+TASK_LOGGER = logging.getLogger(f"{plugin_name()}_task")
+
+
+def sweep_opts(
+    base: IsochroneOpts,
+    layers: Sequence[QgsVectorLayer],
+    profiles: Sequence[Profile],
+    distances: Optional[Sequence[List[int]]] = None,
+) -> List[IsochroneOpts]:
+    """
+    Options for each combination of the layers, profiles and lists of
+    distances, with the other options of the base options. The distances of
+    the base options are used if no lists of distances are given.
+    """
+    if distances is None:
+        return [
+            replace(base, layer=layer, profile=profile)
+            for layer in layers
+            for profile in profiles
+        ]
+    return [
+        replace(base, layer=layer, profile=profile, distances=list(job_distances))
+        for layer in layers
+        for profile in profiles
+        for job_distances in distances
+    ]
+
+
+class IsochroneJobQueue(QgsTask):
+    """
+    Runs several isochrone jobs as a single task, so that the task manager
+    shows their combined progress and the whole queue can be cancelled at
+    once.
+
+    The jobs share a budget of concurrent requests to the server, so a job may
+    use all of it while the others are reading points or writing results. At
+    most as many jobs run side by side as there are requests in the budget,
+    in threads of the queue itself, so the queue takes a single thread of the
+    task manager however many jobs it has. They also share a single
+    connection to the cache.
+    """
+
+    def __init__(self, jobs: List[IsochroneOpts], max_concurrent_requests: int) -> None:
+        super().__init__(description=f"Isochrone queue of {len(jobs)} jobs")
+        budget = min(max(max_concurrent_requests, 1), MAX_CONCURRENT_REQUESTS)
+        self.parallel_jobs = min(budget, max(len(jobs), 1))
+        self.request_slots = threading.BoundedSemaphore(budget)
+        self.cache: Optional[IsochroneCache] = None
+        if any(opts.use_cache for opts in jobs):
+            try:
+                self.cache = IsochroneCache(
+                    max_size_mb=max(opts.cache_size_mb for opts in jobs)
+                )
+            except (OSError, sqlite3.Error) as e:
+                # each job then tries to open the cache itself
+                MAIN_LOGGER.warning(f"Could not open the isochrone cache: {e}")
+        self.creators = [
+            IsochroneCreator(
+                replace(opts, max_concurrent_requests=budget),
+                request_slots=self.request_slots,
+                cache=self.cache,
+                feedback=self,
+            )
+            for opts in jobs
+        ]
+        # None for jobs that were not run, since the queue was cancelled
+        self.results: List[Optional[bool]] = [None] * len(self.creators)
+        self.failed_jobs = 0
+        for creator in self.creators:
+            creator.progressChanged.connect(self.__update_progress)
+
+    def __update_progress(self) -> None:
+        self.setProgress(
+            sum(creator.progress() for creator in self.creators) / len(self.creators)
+        )
+
+    def __run_job(self, index: int) -> None:
+        if not self.isCanceled():
+            self.results[index] = self.creators[index].run()
+
+    def run(self) -> bool:
+        """
+        Runs the jobs. The queue fails if any of its jobs failed.
+        """
+        with ThreadPoolExecutor(max_workers=self.parallel_jobs) as executor:
+            list(executor.map(self.__run_job, range(len(self.creators))))
+        complete = [result for result in self.results if result]
+        self.failed_jobs = len(self.creators) - len(complete)
+        requests = sum(len(creator.metrics.latencies) for creator in self.creators)
+        cached = sum(creator.metrics.cached_responses for creator in self.creators)
+        TASK_LOGGER.info(
+            f"{len(complete)} out of {len(self.creators)} queued jobs completed, with {requests} requests and {cached} responses from cache."  # noqa
+        )
+        return not self.failed_jobs
+
+    def finished(self, result: bool) -> None:
+        # the jobs have ended, so none of them uses the cache any more
+        if self.cache:
+            self.cache.close()
+        # the results of the jobs are added to the project in the main thread
+        for creator, job_result in zip(self.creators, self.results):
+            if job_result is not None:
+                creator.finished(job_result)
+        if not result and not self.isCanceled():
+            MAIN_LOGGER.warning(
+                f"{self.failed_jobs} out of {len(self.creators)} queued jobs failed",
+                extra={"details": "See the log messages of each job for details."},
+            )
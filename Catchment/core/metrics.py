@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+# upper bounds of the request latency histogram buckets in seconds
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Nearest rank percentile of the values, 0 if there are none"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+class RunMetrics:
+    """
+    Collects the time spent in each phase of a run, together with request
+    latencies, response sizes and vertex counts. May be shared between threads.
+
+    Phases running in parallel threads, like the requests, are summed over the
+    threads, so they may add up to more than the total time of the run.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.finished = self.started
+        self.phases: Dict[str, float] = defaultdict(float)
+        self.latencies: List[float] = []
+        self.response_bytes = 0
+        # compressed size of the responses, and the connections they used
+        self.wire_bytes = 0
+        self.connections = 0
+        self.http2_requests = 0
+        self.cache_lookups = 0
+        self.cached_responses = 0
+        # attempts that failed with a transient error, before any retries
+        self.failed_requests = 0
+        self.vertices_received = 0
+        self.vertices_written = 0
+        self.features_written = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.phases[name] += elapsed
+
+    def record_request(self, seconds: float, response_bytes: int) -> None:
+        with self._lock:
+            self.latencies.append(seconds)
+            self.response_bytes += response_bytes
+
+    def record_cache_lookup(self, hit: bool) -> None:
+        with self._lock:
+            self.cache_lookups += 1
+            self.cached_responses += hit
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failed_requests += 1
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+
+    def finish(self) -> None:
+        self.finished = time.perf_counter()
+
+    def latency_histogram(self) -> Dict[str, int]:
+        """Number of requests in each latency bucket, keyed by upper bound"""
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        for latency in self.latencies:
+            counts[bisect_left(LATENCY_BUCKETS, latency)] += 1
+        labels = [f"<={bound:g}s" for bound in LATENCY_BUCKETS] + [
+            f">{LATENCY_BUCKETS[-1]:g}s"
+        ]
+        return dict(zip(labels, counts))
+
+    def to_dict(self) -> Dict[str, Any]:
+        mean_latency = (
+            sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+        )
+        return {
+            "total_seconds": self.finished - self.started,
+            "phase_seconds": dict(self.phases),
+            "requests": {
+                "count": len(self.latencies),
+                "cached": self.cached_responses,
+                "failed": self.failed_requests,
+                "response_bytes": self.response_bytes,
+                "wire_bytes": self.wire_bytes,
+                "connections": self.connections,
+                "http2": self.http2_requests,
+                "latency_seconds": {
+                    "mean": mean_latency,
+                    "p50": percentile(self.latencies, 0.5),
+                    "p95": percentile(self.latencies, 0.95),
+                    "max": max(self.latencies, default=0.0),
+                },
+                "latency_histogram": self.latency_histogram(),
+            },
+            "vertices": {
+                "received": self.vertices_received,
+                "written": self.vertices_written,
+            },
+            "features_written": self.features_written,
+        }
+
+    def summary(self) -> str:
+        phases = ", ".join(
+            f"{name} {seconds:.2f} s"
+            for name, seconds in sorted(
+                self.phases.items(), key=lambda item: item[1], reverse=True
+            )
+        )
+        return (
+            f"Run took {self.finished - self.started:.1f} s. "
+            f"{len(self.latencies)} requests, median "
+            f"{percentile(self.latencies, 0.5):.2f} s, 95th percentile "
+            f"{percentile(self.latencies, 0.95):.2f} s, "
+            f"{self.response_bytes / 1024 / 1024:.1f} MB received, "
+            f"{self.wire_bytes / 1024 / 1024:.1f} MB compressed over "
+            f"{self.connections} connections. "
+            f"{self.features_written} features with {self.vertices_written} "
+            f"vertices written. Time in phases, summed over threads: {phases}."
+        )
+
+    def write(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
@@ -0,0 +1,279 @@
+import gzip
+import logging
+import random
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Union
+
+from PyQt5.QtCore import QUrl, QUrlQuery
+from PyQt5.QtNetwork import QNetworkReply, QNetworkRequest
+from qgis.core import QgsBlockingNetworkRequest
+
+from ..qgis_plugin_tools.tools.exceptions import QgsPluginNetworkException
+from ..qgis_plugin_tools.tools.resources import plugin_name
+
+TASK_LOGGER = logging.getLogger(f"{plugin_name()}_task")
+
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+# consecutive failed requests after which the server is considered down
+CIRCUIT_BREAKER_THRESHOLD = 5
+CIRCUIT_BREAKER_COOLDOWN = 30.0
+# too many requests or the server is temporarily overloaded
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+RETRY_ERRORS = {
+    QNetworkReply.ConnectionRefusedError,
+    QNetworkReply.RemoteHostClosedError,
+    QNetworkReply.TimeoutError,
+    # QgsNetworkAccessManager cancels requests that time out
+    QNetworkReply.OperationCanceledError,
+    QNetworkReply.TemporaryNetworkFailureError,
+    QNetworkReply.NetworkSessionFailedError,
+    QNetworkReply.ProxyTimeoutError,
+    QNetworkReply.ServiceUnavailableError,
+}
+# errors of servers or proxies that do not handle HTTP/2 properly
+HTTP2_FALLBACK_ERRORS = {
+    QNetworkReply.ProtocolFailure,
+    QNetworkReply.UnknownNetworkError,
+}
+
+
+class NetworkRequestException(QgsPluginNetworkException):
+    """Failed request with the HTTP status and the Retry-After header, if any"""
+
+    def __init__(
+        self,
+        message: str,
+        error: int,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        super().__init__(message, error=error)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str) -> Optional[float]:
+    """Parses Retry-After given either in seconds or as an HTTP date"""
+    value = value.strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpSession:
+    """
+    Settings and traffic counters shared by the requests of a run. May be
+    shared between threads.
+
+    Requests are sent with the network access manager of the sending thread,
+    which keeps the connection to the server alive between requests, so each
+    thread opens a connection once and then reuses it. Responses are requested
+    gzip compressed, and HTTP/2 is used if allowed and the server supports it.
+    Should a request fail at the protocol level with HTTP/2 allowed, HTTP/2
+    is no longer allowed for the session and the request is sent again.
+
+    Qt does not tell when a connection is opened. A thread is counted to open
+    a new connection on its first request, and after the server closed the
+    connection or the connection was lost.
+    """
+
+    def __init__(self, compress: bool = True, http2: bool = True) -> None:
+        self.compress = compress
+        self.http2 = http2
+        self.requests = 0
+        self.connections = 0
+        self.http2_requests = 0
+        # response bodies as sent by the server, and after decompression
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self._lock = threading.Lock()
+        self._thread = threading.local()
+
+    def prepare(self, request: QNetworkRequest) -> None:
+        # Qt only leaves the body compressed if the header is set explicitly,
+        # otherwise the size on the wire would not be known
+        if self.compress:
+            request.setRawHeader(b"Accept-Encoding", b"gzip, deflate")
+        request.setRawHeader(b"Connection", b"keep-alive")
+        request.setAttribute(QNetworkRequest.Http2AllowedAttribute, self.http2)
+
+    def fall_back_to_http1(self, reply: QNetworkReply) -> bool:
+        """
+        Stops allowing HTTP/2 if the request failed at the protocol level.
+        Returns True if the request should then be sent again.
+        """
+        with self._lock:
+            if not self.http2 or reply.error() not in HTTP2_FALLBACK_ERRORS:
+                return False
+            self.http2 = False
+        TASK_LOGGER.warning(
+            f"Falling back to HTTP/1.1, request failed: {reply.errorString()}"
+        )
+        return True
+
+    def record(self, reply: QNetworkReply, received: int, decoded: int) -> None:
+        connected = getattr(self._thread, "connected", False)
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += received
+            self.bytes_decoded += decoded
+            if not connected:
+                self.connections += 1
+            if reply.attribute(QNetworkRequest.Http2WasUsedAttribute):
+                self.http2_requests += 1
+        closed = bytes(reply.rawHeader(b"Connection")).lower() == b"close"
+        # errors below the HTTP level, like timeouts, lose the connection
+        lost = QNetworkReply.NoError < reply.error() < QNetworkReply.ContentAccessDenied
+        self._thread.connected = not (closed or lost)
+
+
+def decode_content(content: bytes, encoding: str) -> bytes:
+    """Decompresses a response body sent with the given Content-Encoding"""
+    if encoding == "gzip":
+        return gzip.decompress(content)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            # some servers send deflate without the zlib header
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+    return content
+
+
+def fetch(
+    url: str,
+    params: Optional[Dict[str, Union[str, int, bool]]] = None,
+    session: Optional[HttpSession] = None,
+) -> str:
+    """
+    Fetches the url with the given query parameters. Unlike the fetch of
+    qgis_plugin_tools, the exception tells the HTTP status and how long the
+    server asked us to wait before retrying.
+
+    The traffic is counted in the session, if one is given.
+    """
+    if session is None:
+        session = HttpSession()
+    query = QUrlQuery()
+    for name, value in (params or {}).items():
+        if isinstance(value, bool):
+            value = str(value).lower()
+        query.addQueryItem(name, str(value))
+    qurl = QUrl(url)
+    qurl.setQuery(query)
+    while True:
+        network_request = QNetworkRequest(qurl)
+        session.prepare(network_request)
+        request = QgsBlockingNetworkRequest()
+        result = request.get(network_request, forceRefresh=True)
+        reply = request.reply()
+        # HTTP/2 is only disallowed once, so the request is sent at most twice
+        if result == QgsBlockingNetworkRequest.NoError:
+            break
+        if not session.fall_back_to_http1(reply):
+            break
+    received = bytes(reply.content())
+    encoding = bytes(reply.rawHeader(b"Content-Encoding")).decode("latin-1")
+    try:
+        decoded = decode_content(received, encoding.strip().lower())
+    except (EOFError, OSError, zlib.error) as e:
+        session.record(reply, len(received), 0)
+        raise NetworkRequestException(
+            f"Could not decompress response: {e}",
+            error=QNetworkReply.UnknownContentError,
+        )
+    session.record(reply, len(received), len(decoded))
+    content = decoded.decode("utf-8")
+    if result != QgsBlockingNetworkRequest.NoError:
+        status_code = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+        retry_after = parse_retry_after(
+            bytes(reply.rawHeader(b"Retry-After")).decode("latin-1")
+        )
+        # Graphhopper explains the error in the content
+        raise NetworkRequestException(
+            content or request.errorMessage(),
+            error=reply.error(),
+            status_code=int(status_code) if status_code else None,
+            retry_after=retry_after,
+        )
+    return content
+
+
+def is_retryable(error: QgsPluginNetworkException) -> bool:
+    """Whether the request might succeed if it is sent again later"""
+    status_code = getattr(error, "status_code", None)
+    if status_code in RETRY_STATUS_CODES:
+        return True
+    return error.error in RETRY_ERRORS
+
+
+@dataclass
+class RetryPolicy:
+    max_retries: int = 3
+    base_delay: float = RETRY_BASE_DELAY
+    max_delay: float = RETRY_MAX_DELAY
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Seconds to wait before the given retry. Retry-After from the server is
+        honoured up to the maximum delay, so that a worker is not blocked for
+        hours. Otherwise the delay grows exponentially with full jitter, so
+        that concurrent requests don't all retry at the same moment.
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+class CircuitBreaker:
+    """
+    Pauses all requests once too many consecutive requests have failed, giving
+    the server time to recover. After the cooldown requests are sent again,
+    and a single success closes the circuit. May be shared between threads.
+    """
+
+    def __init__(
+        self,
+        threshold: int = CIRCUIT_BREAKER_THRESHOLD,
+        cooldown: float = CIRCUIT_BREAKER_COOLDOWN,
+    ) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> bool:
+        """Returns True if the failure opened the circuit"""
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures < self.threshold:
+                return False
+            now = time.monotonic()
+            # failures during the cooldown don't extend it
+            if self.opened_at is not None and now < self.opened_at + self.cooldown:
+                return False
+            self.opened_at = now
+            return True
+
+    def wait_time(self) -> float:
+        """Seconds until requests may be sent again"""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.opened_at + self.cooldown - time.monotonic())
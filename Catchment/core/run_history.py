@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import time
+from math import exp, log
+from typing import Optional
+
+from ..qgis_plugin_tools.tools.resources import plugin_path
+
+# only the latest runs are used, the server or its data may have changed
+MAX_RUNS = 50
+
+
+def history_path() -> str:
+    """Default history location, next to the plugin log files"""
+    return plugin_path("logs", "run_history.sqlite")
+
+
+class RunHistory:
+    """
+    Timings of the isochrone requests of previous runs, for each server,
+    profile, unit and limit. Used to estimate how long a new run will take.
+    """
+
+    def __init__(self, path: str = "") -> None:
+        self.path = path or history_path()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connection = sqlite3.connect(self.path)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "url TEXT NOT NULL, "
+                "profile TEXT NOT NULL, "
+                "unit TEXT NOT NULL, "
+                "limit_value REAL NOT NULL, "
+                "requests INTEGER NOT NULL, "
+                "seconds REAL NOT NULL, "
+                "recorded REAL NOT NULL)"
+            )
+
+    def record(
+        self,
+        url: str,
+        profile: str,
+        unit: str,
+        limit: float,
+        requests: int,
+        seconds: float,
+    ) -> None:
+        """Saves the total time spent in the given number of requests"""
+        with self._connection:
+            self._connection.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, profile, unit, limit, requests, seconds, time.time()),
+            )
+
+    def request_seconds(
+        self, url: str, profile: str, unit: str, limit: float
+    ) -> Optional[float]:
+        """
+        Estimated time of a single request, or None if there are no previous
+        runs with the same server, profile and unit.
+
+        Limits that have been run before use their average. Otherwise, the
+        time is fitted as exponential in the limit from all the limits run
+        before, or scaled with the area of the isochrone if only a single limit
+        has been run.
+        """
+        rows = self._connection.execute(
+            "SELECT limit_value, SUM(seconds), SUM(requests) FROM ("
+            "SELECT * FROM runs WHERE url = ? AND profile = ? AND unit = ? "
+            "ORDER BY recorded DESC LIMIT ?) "
+            "GROUP BY limit_value",
+            (url, profile, unit, MAX_RUNS),
+        ).fetchall()
+        averages = {
+            limit_value: seconds / requests
+            for limit_value, seconds, requests in rows
+            if requests and seconds > 0
+        }
+        if not averages:
+            return None
+        if limit in averages:
+            return averages[limit]
+        if len(averages) == 1:
+            ((known_limit, seconds),) = averages.items()
+            return seconds * (limit / known_limit) ** 2
+        # least squares fit of log(seconds) = a + b * limit, weighted by requests
+        weights = {
+            limit_value: requests
+            for limit_value, seconds, requests in rows
+            if limit_value in averages
+        }
+        total = sum(weights.values())
+        mean_x = sum(x * w for x, w in weights.items()) / total
+        mean_y = sum(log(averages[x]) * w for x, w in weights.items()) / total
+        variance = sum(w * (x - mean_x) ** 2 for x, w in weights.items())
+        covariance = sum(
+            w * (x - mean_x) * (log(averages[x]) - mean_y) for x, w in weights.items()
+        )
+        slope = covariance / variance
+        return exp(mean_y + slope * (limit - mean_x))
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,194 @@
+import logging
+import random
+from dataclasses import dataclass, replace
+from math import ceil
+from typing import List, Optional, Tuple
+
+from qgis.core import QgsTask, QgsVectorLayer
+
+from ..qgis_plugin_tools.tools.exceptions import QgsPluginNetworkException
+from ..qgis_plugin_tools.tools.resources import plugin_name
+from .isochrone_creator import IsochroneCreator, IsochroneOpts
+from .metrics import RunMetrics
+from .spt_contouring import SptContouringException
+
+MAIN_LOGGER = logging.getLogger(plugin_name())
+TASK_LOGGER = logging.getLogger(f"{plugin_name()}_task")
+
+# number of points fetched to estimate a run
+SAMPLE_SIZE = 20
+# phases run one at a time in the task thread, the rest run in request threads
+MAIN_THREAD_PHASES = {"read points", "read attributes", "geometry", "write"}
+# rough size of a feature, and of each of its attributes, in a memory layer
+FEATURE_MEMORY_BYTES = 200
+ATTRIBUTE_MEMORY_BYTES = 32
+
+
+def sample_ids(ids: List[int], size: int, seed: Optional[int] = None) -> List[int]:
+    """Random sample of the ids, or all of them if there are not more"""
+    if len(ids) <= size:
+        return list(ids)
+    return random.Random(seed).sample(ids, size)
+
+
+def duration_string(seconds: float) -> str:
+    minutes = seconds / 60
+    if minutes < 90:
+        return f"{ceil(minutes)} min"
+    return f"{minutes / 60:.1f} h"
+
+
+@dataclass
+class RunEstimate:
+    """Time, size and memory of a whole run, extrapolated from a sample"""
+
+    points: int
+    sample_points: int
+    seconds: float
+    output_bytes: float
+    memory_bytes: float
+    failure_rate: float
+    request_seconds: float
+
+    def summary(self) -> str:
+        return (
+            f"Estimated from {self.sample_points} sample points: about "
+            f"{duration_string(self.seconds)} for {self.points} points,\n"
+            f"{self.output_bytes / 1024 / 1024:.0f} MB of isochrones and "
+            f"{self.memory_bytes / 1024 / 1024:.0f} MB of memory if not saved to "
+            f"a file.\nRequests took {self.request_seconds:.1f} s on average, "
+            f"{100 * self.failure_rate:.0f} % of them failed."
+        )
+
+
+def extrapolate(
+    metrics: RunMetrics,
+    sample_points: int,
+    points: int,
+    parallel_requests: int,
+    sample_bytes: Tuple[int, int],
+) -> Optional[RunEstimate]:
+    """
+    Scales the sample run to all the points, or returns None if no sample
+    request succeeded.
+
+    Requests run in parallel, while the isochrones are processed one at a
+    time as they arrive, so the run takes as long as the slower of the two.
+    The time in requests includes the failed attempts, but not the pauses
+    before retrying them.
+    """
+    if not metrics.latencies or not sample_points:
+        return None
+    scale = points / sample_points
+    request_seconds = sum(
+        seconds
+        for name, seconds in metrics.phases.items()
+        if name not in MAIN_THREAD_PHASES
+    )
+    processing_seconds = sum(
+        seconds
+        for name, seconds in metrics.phases.items()
+        if name in MAIN_THREAD_PHASES
+    )
+    attempts = len(metrics.latencies) + metrics.failed_requests
+    output_bytes, memory_bytes = sample_bytes
+    return RunEstimate(
+        points=points,
+        sample_points=sample_points,
+        seconds=max(
+            request_seconds * scale / max(parallel_requests, 1),
+            processing_seconds * scale,
+        ),
+        output_bytes=output_bytes * scale,
+        memory_bytes=memory_bytes * scale,
+        failure_rate=metrics.failed_requests / attempts,
+        request_seconds=sum(metrics.latencies) / len(metrics.latencies),
+    )
+
+
+def layer_bytes(layer: QgsVectorLayer) -> Tuple[int, int]:
+    """
+    Approximate size of the features when saved, and when kept in a memory
+    layer
+    """
+    output_bytes = 0
+    memory_bytes = 0
+    attribute_memory_bytes = ATTRIBUTE_MEMORY_BYTES * len(layer.fields())
+    for feature in layer.getFeatures():
+        geometry_bytes = len(feature.geometry().asWkb())
+        output_bytes += geometry_bytes + sum(
+            len(str(attribute)) for attribute in feature.attributes()
+        )
+        memory_bytes += geometry_bytes + FEATURE_MEMORY_BYTES + attribute_memory_bytes
+    return output_bytes, memory_bytes
+
+
+class SampleEstimator(QgsTask):
+    """
+    Fetches the isochrones of a random sample of the points like a run would,
+    without saving them, and extrapolates the time, size and memory of the
+    whole run from the sample.
+    """
+
+    def __init__(
+        self, opts: IsochroneOpts, processes: int = 1, sample_size: int = SAMPLE_SIZE
+    ) -> None:
+        layer: QgsVectorLayer = opts.layer  # type: ignore
+        ids = (
+            layer.selectedFeatureIds() if opts.selected_only else layer.allFeatureIds()
+        )
+        self.points = len(ids)
+        self.parallel_requests = max(opts.max_concurrent_requests, 1) * max(
+            processes, 1
+        )
+        self.estimate: Optional[RunEstimate] = None
+        # Cached responses would make the run look faster than it is, and the
+        # layers derived from the isochrones are not part of the estimate.
+        sample_opts = replace(
+            opts,
+            feature_ids=sample_ids(list(ids), sample_size),
+            write_to_directory=False,
+            update_existing=False,
+            use_cache=False,
+            write_metrics=False,
+            profile_run=False,
+            coverage=False,
+            population_layer=None,
+        )
+        self.creator = IsochroneCreator(sample_opts)
+        super().__init__(description=f"Estimating run: {self.creator.name}")
+        self.creator.progressChanged.connect(self.setProgress)
+
+    def run(self) -> bool:
+        try:
+            layer = self.creator.create_isochrone_layer()
+        except QgsPluginNetworkException as e:
+            TASK_LOGGER.error(
+                f"Sample request failed, cannot estimate the run. Error: {e.message}"  # noqa
+            )
+            return False
+        except SptContouringException as e:
+            TASK_LOGGER.error(f"Could not contour isochrones: {e.message}")
+            return False
+        if self.isCanceled():
+            return False
+        self.estimate = extrapolate(
+            self.creator.metrics,
+            self.creator.point_count,
+            self.points,
+            self.parallel_requests,
+            layer_bytes(layer),
+        )
+        return self.estimate is not None
+
+    def cancel(self) -> None:
+        self.creator.cancel()
+        super().cancel()
+
+    def finished(self, result: bool) -> None:
+        if result:
+            MAIN_LOGGER.info(self.estimate.summary())  # type: ignore
+        elif not self.isCanceled():
+            MAIN_LOGGER.warning(
+                "Could not estimate the run, none of the sample requests succeeded"
+            )
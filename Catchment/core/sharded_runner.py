@@ -0,0 +1,361 @@
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from qgis.core import (
+    QgsApplication,
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransformContext,
+    QgsFeature,
+    QgsFields,
+    QgsLayerTreeLayer,
+    QgsProject,
+    QgsTask,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+    QgsWkbTypes,
+)
+
+from ..definitions.constants import Engine, Profile, Unit
+from ..processing_provider.isochrone_algorithm import (
+    API_KEY_VARIABLE,
+    IsochroneAlgorithm,
+)
+from ..processing_provider.provider import CatchmentProvider
+from ..qgis_plugin_tools.tools.exceptions import QgsPluginException
+from ..qgis_plugin_tools.tools.resources import plugin_name
+from .coverage import create_coverage_layer
+from .isochrone_creator import FEATURE_BATCH_SIZE, IsochroneOpts
+from .zonal_statistics import PopulationRaster, ZonalStatisticsException
+
+MAIN_LOGGER = logging.getLogger(plugin_name())
+TASK_LOGGER = logging.getLogger(f"{plugin_name()}_task")
+
+MAX_WORKER_PROCESSES = 16
+# qgis_process prints the progress as 0...10...20...
+PROGRESS_PATTERN = re.compile(r"(\d+)\.\.\.")
+# how much of the worker output is kept for error messages
+OUTPUT_TAIL_LENGTH = 2000
+
+
+class ShardingNotSupportedException(QgsPluginException):
+    pass
+
+
+def qgis_process_path() -> str:
+    """Returns the qgis_process executable of the running QGIS installation"""
+    if sys.platform == "win32":
+        names = ["qgis_process.exe", "qgis_process-qgis.bat"]
+    else:
+        names = ["qgis_process"]
+    for directory in [
+        QgsApplication.applicationDirPath(),
+        os.path.join(QgsApplication.prefixPath(), "bin"),
+    ]:
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                return path
+    for name in names:
+        path = shutil.which(name)
+        if path:
+            return path
+    raise ShardingNotSupportedException(
+        "qgis_process not found, cannot run isochrones in several processes"
+    )
+
+
+def split_ids(ids: List[int], shard_count: int) -> List[List[int]]:
+    """
+    Splits the feature ids into contiguous shards of (almost) equal size.
+    Contiguous shards keep duplicate points, which usually have adjacent ids,
+    in the same shard.
+    """
+    if not ids:
+        return []
+    ids = sorted(ids)
+    shard_count = max(1, min(shard_count, len(ids)))
+    size, remainder = divmod(len(ids), shard_count)
+    shards = []
+    start = 0
+    for index in range(shard_count):
+        end = start + size + (1 if index < remainder else 0)
+        shards.append(ids[start:end])
+        start = end
+    return shards
+
+
+def merge_layers(
+    part_files: List[str], geopackage_file: str, name: str
+) -> QgsVectorLayer:
+    """
+    Merges the partial results of the worker processes into a single
+    geopackage. All the parts have the same fields, since they are created by
+    the same algorithm. The fid of each part is dropped and generated anew.
+    """
+    parts = [QgsVectorLayer(part_file, "", "ogr") for part_file in part_files]
+    fields = QgsFields()
+    for part_field in parts[0].fields():
+        if part_field.name() != "fid":
+            fields.append(part_field)
+    field_names = fields.names()
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+    options.layerName = name
+    writer = QgsVectorFileWriter.create(
+        geopackage_file,
+        fields,
+        QgsWkbTypes.Polygon,
+        QgsCoordinateReferenceSystem("EPSG:4326"),
+        QgsCoordinateTransformContext(),
+        options,
+    )
+    if writer.hasError() != QgsVectorFileWriter.NoError:
+        raise ShardingNotSupportedException(
+            f"Could not create {geopackage_file}: {writer.errorMessage()}"
+        )
+    features: List[QgsFeature] = []
+    for part in parts:
+        for part_feature in part.getFeatures():
+            feature = QgsFeature(fields)
+            feature.setGeometry(part_feature.geometry())
+            feature.setAttributes(
+                [part_feature.attribute(field_name) for field_name in field_names]
+            )
+            features.append(feature)
+            if len(features) >= FEATURE_BATCH_SIZE:
+                writer.addFeatures(features)
+                features = []
+    writer.addFeatures(features)
+    # the writer and the parts must be closed before the files are used
+    del writer
+    del parts
+    return QgsVectorLayer(geopackage_file, name, "ogr")
+
+
+def worker_parameters(
+    opts: IsochroneOpts, source: str, ids_file: str, part_file: str
+) -> Dict[str, Any]:
+    """
+    Parameters of the Processing algorithm run by a worker process. The API
+    key is left out, since other users may see the command line of a process.
+    """
+    return {
+        IsochroneAlgorithm.INPUT: source,
+        IsochroneAlgorithm.URL: opts.url,
+        IsochroneAlgorithm.PROFILE: list(Profile).index(opts.profile),  # type: ignore
+        IsochroneAlgorithm.UNIT: list(Unit).index(opts.unit),  # type: ignore
+        IsochroneAlgorithm.DISTANCES: opts.get_distances_string(),
+        # a single listed distance would otherwise be divided into buckets
+        IsochroneAlgorithm.BUCKETS: 1 if opts.distances else opts.buckets,
+        IsochroneAlgorithm.SNAP_TOLERANCE: opts.snap_tolerance,
+        IsochroneAlgorithm.SIMPLIFY_TOLERANCE: opts.simplify_tolerance,
+        IsochroneAlgorithm.CONCURRENT_REQUESTS: opts.max_concurrent_requests,
+        IsochroneAlgorithm.RETRIES: opts.max_retries,
+        IsochroneAlgorithm.USE_CACHE: int(opts.use_cache),
+        IsochroneAlgorithm.HTTP2: int(opts.http2),
+        IsochroneAlgorithm.ENGINE: list(Engine).index(opts.engine),
+        IsochroneAlgorithm.FEATURE_IDS_FILE: ids_file,
+        IsochroneAlgorithm.OUTPUT: part_file,
+    }
+
+
+class ShardedIsochroneRunner(QgsTask):
+    """
+    Calculates isochrones in several QGIS processes instead of threads.
+
+    The points are split into shards, each processed by a qgis_process worker
+    running the Processing algorithm of the plugin and writing its own partial
+    geopackage. The parts are merged to a single layer in the end.
+    """
+
+    def __init__(self, opts: IsochroneOpts, process_count: int) -> None:
+        self.opts = opts
+        self.result_layer: Optional[QgsVectorLayer] = None
+        self.coverage_layer: Optional[QgsVectorLayer] = None
+        self.population = (
+            PopulationRaster(opts.population_layer) if opts.population_layer else None
+        )
+        self.error = ""
+        layer: QgsVectorLayer = opts.layer
+        # the workers may only read what has been saved to disk
+        if layer.providerType() != "ogr" or layer.isModified():
+            raise ShardingNotSupportedException(
+                "Several processes can only be used with a point layer saved to a file"  # noqa
+            )
+        self.executable = qgis_process_path()
+        self.source = layer.source()
+        ids = (
+            layer.selectedFeatureIds() if opts.selected_only else layer.allFeatureIds()
+        )
+        self.shards = split_ids(list(ids), min(process_count, MAX_WORKER_PROCESSES))
+        self.name = opts.get_layer_name()
+        self._progress: List[float] = [0.0] * len(self.shards)
+        self._output_tails: List[str] = [""] * len(self.shards)
+        super().__init__(
+            description=f"Fetching GraphHopper isochrones in {len(self.shards)} processes: {self.name}"  # noqa
+        )
+        self.setProgress(0.0)
+
+    def run(self) -> bool:
+        """
+        This method MUST return True or False.
+
+        Raising exceptions will crash QGIS, so we handle them
+        internally and raise them in self.finished
+        """
+        if not self.shards:
+            self.error = "Starting layer was empty, no isochrones generated"
+            return False
+        work_directory = tempfile.mkdtemp(prefix=f"{plugin_name().lower()}_")
+        try:
+            part_files = self.__run_workers(work_directory)
+            if part_files is None:
+                return False
+            directory = (
+                self.opts.directory if self.opts.write_to_directory else work_directory
+            )
+            TASK_LOGGER.info(f"Merging results of {len(part_files)} processes...")
+            self.result_layer = merge_layers(
+                part_files, os.path.join(directory, f"{self.name}.gpkg"), self.name
+            )
+        except (OSError, ShardingNotSupportedException) as e:
+            self.error = str(e)
+            return False
+        finally:
+            if self.opts.write_to_directory:
+                shutil.rmtree(work_directory, ignore_errors=True)
+            else:
+                # the merged result stays in the temporary directory
+                for file_name in os.listdir(work_directory):
+                    if file_name.startswith(("shard", "part")):
+                        os.remove(os.path.join(work_directory, file_name))
+        count = self.result_layer.featureCount()
+        TASK_LOGGER.info(f"Total of {count} isochrones generated.")
+        if self.opts.coverage and count:
+            self.coverage_layer = create_coverage_layer(
+                self.result_layer,
+                f"{self.name} coverage",
+                self.opts.directory if self.opts.write_to_directory else "",
+            )
+        if self.population and count:
+            for layer in (self.result_layer, self.coverage_layer):
+                if layer is None:
+                    continue
+                try:
+                    self.population.add_population(layer, self.isCanceled)
+                except ZonalStatisticsException as e:
+                    TASK_LOGGER.error(f"Could not calculate population: {e.message}")
+                    break
+        self.setProgress(100)
+        return bool(count)
+
+    def finished(self, result: bool) -> None:
+        if result:
+            # styled like the results of a run in a single process
+            self.result_layer.renderer().symbol().setOpacity(0.15)
+            QgsProject.instance().addMapLayer(self.result_layer, False)
+            root = QgsProject.instance().layerTreeRoot()
+            root.insertChildNode(1, QgsLayerTreeLayer(self.result_layer))
+            if self.coverage_layer:
+                self.coverage_layer.renderer().symbol().setOpacity(0.3)
+                QgsProject.instance().addMapLayer(self.coverage_layer, False)
+                root.insertChildNode(1, QgsLayerTreeLayer(self.coverage_layer))
+        elif self.isCanceled():
+            MAIN_LOGGER.warning("Isochrone run cancelled")
+        elif self.result_layer is None:
+            MAIN_LOGGER.error(
+                "Isochrone worker processes failed",
+                extra={"details": self.error},
+            )
+        else:
+            MAIN_LOGGER.error(
+                "No results, no roads found close to any of the points",
+                extra={
+                    "details": "Please make sure that Graphhopper contains the roads in your region."  # noqa
+                },
+            )
+
+    def __worker_arguments(self, ids_file: str, part_file: str) -> List[str]:
+        parameters = worker_parameters(self.opts, self.source, ids_file, part_file)
+        algorithm_id = f"{CatchmentProvider().id()}:{IsochroneAlgorithm().name()}"
+        return [self.executable, "run", algorithm_id] + [
+            f"--{name}={value}" for name, value in parameters.items() if value != ""
+        ]
+
+    def __run_workers(self, work_directory: str) -> Optional[List[str]]:
+        """Runs all the shards in parallel, returns the partial results"""
+        environment = dict(os.environ)
+        # the workers have no display
+        environment.setdefault("QT_QPA_PLATFORM", "offscreen")
+        if self.opts.api_key:
+            environment[API_KEY_VARIABLE] = self.opts.api_key
+        processes: List[subprocess.Popen] = []
+        readers: List[threading.Thread] = []
+        part_files: List[str] = []
+        for index, shard in enumerate(self.shards):
+            ids_file = os.path.join(work_directory, f"shard{index}.txt")
+            with open(ids_file, "w") as f:
+                f.write("\n".join(str(fid) for fid in shard))
+            part_file = os.path.join(work_directory, f"part{index}.gpkg")
+            part_files.append(part_file)
+            process = subprocess.Popen(
+                self.__worker_arguments(ids_file, part_file),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                env=environment,
+                creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+            )
+            processes.append(process)
+            reader = threading.Thread(
+                target=self.__read_output, args=(index, process), daemon=True
+            )
+            reader.start()
+            readers.append(reader)
+        TASK_LOGGER.info(
+            f"Started {len(processes)} worker processes for {sum(map(len, self.shards))} points"  # noqa
+        )
+        while any(process.poll() is None for process in processes):
+            if self.isCanceled():
+                for process in processes:
+                    process.terminate()
+                for process in processes:
+                    process.wait()
+                return None
+            # leave the last 10 percent for merging
+            self.setProgress(0.9 * sum(self._progress) / len(self._progress))
+            time.sleep(0.5)
+        for reader in readers:
+            reader.join()
+        failed = False
+        for index, process in enumerate(processes):
+            if process.returncode != 0:
+                failed = True
+                TASK_LOGGER.error(
+                    f"Worker process {index} failed: {self._output_tails[index]}"
+                )
+        if failed:
+            self.error = "See the log for the output of the failed processes."
+            return None
+        return part_files
+
+    def __read_output(self, index: int, process: subprocess.Popen) -> None:
+        """Follows the progress printed by a worker process"""
+        while True:
+            chunk = os.read(process.stdout.fileno(), 1024)  # type: ignore
+            if not chunk:
+                break
+            text = chunk.decode("utf-8", errors="replace")
+            self._output_tails[index] = (self._output_tails[index] + text)[
+                -OUTPUT_TAIL_LENGTH:
+            ]
+            progress = PROGRESS_PATTERN.findall(text)
+            if progress:
+                self._progress[index] = float(progress[-1])
@@ -0,0 +1,216 @@
+import struct
+from typing import List, Optional, Tuple
+
+from qgis.core import QgsGeometry
+
+from ..qgis_plugin_tools.tools.exceptions import QgsPluginException
+from .coverage import union_geometries
+from .geometry import WKB_LITTLE_ENDIAN, WKB_POLYGON, polygon_rings
+
+try:
+    import numpy as np
+except ImportError:  # numpy is bundled with most, but not all QGIS installations
+    np = None
+
+# columns requested from the /spt endpoint
+SPT_COLUMNS = "longitude,latitude,time,distance"
+# The tree is fetched somewhat beyond the largest distance, so that the largest
+# isochrone is contoured between the nodes on both sides of it.
+SPT_LIMIT_MARGIN = 1.1
+WKB_POINT = 1
+WKB_MULTIPOINT = 4
+WKB_GEOMETRYCOLLECTION = 7
+# byte order, geometry type and the number of parts
+WKB_COLLECTION_HEADER = struct.Struct("<BII")
+
+
+class SptContouringException(QgsPluginException):
+    pass
+
+
+def _point_dtype() -> "np.dtype":
+    return np.dtype([("byte_order", "u1"), ("type", "<u4"), ("xy", "<f8", (2,))])
+
+
+def _polygon_dtype(vertices: int) -> "np.dtype":
+    """WKB of a polygon with a single ring of the given number of vertices"""
+    return np.dtype(
+        [
+            ("byte_order", "u1"),
+            ("type", "<u4"),
+            ("rings", "<u4"),
+            ("vertices", "<u4"),
+            ("xy", "<f8", (vertices, 2)),
+        ]
+    )
+
+
+def _polygons(rings: "np.ndarray") -> "np.ndarray":
+    """WKB polygons of closed rings, given as an array of polygons, vertices, xy"""
+    polygons = np.zeros(len(rings), dtype=_polygon_dtype(rings.shape[1]))
+    polygons["byte_order"] = WKB_LITTLE_ENDIAN
+    polygons["type"] = WKB_POLYGON
+    polygons["rings"] = 1
+    polygons["vertices"] = rings.shape[1]
+    polygons["xy"] = rings
+    return polygons
+
+
+def _collection(geometry_type: int, parts: List["np.ndarray"]) -> QgsGeometry:
+    """Geometry of the WKB parts, without creating a Python object for each"""
+    geometry = QgsGeometry()
+    geometry.fromWkb(
+        WKB_COLLECTION_HEADER.pack(
+            WKB_LITTLE_ENDIAN, geometry_type, sum(len(part) for part in parts)
+        )
+        + b"".join(part.tobytes() for part in parts)
+    )
+    return geometry
+
+
+def parse_spt(text: str, column: str) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Coordinates of the nodes of a shortest path tree in the CSV returned by
+    GraphHopper, together with their values in the given column.
+    """
+    header, _, body = text.partition("\n")
+    columns = [name.strip() for name in header.split(",")]
+    try:
+        indices = [columns.index(name) for name in ("longitude", "latitude", column)]
+    except ValueError:
+        raise SptContouringException(
+            f"Shortest path tree is missing columns, it has only {header}"
+        )
+    # each line has the same number of values, so all can be parsed at once
+    values = np.fromstring(",".join(body.split()), sep=",")
+    if values.size % len(columns):
+        raise SptContouringException("Shortest path tree has incomplete rows")
+    values = values.reshape(-1, len(columns))
+    return values[:, indices[:2]], values[:, indices[2]]
+
+
+class ShortestPathTree:
+    """
+    The nodes reachable from a point, with the time or distance to reach each,
+    kept in arrays so that isochrones of any distance up to the limit of the
+    tree can be contoured without new requests.
+
+    The nodes are triangulated once. Each distance is then contoured by linear
+    interpolation along the edges of the triangles, and the parts of the
+    triangles within the distance are merged to the isochrone.
+    """
+
+    def __init__(self, coordinates: "np.ndarray", values: "np.ndarray") -> None:
+        # Nodes at the same location keep their lowest value. The nodes are
+        # sorted by their coordinates, so that the corners of the triangles
+        # can be found with a binary search.
+        order = np.lexsort((values, coordinates[:, 1], coordinates[:, 0]))
+        coordinates, values = coordinates[order], values[order]
+        first = np.ones(len(values), dtype=bool)
+        first[1:] = np.any(coordinates[1:] != coordinates[:-1], axis=1)
+        self.coordinates = np.ascontiguousarray(coordinates[first], dtype="<f8")
+        self.values = values[first].astype(np.float32)
+        self._triangles: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_csv(cls, text: str, column: str, scale: float = 1.0) -> "ShortestPathTree":
+        """Tree with the values of the column multiplied by scale"""
+        if np is None:
+            raise SptContouringException(
+                "Contouring shortest path trees requires numpy"
+            )
+        coordinates, values = parse_spt(text, column)
+        return cls(coordinates, values * scale)
+
+    @property
+    def triangles(self) -> "np.ndarray":
+        """Indices of the corner nodes of each Delaunay triangle"""
+        if self._triangles is None:
+            self._triangles = self.__triangulate()
+        return self._triangles
+
+    def contour(self, threshold: float) -> Optional[QgsGeometry]:
+        """
+        Area reachable within the threshold, or None if no triangle reaches
+        it. Only the largest polygon is kept, like in GraphHopper isochrones.
+        """
+        triangles = self.triangles
+        below = self.values[triangles] <= threshold
+        count = below.sum(axis=1)
+        # the corners within the threshold first, each triangle is still a ring
+        corners = np.take_along_axis(
+            triangles, np.argsort(~below, axis=1, kind="stable"), axis=1
+        )
+        coordinates = self.coordinates
+        parts = []
+        inside = corners[count == 3]
+        if len(inside):
+            parts.append(_polygons(coordinates[inside[:, [0, 1, 2, 0]]]))
+        one_inside = corners[count == 1]
+        if len(one_inside):
+            a, b, c = one_inside.T
+            ring = [
+                coordinates[a],
+                self.__crossing(a, b, threshold),
+                self.__crossing(a, c, threshold),
+                coordinates[a],
+            ]
+            parts.append(_polygons(np.stack(ring, axis=1)))
+        two_inside = corners[count == 2]
+        if len(two_inside):
+            a, b, c = two_inside.T
+            ring = [
+                coordinates[a],
+                coordinates[b],
+                self.__crossing(b, c, threshold),
+                self.__crossing(a, c, threshold),
+                coordinates[a],
+            ]
+            parts.append(_polygons(np.stack(ring, axis=1)))
+        if not parts:
+            return None
+        union = union_geometries([_collection(WKB_GEOMETRYCOLLECTION, parts)])
+        if union.isMultipart():
+            union = max(union.asGeometryCollection(), key=lambda part: part.area())
+        return union
+
+    def contour_rings(self, threshold: float) -> List[List[List[float]]]:
+        """Rings of the contour as GeoJSON polygon coordinates, empty if none"""
+        geometry = self.contour(threshold)
+        if geometry is None or geometry.isEmpty():
+            return []
+        return [ring.tolist() for ring in polygon_rings(geometry)]
+
+    def __crossing(
+        self, inside: "np.ndarray", outside: "np.ndarray", threshold: float
+    ) -> "np.ndarray":
+        """Points where the value reaches the threshold on the edges"""
+        # Interpolated from the node sorted first, so that the triangles on both
+        # sides of an edge get exactly the same point and no gaps are left.
+        start, end = np.minimum(inside, outside), np.maximum(inside, outside)
+        start_values = self.values[start].astype(np.float64)
+        end_values = self.values[end].astype(np.float64)
+        share = (threshold - start_values) / (end_values - start_values)
+        return self.coordinates[start] + share[:, np.newaxis] * (
+            self.coordinates[end] - self.coordinates[start]
+        )
+
+    def __triangulate(self) -> "np.ndarray":
+        if len(self.coordinates) < 3:
+            return np.zeros((0, 3), dtype=np.int64)
+        points = np.zeros(len(self.coordinates), dtype=_point_dtype())
+        points["byte_order"] = WKB_LITTLE_ENDIAN
+        points["type"] = WKB_POINT
+        points["xy"] = self.coordinates
+        triangulation = _collection(WKB_MULTIPOINT, [points]).delaunayTriangulation()
+        if triangulation.isNull() or triangulation.isEmpty():
+            # all the nodes are on a single line
+            return np.zeros((0, 3), dtype=np.int64)
+        wkb = bytes(triangulation.asWkb())
+        _, _, count = WKB_COLLECTION_HEADER.unpack_from(wkb)
+        corners = np.frombuffer(
+            wkb, dtype=_polygon_dtype(4), count=count, offset=WKB_COLLECTION_HEADER.size
+        )["xy"][:, :3]
+        # the triangles have the exact coordinates of the nodes
+        keys = self.coordinates[:, 0] + 1j * self.coordinates[:, 1]
+        return np.searchsorted(keys, corners[..., 0] + 1j * corners[..., 1])
@@ -0,0 +1,273 @@
+from collections import defaultdict
+from math import floor
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from PyQt5.QtCore import QVariant
+from qgis.core import (
+    Qgis,
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsCsException,
+    QgsFeatureRequest,
+    QgsField,
+    QgsProject,
+    QgsRasterBlock,
+    QgsRasterLayer,
+    QgsRectangle,
+    QgsVectorLayer,
+)
+
+from ..qgis_plugin_tools.tools.exceptions import QgsPluginException
+from .geometry import polygon_rings
+
+try:
+    import numpy as np
+except ImportError:  # numpy is bundled with most, but not all QGIS installations
+    np = None
+
+POPULATION_FIELD = "population"
+# the raster is read in blocks of this many cells in each direction
+TILE_SIZE = 512
+NUMPY_TYPES = {
+    Qgis.Byte: "uint8",
+    Qgis.UInt16: "uint16",
+    Qgis.Int16: "int16",
+    Qgis.UInt32: "uint32",
+    Qgis.Int32: "int32",
+    Qgis.Float32: "float32",
+    Qgis.Float64: "float64",
+}
+
+Tile = Tuple[int, int]
+
+
+class ZonalStatisticsException(QgsPluginException):
+    pass
+
+
+def polygon_mask(
+    rings: List["np.ndarray"],
+    left: float,
+    top: float,
+    cell_width: float,
+    cell_height: float,
+    columns: int,
+    rows: int,
+) -> "np.ndarray":
+    """
+    Cells of the grid whose centre is inside the rings, by the even-odd rule,
+    so holes and separate parts need no special handling.
+
+    Each row of cells is a scanline. The crossings of all the edges with all
+    the scanlines are computed at once, and every cell to the right of a
+    crossing is toggled.
+    """
+    centres_y = top - (np.arange(rows) + 0.5) * cell_height
+    centres_x = left + (np.arange(columns) + 0.5) * cell_width
+    crossings = np.zeros(rows * (columns + 1), dtype=np.int64)
+    for ring in rings:
+        x1, y1 = ring[:-1, 0], ring[:-1, 1]
+        x2, y2 = ring[1:, 0], ring[1:, 1]
+        crosses = (y1 > centres_y[:, np.newaxis]) != (y2 > centres_y[:, np.newaxis])
+        row_index, edge_index = np.nonzero(crosses)
+        if not len(row_index):
+            continue
+        x1, y1 = x1[edge_index], y1[edge_index]
+        x2, y2 = x2[edge_index], y2[edge_index]
+        x = x1 + (centres_y[row_index] - y1) * (x2 - x1) / (y2 - y1)
+        column_index = np.searchsorted(centres_x, x)
+        crossings += np.bincount(
+            row_index * (columns + 1) + column_index, minlength=len(crossings)
+        )
+    toggles = np.cumsum(crossings.reshape(rows, columns + 1), axis=1)
+    return toggles[:, :columns] % 2 == 1
+
+
+def block_values(block: QgsRasterBlock) -> "np.ndarray":
+    """Values of a raster block, with no data as zero"""
+    dtype = NUMPY_TYPES.get(block.dataType())
+    if dtype is None:
+        raise ZonalStatisticsException(
+            f"Unsupported population raster data type {block.dataType()}"
+        )
+    values = np.frombuffer(bytes(block.data()), dtype=dtype).astype(np.float64)
+    values = values.reshape(block.height(), block.width())
+    if block.hasNoDataValue():
+        values[values == block.noDataValue()] = 0.0
+    values[np.isnan(values)] = 0.0
+    return values
+
+
+class PopulationRaster:
+    """
+    A snapshot of a population raster, which may be read in another thread.
+
+    The raster is read in tiles. Only the polygons intersecting the current
+    row of tiles are kept in memory, so each part of the raster is read once
+    however much the polygons overlap.
+    """
+
+    def __init__(self, layer: QgsRasterLayer, band: int = 1) -> None:
+        self.name = layer.name()
+        self.provider = layer.dataProvider().clone()
+        self.band = band
+        self.transform = QgsCoordinateTransform(
+            QgsCoordinateReferenceSystem("EPSG:4326"),
+            layer.crs(),
+            QgsProject.instance(),
+        )
+        self.extent = self.provider.extent()
+        self.columns = self.provider.xSize()
+        self.rows = self.provider.ySize()
+        self.cell_width = self.extent.width() / self.columns
+        self.cell_height = self.extent.height() / self.rows
+
+    def add_population(
+        self,
+        layer: QgsVectorLayer,
+        is_canceled: Callable[[], bool] = lambda: False,
+    ) -> None:
+        """
+        Adds the population within each polygon of the layer to its population
+        field, which is created if needed.
+        """
+        if np is None:
+            raise ZonalStatisticsException("Calculating population requires numpy")
+        populations = self.population_in_polygons(layer, is_canceled)
+        if is_canceled():
+            return
+        provider = layer.dataProvider()
+        index = layer.fields().indexOf(POPULATION_FIELD)
+        if index == -1:
+            field = QgsField(
+                name=POPULATION_FIELD, type=QVariant.Double, typeName="double"
+            )
+            provider.addAttributes([field])
+            layer.updateFields()
+            index = layer.fields().indexOf(POPULATION_FIELD)
+        provider.changeAttributeValues(
+            {fid: {index: float(population)} for fid, population in populations.items()}
+        )
+
+    def population_in_polygons(
+        self,
+        layer: QgsVectorLayer,
+        is_canceled: Callable[[], bool] = lambda: False,
+    ) -> Dict[int, float]:
+        """Sum of the cells with their centre inside each polygon of the layer"""
+        windows: Dict[int, Tuple[int, int, int, int]] = {}
+        tile_polygons: Dict[Tile, List[int]] = defaultdict(list)
+        request = QgsFeatureRequest().setNoAttributes()
+        for feature in layer.getFeatures(request):
+            window = self.__cell_window(feature.geometry().boundingBox())
+            if window is None:
+                continue
+            windows[feature.id()] = window
+            for tile in self.__tiles(window):
+                tile_polygons[tile].append(feature.id())
+
+        populations = {fid: 0.0 for fid in windows}
+        remaining_tiles = {fid: len(self.__tiles(windows[fid])) for fid in windows}
+        rings: Dict[int, List[np.ndarray]] = {}
+        for tile in sorted(tile_polygons):
+            if is_canceled():
+                break
+            fids = tile_polygons[tile]
+            self.__read_rings(layer, {fid for fid in fids if fid not in rings}, rings)
+            row, column = tile
+            top_row, left_column = row * TILE_SIZE, column * TILE_SIZE
+            values = self.__read_tile(top_row, left_column)
+            for fid in fids:
+                if fid in rings:
+                    populations[fid] += self.__window_population(
+                        rings[fid], windows[fid], values, top_row, left_column
+                    )
+                remaining_tiles[fid] -= 1
+                if remaining_tiles[fid] == 0:
+                    rings.pop(fid, None)
+        return populations
+
+    def __cell_window(
+        self, bounding_box: QgsRectangle
+    ) -> Optional[Tuple[int, int, int, int]]:
+        """First and last rows and columns of the cells the box may cover"""
+        try:
+            box = self.transform.transformBoundingBox(bounding_box)
+        except QgsCsException:
+            return None
+        first_row = floor((self.extent.yMaximum() - box.yMaximum()) / self.cell_height)
+        last_row = floor((self.extent.yMaximum() - box.yMinimum()) / self.cell_height)
+        first_column = floor(
+            (box.xMinimum() - self.extent.xMinimum()) / self.cell_width
+        )
+        last_column = floor((box.xMaximum() - self.extent.xMinimum()) / self.cell_width)
+        first_row, first_column = max(first_row, 0), max(first_column, 0)
+        last_row = min(last_row, self.rows - 1)
+        last_column = min(last_column, self.columns - 1)
+        if first_row > last_row or first_column > last_column:
+            return None
+        return first_row, last_row, first_column, last_column
+
+    @staticmethod
+    def __tiles(window: Tuple[int, int, int, int]) -> List[Tile]:
+        first_row, last_row, first_column, last_column = window
+        return [
+            (row, column)
+            for row in range(first_row // TILE_SIZE, last_row // TILE_SIZE + 1)
+            for column in range(first_column // TILE_SIZE, last_column // TILE_SIZE + 1)
+        ]
+
+    def __read_rings(
+        self, layer: QgsVectorLayer, fids: Set[int], rings: Dict[int, List]
+    ) -> None:
+        """Reads the polygons first needed by a tile in the raster CRS"""
+        if not fids:
+            return
+        request = QgsFeatureRequest().setFilterFids(list(fids)).setNoAttributes()
+        for feature in layer.getFeatures(request):
+            geometry = feature.geometry()
+            try:
+                geometry.transform(self.transform)
+            except QgsCsException:
+                continue
+            rings[feature.id()] = polygon_rings(geometry)
+
+    def __read_tile(self, top_row: int, left_column: int) -> "np.ndarray":
+        rows = min(TILE_SIZE, self.rows - top_row)
+        columns = min(TILE_SIZE, self.columns - left_column)
+        left = self.extent.xMinimum() + left_column * self.cell_width
+        top = self.extent.yMaximum() - top_row * self.cell_height
+        extent = QgsRectangle(
+            left, top - rows * self.cell_height, left + columns * self.cell_width, top
+        )
+        block = self.provider.block(self.band, extent, columns, rows)
+        if not block.isValid():
+            return np.zeros((rows, columns))
+        return block_values(block)
+
+    def __window_population(
+        self,
+        rings: List["np.ndarray"],
+        window: Tuple[int, int, int, int],
+        values: "np.ndarray",
+        top_row: int,
+        left_column: int,
+    ) -> float:
+        """Population of the polygon within its window of cells in the tile"""
+        first_row, last_row, first_column, last_column = window
+        rows, columns = values.shape
+        # window relative to the tile
+        start_row = max(first_row - top_row, 0)
+        end_row = min(last_row - top_row + 1, rows)
+        start_column = max(first_column - left_column, 0)
+        end_column = min(last_column - left_column + 1, columns)
+        mask = polygon_mask(
+            rings,
+            self.extent.xMinimum() + (left_column + start_column) * self.cell_width,
+            self.extent.yMaximum() - (top_row + start_row) * self.cell_height,
+            self.cell_width,
+            self.cell_height,
+            end_column - start_column,
+            end_row - start_row,
+        )
+        return float(values[start_row:end_row, start_column:end_column][mask].sum())
@@ -10,3 +10,10 @@ class Profile(Enum):
     WALKING = "hike"
     CYCLING = "bike"
     DRIVING = "car"
+
+
+class Engine(Enum):
+    """GraphHopper endpoint the isochrones are created from"""
+
+    ISOCHRONE = "isochrone"
+    SPT = "spt"
@@ -3,9 +3,11 @@ from typing import Callable, List, Optional
 from PyQt5.QtCore import QCoreApplication, QTranslator
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QAction, QWidget
+from qgis.core import QgsApplication
 from qgis.gui import QgisInterface
 
 from .core.isochrone_creator import IsochroneCreator
+from .processing_provider.provider import CatchmentProvider
 from .qgis_plugin_tools.tools.custom_logging import (
     setup_logger,
     setup_task_logger,
@@ -25,6 +27,9 @@ class Plugin:
         self.iface = iface
         # store the task here so it survives garbage collection after run method returns
         self.creator: Optional[IsochroneCreator] = None
+        self.provider: Optional[CatchmentProvider] = None
+        # only created with the GUI, qgis_process loads the plugin without one
+        self.dlg: Optional[MainDialog] = None
 
         # conventional logger for the main thread
         setup_logger(plugin_name(), iface)
@@ -44,7 +49,6 @@ class Plugin:
         self.actions: List[QAction] = []
         self.menu = tr(plugin_name())
 
-        self.dlg = MainDialog()
         if not get_setting("gh_url"):
             set_setting("gh_url", "https://graphhopper.com/api/1")
 
@@ -114,8 +118,15 @@ class Plugin:
 
         return action
 
+    def initProcessing(self) -> None:  # noqa N802
+        """Register the processing provider, also used by qgis_process"""
+        self.provider = CatchmentProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
+
     def initGui(self) -> None:  # noqa N802
         """Create the menu entries and toolbar icons inside the QGIS GUI."""
+        self.initProcessing()
+        self.dlg = MainDialog()
         self.add_action(
             "",
             text=tr(plugin_name()),
@@ -132,9 +143,13 @@ class Plugin:
         for action in self.actions:
             self.iface.removePluginMenu(tr(plugin_name()), action)
             self.iface.removeToolBarIcon(action)
+        if self.provider:
+            QgsApplication.processingRegistry().removeProvider(self.provider)
         teardown_logger(plugin_name())
         teardown_logger(f"{plugin_name()}_task")
 
     def run(self) -> None:
         """Run method that performs all the real work"""
+        if self.dlg is None:
+            self.dlg = MainDialog()
         self.dlg.show()
@@ -0,0 +1,144 @@
+from typing import Any, Dict
+
+from PyQt5.QtCore import QVariant
+from qgis.core import (
+    QgsCoordinateTransform,
+    QgsCsException,
+    QgsFeature,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterField,
+    QgsProcessingUtils,
+)
+
+from ..core.assignment import CatchmentIndex
+from ..qgis_plugin_tools.tools.i18n import tr
+
+
+class AssignmentAlgorithm(QgsProcessingAlgorithm):
+    """
+    Tags each point, e.g. households or students, with the catchments that
+    contain it, using the isochrones calculated by the plugin.
+    """
+
+    INPUT = "INPUT"
+    ISOCHRONES = "ISOCHRONES"
+    ID_FIELD = "ID_FIELD"
+    OUTPUT = "OUTPUT"
+
+    def createInstance(self) -> "AssignmentAlgorithm":  # noqa N802
+        return AssignmentAlgorithm()
+
+    def name(self) -> str:
+        return "assign_catchments"
+
+    def displayName(self) -> str:  # noqa N802
+        return tr("Assign points to catchments")
+
+    def shortHelpString(self) -> str:  # noqa N802
+        return tr(
+            "Adds the ids of all the catchments containing each point, nearest "
+            "first, and the smallest isochrone distance from the point to any "
+            "of them. The ids are read from the given field of the isochrones, "
+            "by default the id of the starting point, e.g. the school."
+        )
+
+    def initAlgorithm(self, config: Dict[str, Any] = None) -> None:  # noqa N802
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.INPUT, tr("Point layer"), [QgsProcessing.TypeVectorPoint]
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.ISOCHRONES, tr("Isochrones"), [QgsProcessing.TypeVectorPolygon]
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.ID_FIELD,
+                tr("Catchment id field"),
+                "original_fid",
+                self.ISOCHRONES,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT, tr("Assigned points"), QgsProcessing.TypeVectorPoint
+            )
+        )
+
+    def processAlgorithm(  # noqa N802
+        self,
+        parameters: Dict[str, Any],
+        context: QgsProcessingContext,
+        feedback: QgsProcessingFeedback,
+    ) -> Dict[str, Any]:
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        isochrones = self.parameterAsSource(parameters, self.ISOCHRONES, context)
+        if source is None or isochrones is None:
+            raise QgsProcessingException(tr("Please check the input layers"))
+        id_field = self.parameterAsString(parameters, self.ID_FIELD, context)
+        if isochrones.fields().indexOf("isochrone_distance") == -1:
+            raise QgsProcessingException(
+                tr("Isochrones must have the isochrone_distance field")
+            )
+
+        assigned_fields = QgsFields()
+        assigned_fields.append(
+            QgsField(name="reachable_ids", type=QVariant.String, typeName="string")
+        )
+        assigned_fields.append(
+            QgsField(name="isochrone_distance", type=QVariant.Double, typeName="double")
+        )
+        fields = QgsProcessingUtils.combineFields(source.fields(), assigned_fields)
+        sink, dest_id = self.parameterAsSink(
+            parameters,
+            self.OUTPUT,
+            context,
+            fields,
+            source.wkbType(),
+            source.sourceCrs(),
+        )
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        feedback.pushInfo(tr("Indexing isochrones"))
+        index = CatchmentIndex(isochrones, id_field)
+        transform = QgsCoordinateTransform(
+            source.sourceCrs(), isochrones.sourceCrs(), context.transformContext()
+        )
+        total = 100 / source.featureCount() if source.featureCount() else 0
+        for i, feature in enumerate(source.getFeatures()):
+            if feedback.isCanceled():
+                break
+            ids, distance = [], None
+            geometry = feature.geometry()
+            if not geometry.isEmpty():
+                if geometry.isMultipart():
+                    geometry = geometry.centroid()
+                try:
+                    ids, distance = index.assign(
+                        transform.transform(geometry.asPoint())
+                    )
+                except QgsCsException:
+                    feedback.reportError(
+                        tr("Could not transform point {}").format(feature.id())
+                    )
+            assigned = QgsFeature(fields)
+            assigned.setGeometry(feature.geometry())
+            assigned.setAttributes(
+                feature.attributes()
+                + [", ".join(str(id_) for id_ in ids) or None, distance]
+            )
+            sink.addFeature(assigned, QgsFeatureSink.FastInsert)
+            feedback.setProgress(int(i * total))
+        return {self.OUTPUT: dest_id}
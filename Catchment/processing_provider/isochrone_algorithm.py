@@ -0,0 +1,303 @@
+import os
+from typing import Any, Dict, Optional
+
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterDefinition,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
+    QgsWkbTypes,
+)
+
+from ..core.isochrone_cache import DEFAULT_CACHE_SIZE_MB
+from ..core.isochrone_creator import (
+    MAX_CONCURRENT_REQUESTS,
+    InvalidDistancesException,
+    IsochroneCreator,
+    IsochroneOpts,
+    parse_distances,
+)
+from ..core.spt_contouring import SptContouringException
+from ..definitions.constants import Engine, Profile, Unit
+from ..qgis_plugin_tools.tools.exceptions import QgsPluginNetworkException
+from ..qgis_plugin_tools.tools.i18n import tr
+
+# read if no API key is given, so that it need not be on the command line
+API_KEY_VARIABLE = "CATCHMENT_API_KEY"
+
+
+class IsochroneAlgorithm(QgsProcessingAlgorithm):
+    """
+    Calculates isochrones for a point layer, without the dialog.
+
+    Usable from the Processing toolbox, the graphical modeler, batch mode and
+    headless with qgis_process, e.g.
+
+        qgis_process run catchment:isochrones --INPUT=schools.gpkg
+        --URL=http://localhost:8989 --DISTANCES="15, 30" --OUTPUT=result.gpkg
+    """
+
+    INPUT = "INPUT"
+    URL = "URL"
+    API_KEY = "API_KEY"
+    PROFILE = "PROFILE"
+    UNIT = "UNIT"
+    DISTANCES = "DISTANCES"
+    BUCKETS = "BUCKETS"
+    SNAP_TOLERANCE = "SNAP_TOLERANCE"
+    SIMPLIFY_TOLERANCE = "SIMPLIFY_TOLERANCE"
+    CONCURRENT_REQUESTS = "CONCURRENT_REQUESTS"
+    RETRIES = "RETRIES"
+    USE_CACHE = "USE_CACHE"
+    HTTP2 = "HTTP2"
+    ENGINE = "ENGINE"
+    FEATURE_IDS_FILE = "FEATURE_IDS_FILE"
+    OUTPUT = "OUTPUT"
+
+    PROFILES = list(Profile)
+    UNITS = list(Unit)
+    ENGINES = list(Engine)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.creator: Optional[IsochroneCreator] = None
+
+    def createInstance(self) -> "IsochroneAlgorithm":  # noqa N802
+        return IsochroneAlgorithm()
+
+    def name(self) -> str:
+        return "isochrones"
+
+    def displayName(self) -> str:  # noqa N802
+        return tr("Calculate isochrones")
+
+    def shortHelpString(self) -> str:  # noqa N802
+        return tr(
+            "Calculates catchment areas (isochrones) for each point using "
+            "Graphhopper. Distances may be a single distance, which is divided "
+            "into the given number of divisions, or a list of distances "
+            "separated by commas, which are fetched with a single request per "
+            "point. Contouring the shortest path tree of each point locally "
+            "allows any number of distances."
+        )
+
+    def initAlgorithm(self, config: Dict[str, Any] = None) -> None:  # noqa N802
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.INPUT, tr("Point layer"), [QgsProcessing.TypeVectorPoint]
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.URL, tr("GraphHopper URL"), "https://graphhopper.com/api/1"
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(self.API_KEY, tr("API Key"), optional=True)
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.PROFILE,
+                tr("Profile"),
+                [profile.name.capitalize() for profile in self.PROFILES],
+                defaultValue=0,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.UNIT,
+                tr("Unit of distance"),
+                [unit.name.capitalize() for unit in self.UNITS],
+                defaultValue=0,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(self.DISTANCES, tr("Distances"), "30")
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.BUCKETS,
+                tr("Distance divisions (for a single distance)"),
+                QgsProcessingParameterNumber.Integer,
+                1,
+                minValue=1,
+                maxValue=8,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.SNAP_TOLERANCE,
+                tr("Merge points closer than (m)"),
+                QgsProcessingParameterNumber.Double,
+                0,
+                minValue=0,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.SIMPLIFY_TOLERANCE,
+                tr("Simplify isochrones (m)"),
+                QgsProcessingParameterNumber.Double,
+                0,
+                minValue=0,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.CONCURRENT_REQUESTS,
+                tr("Concurrent requests"),
+                QgsProcessingParameterNumber.Integer,
+                1,
+                minValue=1,
+                maxValue=MAX_CONCURRENT_REQUESTS,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.RETRIES,
+                tr("Retries per request"),
+                QgsProcessingParameterNumber.Integer,
+                3,
+                minValue=0,
+                maxValue=10,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.USE_CACHE, tr("Use cached isochrones"), True
+            )
+        )
+        http2 = QgsProcessingParameterBoolean(self.HTTP2, tr("Allow HTTP/2"), True)
+        http2.setFlags(http2.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(http2)
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.ENGINE,
+                tr("Isochrones from"),
+                [
+                    tr("GraphHopper isochrones"),
+                    tr("Shortest path trees contoured locally"),
+                ],
+                defaultValue=0,
+            )
+        )
+        # used by the worker processes of sharded runs
+        feature_ids_file = QgsProcessingParameterFile(
+            self.FEATURE_IDS_FILE,
+            tr("Process only the feature ids listed in file"),
+            optional=True,
+        )
+        feature_ids_file.setFlags(
+            feature_ids_file.flags() | QgsProcessingParameterDefinition.FlagAdvanced
+        )
+        self.addParameter(feature_ids_file)
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT, tr("Isochrones"), QgsProcessing.TypeVectorPolygon
+            )
+        )
+
+    def prepareAlgorithm(  # noqa N802
+        self,
+        parameters: Dict[str, Any],
+        context: QgsProcessingContext,
+        feedback: QgsProcessingFeedback,
+    ) -> bool:
+        """
+        Creates the run in the main thread, where the layer may be read. The
+        points are read from the feature source in processAlgorithm, which
+        Processing prepares with only the selected features if so chosen.
+        """
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(
+                self.invalidSourceError(parameters, self.INPUT)
+            )
+        opts = IsochroneOpts(
+            url=self.parameterAsString(parameters, self.URL, context),
+            api_key=self.parameterAsString(parameters, self.API_KEY, context)
+            or os.environ.get(API_KEY_VARIABLE, ""),
+            layer=self.parameterAsVectorLayer(parameters, self.INPUT, context),
+            unit=self.UNITS[self.parameterAsEnum(parameters, self.UNIT, context)],
+            profile=self.PROFILES[
+                self.parameterAsEnum(parameters, self.PROFILE, context)
+            ],
+            snap_tolerance=self.parameterAsDouble(
+                parameters, self.SNAP_TOLERANCE, context
+            ),
+            simplify_tolerance=self.parameterAsDouble(
+                parameters, self.SIMPLIFY_TOLERANCE, context
+            ),
+            max_concurrent_requests=self.parameterAsInt(
+                parameters, self.CONCURRENT_REQUESTS, context
+            ),
+            max_retries=self.parameterAsInt(parameters, self.RETRIES, context),
+            use_cache=self.parameterAsBool(parameters, self.USE_CACHE, context),
+            http2=self.parameterAsBool(parameters, self.HTTP2, context),
+            cache_size_mb=DEFAULT_CACHE_SIZE_MB,
+            engine=self.ENGINES[self.parameterAsEnum(parameters, self.ENGINE, context)],
+        )
+        try:
+            distances = parse_distances(
+                self.parameterAsString(parameters, self.DISTANCES, context)
+            )
+        except InvalidDistancesException as e:
+            raise QgsProcessingException(e.message)
+        if len(distances) == 1:
+            opts.distance = distances[0]
+            opts.buckets = self.parameterAsInt(parameters, self.BUCKETS, context)
+        else:
+            opts.distances = distances
+        feature_ids_file = self.parameterAsFile(
+            parameters, self.FEATURE_IDS_FILE, context
+        )
+        if feature_ids_file:
+            with open(feature_ids_file) as f:
+                opts.feature_ids = [int(line) for line in f if line.strip()]
+        if not opts.check_if_opts_set():
+            raise QgsProcessingException(
+                tr("Please check the url, the point layer and the distances")
+            )
+
+        self.creator = IsochroneCreator(opts, feedback=feedback, source=source)
+        return True
+
+    def processAlgorithm(  # noqa N802
+        self,
+        parameters: Dict[str, Any],
+        context: QgsProcessingContext,
+        feedback: QgsProcessingFeedback,
+    ) -> Dict[str, Any]:
+        creator: IsochroneCreator = self.creator  # type: ignore
+        creator.feedback = feedback
+        creator.progressChanged.connect(feedback.setProgress)
+        fields = creator.output_fields()
+        sink, dest_id = self.parameterAsSink(
+            parameters,
+            self.OUTPUT,
+            context,
+            fields,
+            QgsWkbTypes.Polygon,
+            QgsCoordinateReferenceSystem("EPSG:4326"),
+        )
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+        try:
+            creator.write_isochrones(sink, fields)
+        except QgsPluginNetworkException as e:
+            raise QgsProcessingException(
+                tr("Network request failed, aborting run. Error: {}").format(e.message)
+            )
+        except SptContouringException as e:
+            raise QgsProcessingException(e.message)
+        return {self.OUTPUT: dest_id}
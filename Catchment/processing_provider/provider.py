@@ -0,0 +1,20 @@
+from qgis.core import QgsProcessingProvider
+
+from ..qgis_plugin_tools.tools.i18n import tr
+from ..qgis_plugin_tools.tools.resources import plugin_name
+from .assignment_algorithm import AssignmentAlgorithm
+from .isochrone_algorithm import IsochroneAlgorithm
+
+
+class CatchmentProvider(QgsProcessingProvider):
+    """Processing provider exposing the plugin to Processing and qgis_process"""
+
+    def loadAlgorithms(self) -> None:  # noqa N802
+        self.addAlgorithm(IsochroneAlgorithm())
+        self.addAlgorithm(AssignmentAlgorithm())
+
+    def id(self) -> str:
+        return plugin_name().lower()
+
+    def name(self) -> str:
+        return tr(plugin_name())
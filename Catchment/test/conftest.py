@@ -4,7 +4,7 @@
 This class contains fixtures and common helper function to keep the test files shorter
 """
 import os
-from typing import Callable, Dict, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 import pytest
 from PyQt5.QtCore import QVariant
@@ -20,12 +20,14 @@ from qgis.core import (
 )
 
 from Catchment.core.isochrone_creator import IsochroneOpts
+from Catchment.core.network import HttpSession
 from Catchment.definitions.constants import Profile, Unit
 from Catchment.plugin import Plugin
 
 from ..qgis_plugin_tools.testing.utilities import get_qgis_app
 from ..qgis_plugin_tools.tools.exceptions import QgsPluginNetworkException
 from ..qgis_plugin_tools.tools.i18n import tr
+from .stand_in_server import StandInServer
 
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
 MOCK_URL = "http://mock.url"
@@ -52,6 +54,7 @@ def mock_fetch(mocker, request) -> None:
         def mocked_fetch(
             incoming_url: str,
             params: Optional[Dict[str, str]] = None,
+            session: Optional[HttpSession] = None,
         ) -> str:
             if incoming_url == url:
                 with open(
@@ -68,6 +71,23 @@ def mock_fetch(mocker, request) -> None:
     yield _mock_fetch
 
 
+@pytest.fixture(scope="function")
+def stand_in_server() -> None:
+    """Starts local stand-ins for GraphHopper, stopped after the test.
+    Use by calling stand_in_server(latency, vertices, error_rate, ...) in a test.
+    """
+    servers = []
+
+    def _stand_in_server(**options) -> StandInServer:
+        server = StandInServer(**options).start()
+        servers.append(server)
+        return server
+
+    yield _stand_in_server
+    for server in servers:
+        server.stop()
+
+
 @pytest.fixture(scope="function")
 def point() -> None:
     yield QgsPointXY(1.0, 1.0)
@@ -90,6 +110,32 @@ def point_feature(fields, point) -> None:
     yield feature
 
 
+def add_points(
+    layer: QgsVectorLayer,
+    points: Iterable[Tuple[int, QgsPointXY]],
+    name: Optional[str] = None,
+) -> Dict[int, int]:
+    """
+    Adds a point with the given id attribute for each of the points, named by
+    formatting the name with the id. Returns the feature ids by the id.
+    """
+    features = []
+    for id_, point in points:
+        feature = QgsFeature(layer.fields())
+        feature.setGeometry(QgsGeometry.fromPointXY(point))
+        feature.setAttribute("id", id_)
+        if name is not None:
+            feature.setAttribute("name", name.format(id_))
+        features.append(feature)
+    _, features = layer.dataProvider().addFeatures(features)
+    return {feature["id"]: feature.id() for feature in features}
+
+
+def points_in_row(count: int) -> List[Tuple[int, QgsPointXY]]:
+    """Points 0.01 degrees apart east of the school, with ids from 2 on"""
+    return [(i + 2, QgsPointXY(1.0 + (i + 1) / 100, 1.0)) for i in range(count)]
+
+
 @pytest.fixture(scope="function")
 def vector_layer(fields, point_feature) -> None:
     layer = QgsVectorLayer("Point?crs=epsg:4326&index=yes", "test_points", "memory")
@@ -113,6 +159,32 @@ def isochrone_opts(vector_layer) -> None:
     yield opts
 
 
+@pytest.fixture(scope="function")
+def catchment_layer() -> None:
+    """School 1 within 15 and 30 minutes, school 2 within 30, school 3 within 45"""
+    layer = QgsVectorLayer("Polygon?crs=epsg:4326", "isochrones", "memory")
+    layer.dataProvider().addAttributes(
+        [
+            QgsField("original_fid", QVariant.Int),
+            QgsField("isochrone_distance", QVariant.Double),
+        ]
+    )
+    layer.updateFields()
+    features = []
+    for school, distance, wkt in [
+        (1, 30, "POLYGON((0 0, 4 0, 4 4, 0 4, 0 0))"),
+        (1, 15, "POLYGON((0 0, 2 0, 2 2, 0 2, 0 0))"),
+        (2, 30, "POLYGON((3 0, 6 0, 6 4, 3 4, 3 0))"),
+        (3, 45, "POLYGON((10 0, 20 0, 10 10, 10 0))"),
+    ]:
+        feature = QgsFeature(layer.fields())
+        feature.setGeometry(QgsGeometry.fromWkt(wkt))
+        feature.setAttributes([school, distance])
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    yield layer
+
+
 @pytest.fixture(scope="function")
 def new_plugin(isochrone_opts) -> None:
     plugin = Plugin(IFACE)
@@ -0,0 +1,185 @@
+"""
+A local stand-in for the GraphHopper isochrone and shortest path tree APIs,
+serving synthetic isochrones and trees so that the whole pipeline can be
+tested and benchmarked without network access.
+"""
+
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import cos, hypot, pi, radians, sin
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+METERS_PER_DEGREE = 111320
+# speed used to turn time limits into isochrone radii, roughly walking speed
+METERS_PER_SECOND = 1.4
+
+
+def synthetic_isochrones(
+    lat: float, lon: float, limit_meters: float, buckets: int, vertices: int
+) -> List[Dict]:
+    """Regular polygons around the point, one for each bucket"""
+    polygons = []
+    for bucket in range(buckets):
+        radius = (bucket + 1) * limit_meters / buckets / METERS_PER_DEGREE
+        ring = [
+            [
+                lon + radius * cos(2 * pi * i / vertices) / cos(radians(lat)),
+                lat + radius * sin(2 * pi * i / vertices),
+            ]
+            for i in range(vertices)
+        ]
+        ring.append(ring[0])
+        polygons.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+                "properties": {"bucket": bucket},
+            }
+        )
+    return polygons
+
+
+def synthetic_tree(lat: float, lon: float, limit_meters: float, steps: int) -> str:
+    """
+    Nodes on a regular grid around the point, each reached in a straight line,
+    as the CSV of the /spt endpoint
+    """
+    spacing = limit_meters / steps
+    lines = ["longitude,latitude,time,distance"]
+    for row in range(-steps, steps + 1):
+        for column in range(-steps, steps + 1):
+            distance = spacing * hypot(row, column)
+            if distance > limit_meters:
+                continue
+            node_lon = lon + column * spacing / METERS_PER_DEGREE / cos(radians(lat))
+            node_lat = lat + row * spacing / METERS_PER_DEGREE
+            time_ms = round(1000 * distance / METERS_PER_SECOND)
+            lines.append(f"{node_lon},{node_lat},{time_ms},{distance}")
+    return "\n".join(lines) + "\n"
+
+
+class StandInServer:
+    """
+    Serves synthetic isochrones at http://127.0.0.1:<port>/isochrone, and
+    synthetic shortest path trees at /spt.
+
+    Each response is delayed by latency seconds, each polygon has the given
+    number of vertices, and the given share of requests fails with
+    error_status, optionally telling the client to retry after some seconds.
+    Connections are kept alive, and responses are gzip compressed if the
+    client accepts it.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        vertices: int = 64,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        retry_after: Optional[int] = None,
+        seed: int = 0,
+    ) -> None:
+        self.latency = latency
+        self.vertices = vertices
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.request_count = 0
+        self.connection_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "StandInServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:  # noqa ANN002
+        self.stop()
+
+    def _respond(self, endpoint: str, query: Dict[str, List[str]]) -> Dict:
+        with self._lock:
+            self.request_count += 1
+            failed = self._random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            return {"status": self.error_status, "message": "Synthetic failure"}
+        try:
+            lat, lon = (float(coord) for coord in query["point"][0].split(","))
+        except (KeyError, ValueError):
+            return {"status": 400, "message": "Specify a valid point"}
+        buckets = int(query.get("buckets", ["1"])[0])
+        time_limit = float(query.get("time_limit", ["600"])[0])
+        if time_limit < 0:
+            limit_meters = float(query["distance_limit"][0])
+        else:
+            limit_meters = time_limit * METERS_PER_SECOND
+        if endpoint == "spt":
+            return {"status": 200, "csv": synthetic_tree(lat, lon, limit_meters, 10)}
+        return {
+            "status": 200,
+            "polygons": synthetic_isochrones(
+                lat, lon, limit_meters, buckets, self.vertices
+            ),
+        }
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keeps the connection alive between requests
+            protocol_version = "HTTP/1.1"
+
+            def setup(self) -> None:
+                super().setup()
+                with server._lock:
+                    server.connection_count += 1
+
+            def do_GET(self) -> None:  # noqa N802
+                url = urlparse(self.path)
+                endpoint = url.path.rstrip("/").split("/")[-1]
+                if endpoint not in ("isochrone", "spt"):
+                    response = {"status": 404, "message": "Not found"}
+                else:
+                    response = server._respond(endpoint, parse_qs(url.query))
+                status = response.pop("status")
+                if "csv" in response:
+                    body = response["csv"].encode("utf-8")
+                    content_type = "text/csv"
+                else:
+                    body = json.dumps(response).encode("utf-8")
+                    content_type = "application/json"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                if status != 200 and server.retry_after is not None:
+                    self.send_header("Retry-After", str(server.retry_after))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:  # noqa ANN002
+                pass
+
+        return Handler
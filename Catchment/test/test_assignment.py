@@ -0,0 +1,14 @@
+from qgis.core import QgsPointXY
+
+from Catchment.core.assignment import CatchmentIndex
+
+
+def test_catchment_index(catchment_layer):
+    index = CatchmentIndex(catchment_layer, "original_fid")
+    assert index.assign(QgsPointXY(1, 1)) == ([1], 15)
+    assert index.assign(QgsPointXY(3.5, 1)) == ([1, 2], 30)
+    assert index.assign(QgsPointXY(5, 1)) == ([2], 30)
+    assert index.assign(QgsPointXY(10, 10)) == ([], None)
+    assert index.assign(QgsPointXY(11, 1)) == ([3], 45)
+    # the point is in the bounding box, but outside the triangle
+    assert index.assign(QgsPointXY(17, 7)) == ([], None)
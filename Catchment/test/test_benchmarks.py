@@ -0,0 +1,160 @@
+"""
+Benchmarks for the isochrone pipeline. These are slow, so they are only run
+when the CATCHMENT_BENCHMARKS environment variable is set, e.g.
+
+    CATCHMENT_BENCHMARKS=1 pytest -s Catchment/test/test_benchmarks.py
+
+With CATCHMENT_BENCHMARKS=small, they run quickly with a few features, which
+CI does to keep them working.
+"""
+
+import json
+import os
+import time
+import tracemalloc
+
+import pytest
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsVectorLayer
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from Catchment.core.geometry import geometry_from_geojson
+from Catchment.core.isochrone_creator import FEATURE_BATCH_SIZE, IsochroneCreator
+
+from .conftest import add_points
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("CATCHMENT_BENCHMARKS"),
+    reason="benchmarks are only run if CATCHMENT_BENCHMARKS is set",
+)
+
+SMALL = os.environ.get("CATCHMENT_BENCHMARKS") == "small"
+POLYGON_COUNT = 500 if SMALL else 50000
+POINT_COUNTS = [10, 100] if SMALL else [100, 1000, 10000]
+# stand-in server settings for the throughput benchmarks
+SERVER_LATENCY = 0.02
+SERVER_VERTICES = 200
+CONCURRENT_REQUESTS = 8
+
+
+def report(name: str, seconds: float, count: int) -> None:
+    print(
+        f"\n{name}: {count} features in {seconds:.2f} s, "
+        f"{1e6 * seconds / count:.1f} µs per feature"
+    )
+
+
+@pytest.fixture(scope="module")
+def isochrone_geojson(request) -> dict:
+    with open(os.path.join(request.fspath.dirname, "fixtures", "isochrones.json")) as f:
+        return json.load(f)["polygons"][0]["geometry"]
+
+
+@pytest.fixture(scope="module")
+def isochrone_geometry(isochrone_geojson) -> QgsGeometry:
+    return geometry_from_geojson(isochrone_geojson)
+
+
+def polygon_features(layer: QgsVectorLayer, geometry: QgsGeometry) -> list:
+    features = []
+    for _ in range(POLYGON_COUNT):
+        feature = QgsFeature(layer.fields())
+        feature.setGeometry(geometry)
+        features.append(feature)
+    return features
+
+
+def test_benchmark_single_feature_insert(isochrone_geometry):
+    layer = QgsVectorLayer("Polygon?crs=epsg:4326&index=yes", "single", "memory")
+    features = polygon_features(layer, isochrone_geometry)
+    start = time.perf_counter()
+    for feature in features:
+        layer.dataProvider().addFeature(feature)
+    report("addFeature with index", time.perf_counter() - start, len(features))
+    assert layer.featureCount() == POLYGON_COUNT
+
+
+def test_benchmark_batch_feature_insert(isochrone_geometry):
+    layer = QgsVectorLayer("Polygon?crs=epsg:4326", "batch", "memory")
+    features = polygon_features(layer, isochrone_geometry)
+    start = time.perf_counter()
+    for i in range(0, len(features), FEATURE_BATCH_SIZE):
+        layer.dataProvider().addFeatures(features[i : i + FEATURE_BATCH_SIZE])
+    layer.dataProvider().createSpatialIndex()
+    report("addFeatures in batches", time.perf_counter() - start, len(features))
+    assert layer.featureCount() == POLYGON_COUNT
+
+
+def test_benchmark_point_list_geometry(isochrone_geojson):
+    start = time.perf_counter()
+    for _ in range(POLYGON_COUNT):
+        QgsGeometry.fromPolygonXY(
+            [
+                [QgsPointXY(pt[0], pt[1]) for pt in ring]
+                for ring in isochrone_geojson["coordinates"]
+            ]
+        )
+    report("fromPolygonXY", time.perf_counter() - start, POLYGON_COUNT)
+
+
+def test_benchmark_wkb_geometry(isochrone_geojson):
+    start = time.perf_counter()
+    for _ in range(POLYGON_COUNT):
+        geometry_from_geojson(isochrone_geojson)
+    report("geometry_from_geojson", time.perf_counter() - start, POLYGON_COUNT)
+
+
+def test_benchmark_isochrone_layer(isochrone_opts, mock_fetch, point_feature):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    isochrone_opts.layer.dataProvider().addFeatures(
+        [point_feature] * (POLYGON_COUNT - 1)
+    )
+    start = time.perf_counter()
+    creator = IsochroneCreator(isochrone_opts)
+    isochrone_layer = creator.create_isochrone_layer()
+    report("create_isochrone_layer", time.perf_counter() - start, POLYGON_COUNT)
+    print(creator.metrics.summary())
+    assert isochrone_layer.featureCount() == POLYGON_COUNT
+
+
+@pytest.mark.parametrize("point_count", POINT_COUNTS)
+def test_benchmark_stand_in_server(point_count, isochrone_opts, stand_in_server):
+    server = stand_in_server(latency=SERVER_LATENCY, vertices=SERVER_VERTICES)
+    # a grid of distinct points, so that no requests are merged
+    add_points(
+        isochrone_opts.layer,
+        [
+            (i + 1, QgsPointXY(1.0 + (i % 100) / 100, 1.0 + i // 100 / 100))
+            for i in range(1, point_count)
+        ],
+        name="school",
+    )
+    isochrone_opts.url = server.url
+    isochrone_opts.max_concurrent_requests = CONCURRENT_REQUESTS
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    creator = IsochroneCreator(isochrone_opts)
+    created = time.perf_counter()
+    isochrone_layer = creator.create_isochrone_layer()
+    finished = time.perf_counter()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"\n{point_count} points, {SERVER_LATENCY * 1000:.0f} ms latency, "
+        f"{SERVER_VERTICES} vertices, {CONCURRENT_REQUESTS} concurrent requests: "
+        f"{point_count / (finished - start):.1f} points per second"
+    )
+    print(f"constructor: {created - start:.3f} s, run: {finished - created:.2f} s")
+    # time in each phase of the run, and the request latencies
+    print(creator.metrics.summary())
+    print(f"peak Python memory: {peak_memory / 1024 / 1024:.1f} MB")
+    if resource:
+        # kilobytes on Linux, bytes on macOS
+        print(f"max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}")
+    assert server.request_count == point_count
+    assert isochrone_layer.featureCount() == point_count
@@ -0,0 +1,60 @@
+from qgis.core import (
+    QgsFeature,
+    QgsGeometry,
+    QgsRectangle,
+    QgsVectorLayer,
+    QgsWkbTypes,
+)
+
+from Catchment.core.coverage import (
+    coverage_features,
+    coverage_fields,
+    create_coverage_layer,
+    union_geometries,
+)
+
+
+def squares(distance, count):
+    """Overlapping unit squares, each shifted half a unit to the right"""
+    features = []
+    for i in range(count):
+        feature = QgsFeature(coverage_fields())
+        feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(i / 2, 0, i / 2 + 1, 1)))
+        feature["isochrone_distance"] = distance
+        features.append(feature)
+    return features
+
+
+def test_union_geometries():
+    union = union_geometries([feature.geometry() for feature in squares(30, 100)])
+    assert union.isGeosValid()
+    assert union.area() == 50.5
+    assert union.boundingBox() == QgsRectangle(0, 0, 50.5, 1)
+
+
+def test_coverage_features():
+    features = coverage_features(
+        squares(30, 10) + squares(15, 3) + squares(30, 10), coverage_fields()
+    )
+    assert [feature["isochrone_distance"] for feature in features] == [15, 30]
+    assert [feature["isochrones"] for feature in features] == [3, 20]
+    assert [feature.geometry().area() for feature in features] == [2, 5.5]
+    assert features[0].geometry().wkbType() == QgsWkbTypes.MultiPolygon
+
+
+def test_create_coverage_layer(tmp_path):
+    isochrone_layer = QgsVectorLayer("Polygon?crs=epsg:4326", "isochrones", "memory")
+    isochrone_layer.dataProvider().addAttributes(coverage_fields())
+    isochrone_layer.updateFields()
+    isochrone_layer.dataProvider().addFeatures(squares(15, 3) + squares(30, 5))
+
+    coverage_layer = create_coverage_layer(isochrone_layer, "coverage")
+    assert coverage_layer.providerType() == "memory"
+    assert coverage_layer.featureCount() == 2
+
+    coverage_layer = create_coverage_layer(isochrone_layer, "coverage", str(tmp_path))
+    assert coverage_layer.providerType() == "ogr"
+    assert (tmp_path / "coverage.gpkg").exists()
+    assert sorted(
+        feature["isochrones"] for feature in coverage_layer.getFeatures()
+    ) == [3, 5]
@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+from qgis.core import QgsGeometry, QgsPointXY, QgsWkbTypes
+
+from Catchment.core.geometry import (
+    geometry_from_geojson,
+    polygon_rings,
+    simplify_geometry,
+)
+
+EXTERIOR = [[0.0, 0.0], [10.0, 0.0], [10.0, 10.0], [0.0, 10.0], [0.0, 0.0]]
+INTERIOR = [[2.0, 2.0], [2.0, 4.0], [4.0, 4.0], [4.0, 2.0], [2.0, 2.0]]
+
+
+def test_geometry_from_geojson_keeps_interior_rings():
+    geometry = geometry_from_geojson(
+        {"type": "Polygon", "coordinates": [EXTERIOR, INTERIOR]}
+    )
+    assert geometry.wkbType() == QgsWkbTypes.Polygon
+    assert geometry.constGet().numInteriorRings() == 1
+    assert geometry.area() == 96
+
+
+def test_geometry_from_geojson_fixture(request):
+    with open(os.path.join(request.fspath.dirname, "fixtures", "isochrones.json")) as f:
+        geojson = json.load(f)["polygons"][0]["geometry"]
+    expected = QgsGeometry.fromPolygonXY(
+        [[QgsPointXY(pt[0], pt[1]) for pt in ring] for ring in geojson["coordinates"]]
+    )
+    assert geometry_from_geojson(geojson).equals(expected)
+
+
+def test_simplify_geometry(request):
+    with open(os.path.join(request.fspath.dirname, "fixtures", "isochrones.json")) as f:
+        geometry = geometry_from_geojson(json.load(f)["polygons"][0]["geometry"])
+    simplified = simplify_geometry(geometry, 0.0001)
+    assert simplified.isGeosValid()
+    assert 3 < simplified.constGet().nCoordinates() < geometry.constGet().nCoordinates()
+    # snapped to a tenth of the tolerance
+    for vertex in simplified.vertices():
+        assert round(vertex.x() / 0.00001) * 0.00001 == pytest.approx(
+            vertex.x(), abs=1e-9
+        )
+
+
+def test_simplify_geometry_narrow_slit():
+    # rounding to the grid closes the slit, so that the ring touches itself
+    geometry = QgsGeometry.fromWkt(
+        "POLYGON((0 0, 10 0, 10 4.98, 5 4.98, 5 5.02, 10 5.02, 10 10, 0 10, 0 0))"
+    )
+    assert geometry.isGeosValid()
+    simplified = simplify_geometry(geometry, 1)
+    assert simplified.isGeosValid()
+    assert simplified.wkbType() == QgsWkbTypes.Polygon
+    assert simplified.area() == pytest.approx(100, abs=0.5)
+
+
+def test_polygon_rings():
+    rings = polygon_rings(
+        geometry_from_geojson({"type": "Polygon", "coordinates": [EXTERIOR, INTERIOR]})
+    )
+    assert [ring.shape for ring in rings] == [(5, 2), (5, 2)]
+    assert rings[1][1].tolist() == [2, 4]
+    rings = polygon_rings(
+        QgsGeometry.fromWkt(
+            "MULTIPOLYGON(((0 0, 1 0, 1 1, 0 0)), ((2 2, 3 2, 3 3, 2 2)))"
+        )
+    )
+    assert [ring[0].tolist() for ring in rings] == [[0, 0], [2, 2]]
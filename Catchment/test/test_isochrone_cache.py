@@ -0,0 +1,86 @@
+import sqlite3
+from itertools import count
+
+from Catchment.core.isochrone_cache import IsochroneCache
+from Catchment.core.isochrone_creator import IsochroneCreator
+
+URL = "http://mock.url/isochrone"
+PARAMS = {
+    "profile": "hike",
+    "buckets": 1,
+    "reverse_flow": True,
+    "time_limit": 1800,
+    "point": "1.0,1.0",
+}
+
+
+def test_cache_get_and_put(tmp_path):
+    cache = IsochroneCache(str(tmp_path / "cache.sqlite"))
+    assert cache.get(URL, PARAMS) is None
+    cache.put(URL, PARAMS, '{"polygons": []}')
+    # coordinates are rounded and the api key is ignored
+    same_request = {**PARAMS, "point": "1.00000001,1.0", "key": "secret"}
+    assert cache.get(URL, same_request) == '{"polygons": []}'
+    assert cache.get(URL, {**PARAMS, "time_limit": 600}) is None
+    assert cache.hits == 1
+    assert cache.misses == 2
+    cache.clear()
+    assert cache.get(URL, PARAMS) is None
+
+
+def test_cache_evicts_least_recently_used(tmp_path, mocker):
+    # make sure timestamps are strictly increasing on all platforms
+    mocker.patch("Catchment.core.isochrone_cache.time").time.side_effect = count()
+    cache = IsochroneCache(str(tmp_path / "cache.sqlite"))
+    cache.max_size = 1000
+    cache.put(URL, PARAMS, bytes(range(256)).hex())
+    for i in range(2, 12):
+        params = {**PARAMS, "point": f"{i},2.0"}
+        cache.put(URL, params, bytes(range(256)).hex())
+        # keep the first response in use
+        assert cache.get(URL, PARAMS) is not None
+    assert cache._size <= cache.max_size
+    assert cache.get(URL, {**PARAMS, "point": "2,2.0"}) is None
+    assert cache.get(URL, {**PARAMS, "point": "11,2.0"}) is not None
+
+
+def test_cache_errors_are_misses(tmp_path):
+    cache = IsochroneCache(str(tmp_path / "cache.sqlite"))
+    cache.put(URL, PARAMS, '{"polygons": []}')
+    # e.g. the database is locked by another process
+    cache._connection.close()
+    assert cache.get(URL, PARAMS) is None
+    assert cache.misses == 1
+    cache.put(URL, PARAMS, '{"polygons": []}')
+
+
+def test_isochrone_layer_cache_error_uses_network(isochrone_opts, mock_fetch, mocker):
+    mocker.patch(
+        "Catchment.core.isochrone_creator.IsochroneCache",
+        side_effect=sqlite3.OperationalError("unable to open database file"),
+    )
+    isochrone_opts.use_cache = True
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    creator = IsochroneCreator(isochrone_opts)
+    assert creator.create_isochrone_layer().featureCount() == 1
+    assert creator.cache is None
+
+
+def test_isochrone_layer_cache_skips_network(
+    isochrone_opts, mock_fetch, mocker, tmp_path
+):
+    mocker.patch(
+        "Catchment.core.isochrone_creator.IsochroneCache",
+        side_effect=lambda **kwargs: IsochroneCache(
+            str(tmp_path / "cache.sqlite"), **kwargs
+        ),
+    )
+    isochrone_opts.use_cache = True
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    # cached responses must not hit the network at all
+    mock_fetch("another.url")
+    creator = IsochroneCreator(isochrone_opts)
+    isochrone_layer = creator.create_isochrone_layer()
+    assert isochrone_layer.featureCount() == 1
+    assert creator.cache.hits == 1
@@ -1,9 +1,30 @@
+import json
+import sqlite3
+import threading
+import time
+from math import isclose
+
 import pytest
-from qgis.core import QgsWkbTypes
+from PyQt5.QtNetwork import QNetworkReply
+from qgis.core import (
+    QgsGeometry,
+    QgsPointXY,
+    QgsVectorLayer,
+    QgsWkbTypes,
+)
 
-from Catchment.core.isochrone_creator import IsochroneCreator
+from Catchment.core import isochrone_creator
+from Catchment.core.checkpoint import RunCheckpoint
+from Catchment.core.isochrone_creator import (
+    InvalidDistancesException,
+    IsochroneCreator,
+    parse_distances,
+)
+from Catchment.core.network import CircuitBreaker, NetworkRequestException
+from Catchment.definitions.constants import Engine
 
 from ..qgis_plugin_tools.tools.exceptions import QgsPluginNetworkException
+from .conftest import add_points, points_in_row
 
 
 def test_isochrone_layer_isochrone_created(isochrone_opts, mock_fetch):
@@ -33,3 +54,518 @@ def test_isochrone_layer_request_failed(isochrone_opts, mock_fetch):
     assert isochrone_opts.check_if_opts_set()
     with pytest.raises(QgsPluginNetworkException):
         isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+
+
+def test_isochrone_layer_concurrent_requests(isochrone_opts, mocker):
+    lock = threading.Lock()
+    in_flight = [0]
+    most_in_flight = [0]
+
+    def square_fetch(url, params=None, session=None):
+        """A square around the point, the later points respond sooner"""
+        lat, lon = (float(coord) for coord in params["point"].split(","))
+        with lock:
+            in_flight[0] += 1
+            most_in_flight[0] = max(most_in_flight[0], in_flight[0])
+        time.sleep(0.1 - (lon - 1.0))
+        with lock:
+            in_flight[0] -= 1
+        ring = [
+            [lon - 0.001, lat - 0.001],
+            [lon + 0.001, lat - 0.001],
+            [lon + 0.001, lat + 0.001],
+            [lon - 0.001, lat + 0.001],
+            [lon - 0.001, lat - 0.001],
+        ]
+        return json.dumps(
+            {
+                "polygons": [
+                    {
+                        "type": "Feature",
+                        "geometry": {"type": "Polygon", "coordinates": [ring]},
+                        "properties": {"bucket": 0},
+                    }
+                ]
+            }
+        )
+
+    mocker.patch.object(isochrone_creator, "fetch", new=square_fetch)
+    points = dict(points_in_row(9))
+    add_points(isochrone_opts.layer, points.items(), name="school {}")
+    points[1] = QgsPointXY(1.0, 1.0)
+    isochrone_opts.max_concurrent_requests = 4
+    assert isochrone_opts.layer.featureCount() == 10
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert most_in_flight[0] == 4
+    assert isochrone_layer.featureCount() == 10
+    ids = set()
+    for feature in isochrone_layer.getFeatures():
+        fid = feature.attribute("original_fid")
+        ids.add(fid)
+        # responses arrive out of order, each still gets the attributes of its point
+        assert feature.attribute("name") == ("school" if fid == 1 else f"school {fid}")
+        assert feature.geometry().contains(QgsGeometry.fromPointXY(points[fid]))
+        assert feature.attribute("isochrone_distance") == 30
+    assert ids == set(points)
+
+
+def test_isochrone_layer_duplicate_points(isochrone_opts, mock_fetch, mocker):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    spy = mocker.spy(isochrone_creator, "fetch")
+    # one point at the same location and one point roughly 5 meters away
+    add_points(
+        isochrone_opts.layer,
+        [(2, QgsPointXY(1.0, 1.0)), (3, QgsPointXY(1.00004, 1.0))],
+    )
+
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert spy.call_count == 2
+    assert isochrone_layer.featureCount() == 3
+
+    spy.reset_mock()
+    isochrone_opts.snap_tolerance = 10
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert spy.call_count == 1
+    # every feature still gets its own isochrone with its own attributes
+    assert sorted(
+        feature.attribute("original_fid") for feature in isochrone_layer.getFeatures()
+    ) == [1, 2, 3]
+
+
+def test_isochrone_layer_snaps_by_distance(isochrone_opts, mock_fetch, mocker):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    spy = mocker.spy(isochrone_creator, "fetch")
+    isochrone_opts.snap_tolerance = 10
+    # about 1 m apart on both sides of a cell edge, and a point 13 m away
+    edge = 10000 * isochrone_opts.snap_tolerance / isochrone_creator.METERS_PER_DEGREE
+    add_points(
+        isochrone_opts.layer,
+        [
+            (2, QgsPointXY(1.0, edge - 0.000004)),
+            (3, QgsPointXY(1.0, edge + 0.000004)),
+            (4, QgsPointXY(1.00012, edge + 0.000004)),
+        ],
+    )
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert spy.call_count == 3
+    assert isochrone_layer.featureCount() == 4
+    assert isclose(isochrone_creator.meters_between((1.0, 1.0), (1.0, 1.0001)), 11.132)
+
+
+def test_isochrone_layer_coverage(isochrone_opts, mock_fetch):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    add_points(isochrone_opts.layer, [(2, QgsPointXY(1.0, 1.0))])
+    isochrone_opts.coverage = True
+    creator = IsochroneCreator(isochrone_opts)
+    isochrone_layer = creator.create_isochrone_layer()
+    assert isochrone_layer.featureCount() == 2
+    # both points get the same isochrone, which is covered only once
+    assert creator.coverage_layer.featureCount() == 1
+    coverage = next(creator.coverage_layer.getFeatures())
+    assert coverage.attribute("isochrone_distance") == 30
+    assert coverage.attribute("isochrones") == 2
+    isochrone = next(isochrone_layer.getFeatures())
+    assert coverage.geometry().area() == pytest.approx(isochrone.geometry().area())
+
+
+def test_parse_distances():
+    assert parse_distances("15, 30 45;60") == [15, 30, 45, 60]
+    assert parse_distances(" ") == []
+    with pytest.raises(InvalidDistancesException):
+        parse_distances("15, half an hour")
+
+
+def test_request_limit_and_buckets(isochrone_opts):
+    assert isochrone_opts.get_request_limit_and_buckets() == (30, 1)
+    isochrone_opts.distances = [60, 15, 45, 30]
+    assert isochrone_opts.get_distances() == [15, 30, 45, 60]
+    assert isochrone_opts.get_request_limit_and_buckets() == (60, 4)
+    isochrone_opts.distances = [10, 25, 60]
+    assert isochrone_opts.get_request_limit_and_buckets() == (60, 12)
+    isochrone_opts.distances = [1, 60]
+    with pytest.raises(InvalidDistancesException):
+        isochrone_opts.get_request_limit_and_buckets()
+    assert not isochrone_opts.check_if_opts_set()
+
+
+def test_isochrone_layer_multiple_distances(isochrone_opts, mock_fetch, mocker):
+    mock_fetch(isochrone_opts.url + "/isochrone", "isochrones_buckets.json")
+    spy = mocker.spy(isochrone_creator, "fetch")
+    isochrone_opts.distances = [30, 60]
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    # both distances are fetched with a single request
+    assert spy.call_count == 1
+    params = spy.call_args[1]["params"]
+    assert params["time_limit"] == 3600
+    assert params["buckets"] == 2
+    # only the buckets at the requested distances are kept
+    assert sorted(
+        feature.attribute("isochrone_distance")
+        for feature in isochrone_layer.getFeatures()
+    ) == [30, 60]
+
+
+def test_isochrone_layer_written_to_geopackage(isochrone_opts, mock_fetch, tmp_path):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    isochrone_opts.write_to_directory = True
+    isochrone_opts.directory = str(tmp_path)
+    creator = IsochroneCreator(isochrone_opts)
+    isochrone_layer = creator.create_isochrone_layer()
+    assert isochrone_layer.providerType() == "ogr"
+    assert (tmp_path / f"{creator.name}.gpkg").exists()
+    assert isochrone_layer.featureCount() == 1
+    for feature in isochrone_layer.getFeatures():
+        assert feature.attribute("original_fid") == 1
+        assert feature.attribute("name") == "school"
+        assert feature.attribute("isochrone_distance") == 30
+
+
+def test_isochrone_layer_resumed(isochrone_opts, mock_fetch, mocker, tmp_path):
+    mocker.patch("Catchment.core.isochrone_creator.FEATURE_BATCH_SIZE", 1)
+    add_points(isochrone_opts.layer, [(2, QgsPointXY(2.0, 1.0))])
+    isochrone_opts.write_to_directory = True
+    isochrone_opts.directory = str(tmp_path)
+
+    # the server goes down before the second point is fetched
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    working_fetch = isochrone_creator.fetch
+
+    def failing_fetch(url, params=None, session=None):
+        if params["point"] == "1.0,2.0":
+            raise QgsPluginNetworkException("Server down")
+        return working_fetch(url, params=params, session=session)
+
+    mocker.patch("Catchment.core.isochrone_creator.fetch", new=failing_fetch)
+    with pytest.raises(QgsPluginNetworkException):
+        IsochroneCreator(isochrone_opts).create_isochrone_layer()
+
+    # running the same job again only fetches the missing point
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    spy = mocker.spy(isochrone_creator, "fetch")
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert spy.call_count == 1
+    assert sorted(
+        feature.attribute("original_fid") for feature in isochrone_layer.getFeatures()
+    ) == [1, 2]
+
+
+def test_isochrone_layer_resumed_after_crash(
+    isochrone_opts, mock_fetch, mocker, tmp_path
+):
+    mocker.patch("Catchment.core.isochrone_creator.FEATURE_BATCH_SIZE", 1)
+    add_points(isochrone_opts.layer, [(2, QgsPointXY(2.0, 1.0))])
+    isochrone_opts.write_to_directory = True
+    isochrone_opts.directory = str(tmp_path)
+    mock_fetch(isochrone_opts.url + "/isochrone")
+
+    # the run crashes after writing the second point, before saving it
+    mark_finished = RunCheckpoint.mark_finished
+    calls = []
+
+    def crashing_mark_finished(checkpoint, *args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError("Crashed")
+        return mark_finished(checkpoint, *args, **kwargs)
+
+    mocker.patch.object(RunCheckpoint, "mark_finished", new=crashing_mark_finished)
+    with pytest.raises(RuntimeError):
+        IsochroneCreator(isochrone_opts).create_isochrone_layer()
+
+    # the isochrone of the second point is not saved twice
+    spy = mocker.spy(isochrone_creator, "fetch")
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert spy.call_count == 1
+    assert sorted(
+        feature.attribute("original_fid") for feature in isochrone_layer.getFeatures()
+    ) == [1, 2]
+
+
+def test_isochrone_layer_not_resumed_for_other_selection(
+    isochrone_opts, mock_fetch, mocker, tmp_path
+):
+    mocker.patch("Catchment.core.isochrone_creator.FEATURE_BATCH_SIZE", 1)
+    layer = isochrone_opts.layer
+    add_points(layer, [(id_, QgsPointXY(id_, 1.0)) for id_ in [2, 3]], name="school {}")
+    fids = {feature["id"]: feature.id() for feature in layer.getFeatures()}
+    isochrone_opts.selected_only = True
+    isochrone_opts.write_to_directory = True
+    isochrone_opts.directory = str(tmp_path)
+
+    # the run on the first selection fails before the second point is fetched
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    working_fetch = isochrone_creator.fetch
+
+    def failing_fetch(url, params=None, session=None):
+        if params["point"] == "1.0,2.0":
+            raise QgsPluginNetworkException("Server down")
+        return working_fetch(url, params=params, session=session)
+
+    mocker.patch("Catchment.core.isochrone_creator.fetch", new=failing_fetch)
+    layer.selectByIds([fids[2], fids[1]])
+    with pytest.raises(QgsPluginNetworkException):
+        IsochroneCreator(isochrone_opts).create_isochrone_layer()
+
+    # a run on another selection starts over in the same file
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    spy = mocker.spy(isochrone_creator, "fetch")
+    layer.selectByIds([fids[3], fids[1]])
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert spy.call_count == 2
+    assert sorted(
+        feature.attribute("original_fid") for feature in isochrone_layer.getFeatures()
+    ) == [1, 3]
+
+
+def test_isochrone_layer_without_checkpoint(
+    isochrone_opts, mock_fetch, mocker, tmp_path
+):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    isochrone_opts.write_to_directory = True
+    isochrone_opts.directory = str(tmp_path)
+    mocker.patch(
+        "Catchment.core.isochrone_creator.RunCheckpoint",
+        side_effect=sqlite3.OperationalError("database is locked"),
+    )
+    creator = IsochroneCreator(isochrone_opts)
+    isochrone_layer = creator.create_isochrone_layer()
+    assert creator.checkpoint is None
+    assert isochrone_layer.providerType() == "ogr"
+    assert isochrone_layer.featureCount() == 1
+
+
+def test_isochrone_layer_unwritable_directory(isochrone_opts, mock_fetch, tmp_path):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    isochrone_opts.write_to_directory = True
+    isochrone_opts.directory = str(tmp_path / "missing")
+    # the result is kept in memory instead
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert isochrone_layer.providerType() == "memory"
+    assert isochrone_layer.featureCount() == 1
+
+
+def test_isochrone_layer_updated(isochrone_opts, mock_fetch, mocker, tmp_path):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    provider = isochrone_opts.layer.dataProvider()
+    add_points(
+        isochrone_opts.layer,
+        [(id_, QgsPointXY(id_, 1.0)) for id_ in [2, 3]],
+        name="school",
+    )
+    isochrone_opts.write_to_directory = True
+    isochrone_opts.directory = str(tmp_path)
+    isochrone_opts.update_existing = True
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert isochrone_layer.featureCount() == 3
+
+    # the first school is renamed, the second moved and the third closed
+    fids = {feature["id"]: feature.id() for feature in provider.getFeatures()}
+    provider.changeAttributeValues({fids[1]: {1: "renamed"}})
+    provider.changeGeometryValues(
+        {fids[2]: QgsGeometry.fromPointXY(QgsPointXY(2.0, 2.0))}
+    )
+    provider.deleteFeatures([fids[3]])
+    add_points(isochrone_opts.layer, [(4, QgsPointXY(4.0, 1.0))], name="new school")
+
+    # only the moved and the new school are fetched
+    spy = mocker.spy(isochrone_creator, "fetch")
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert sorted(call[1]["params"]["point"] for call in spy.call_args_list) == [
+        "1.0,4.0",
+        "2.0,2.0",
+    ]
+    assert {
+        feature["original_fid"]: feature["name"]
+        for feature in isochrone_layer.getFeatures()
+    } == {1: "renamed", 2: "school", 4: "new school"}
+
+    # without changes, nothing is fetched
+    spy.reset_mock()
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert spy.call_count == 0
+    assert isochrone_layer.featureCount() == 3
+
+
+def test_isochrone_layer_updated_other_selection(
+    isochrone_opts, mock_fetch, mocker, tmp_path
+):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    layer = isochrone_opts.layer
+    add_points(layer, [(id_, QgsPointXY(id_, 1.0)) for id_ in [2, 3]], name="school {}")
+    fids = {feature["id"]: feature.id() for feature in layer.getFeatures()}
+    isochrone_opts.selected_only = True
+    isochrone_opts.write_to_directory = True
+    isochrone_opts.directory = str(tmp_path)
+    isochrone_opts.update_existing = True
+    layer.selectByIds([fids[1], fids[2]])
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert isochrone_layer.featureCount() == 2
+
+    # the second school is not taken as removed, nor the third as new
+    spy = mocker.spy(isochrone_creator, "fetch")
+    layer.selectByIds([fids[1], fids[3]])
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert spy.call_count == 2
+    assert sorted(
+        feature.attribute("original_fid") for feature in isochrone_layer.getFeatures()
+    ) == [1, 3]
+
+    # the same selection is updated again
+    spy.reset_mock()
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert spy.call_count == 0
+    assert isochrone_layer.featureCount() == 2
+
+
+def test_isochrone_layer_feature_ids(isochrone_opts, mock_fetch):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    fids = add_points(isochrone_opts.layer, [(2, QgsPointXY(2.0, 1.0))])
+    isochrone_opts.feature_ids = [fids[2]]
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert isochrone_layer.featureCount() == 1
+    for isochrone in isochrone_layer.getFeatures():
+        assert isochrone.attribute("original_fid") == 2
+
+
+def test_isochrone_layer_simplified(isochrone_opts, mock_fetch):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    isochrone_opts.simplify_tolerance = 10
+    creator = IsochroneCreator(isochrone_opts)
+    isochrone_layer = creator.create_isochrone_layer()
+    assert isochrone_layer.featureCount() == 1
+    assert 0 < creator.metrics.vertices_written < creator.metrics.vertices_received
+    for feature in isochrone_layer.getFeatures():
+        assert feature.geometry().isGeosValid()
+
+
+def test_isochrone_layer_transformed_points(isochrone_opts, mock_fetch, mocker, fields):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    spy = mocker.spy(isochrone_creator, "fetch")
+    layer = QgsVectorLayer("Point?crs=epsg:3857", "mercator_points", "memory")
+    layer.dataProvider().addAttributes(fields)
+    layer.updateFields()
+    # roughly 1,1 in WGS 84
+    add_points(layer, [(1, QgsPointXY(111319.49, 111325.14))])
+    isochrone_opts.layer = layer
+
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert isochrone_layer.featureCount() == 1
+    lat, lon = (
+        float(coord) for coord in spy.call_args[1]["params"]["point"].split(",")
+    )
+    assert lat == pytest.approx(1.0, abs=1e-6)
+    assert lon == pytest.approx(1.0, abs=1e-6)
+
+
+def test_isochrone_layer_selected_features_snapshot(isochrone_opts, mock_fetch):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    layer = isochrone_opts.layer
+    fids = add_points(layer, [(2, QgsPointXY(2.0, 1.0))], name="selected school")
+    layer.select(fids[2])
+    isochrone_opts.selected_only = True
+    creator = IsochroneCreator(isochrone_opts)
+    # changes after the task is created are not included in the run
+    layer.removeSelection()
+    add_points(layer, [(3, QgsPointXY(2.0, 1.0))], name="selected school")
+
+    isochrone_layer = creator.create_isochrone_layer()
+    assert creator.point_count == 1
+    assert isochrone_layer.featureCount() == 1
+    for isochrone in isochrone_layer.getFeatures():
+        assert isochrone.attribute("original_fid") == 2
+        assert isochrone.attribute("name") == "selected school"
+
+
+def test_isochrone_layer_retried(isochrone_opts, mock_fetch, mocker):
+    mocker.patch("Catchment.core.isochrone_creator.RETRY_BASE_DELAY", 0)
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    working_fetch = isochrone_creator.fetch
+    calls = []
+    failures = [2]
+
+    # the server is overloaded for the first requests
+    def overloaded_fetch(url, params=None, session=None):
+        calls.append(params["point"])
+        if len(calls) <= failures[0]:
+            raise NetworkRequestException(
+                "Service unavailable",
+                error=QNetworkReply.ServiceUnavailableError,
+                status_code=503,
+            )
+        return working_fetch(url, params=params, session=session)
+
+    mocker.patch("Catchment.core.isochrone_creator.fetch", new=overloaded_fetch)
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert len(calls) == 3
+    assert isochrone_layer.featureCount() == 1
+
+    # without retries, the request is retried at the end of the run
+    calls.clear()
+    failures[0] = 1
+    isochrone_opts.max_retries = 0
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    assert len(calls) == 2
+    assert isochrone_layer.featureCount() == 1
+
+
+def test_isochrone_layer_stand_in_server(isochrone_opts, stand_in_server, mocker):
+    mocker.patch("Catchment.core.isochrone_creator.RETRY_BASE_DELAY", 0)
+    mocker.patch(
+        "Catchment.core.isochrone_creator.CircuitBreaker",
+        lambda: CircuitBreaker(cooldown=0),
+    )
+    # about a third of the requests fail, but they succeed when retried
+    server = stand_in_server(error_rate=0.3)
+    add_points(isochrone_opts.layer, points_in_row(19))
+    isochrone_opts.url = server.url
+    isochrone_opts.buckets = 2
+    isochrone_opts.max_concurrent_requests = 4
+    isochrone_opts.max_retries = 10
+
+    creator = IsochroneCreator(isochrone_opts)
+    isochrone_layer = creator.create_isochrone_layer()
+    assert server.request_count > 20
+    assert isochrone_layer.featureCount() == 40
+    # each of the request threads keeps its connection open, failures or not
+    assert server.connection_count <= 4
+    assert creator.metrics.connections == server.connection_count
+
+
+def test_isochrone_layer_metrics(isochrone_opts, mock_fetch, tmp_path):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    isochrone_opts.write_to_directory = True
+    isochrone_opts.directory = str(tmp_path)
+    isochrone_opts.write_metrics = True
+    isochrone_opts.profile_run = True
+    creator = IsochroneCreator(isochrone_opts)
+    creator.create_isochrone_layer()
+    assert (tmp_path / f"{creator.name}.prof").exists()
+    with open(tmp_path / f"{creator.name}.metrics.json") as f:
+        metrics = json.load(f)
+    assert metrics["requests"]["count"] == 1
+    assert metrics["features_written"] == 1
+    assert metrics["vertices"]["received"] == 35
+    assert {"read points", "http", "json", "geometry", "write"} <= set(
+        metrics["phase_seconds"]
+    )
+
+
+def test_isochrone_layer_contoured(isochrone_opts, stand_in_server, mocker):
+    server = stand_in_server()
+    spy = mocker.spy(isochrone_creator, "fetch")
+    isochrone_opts.url = server.url
+    isochrone_opts.engine = Engine.SPT
+    # more divisions than the isochrone endpoint supports
+    isochrone_opts.distances = [5, 6, 30]
+    assert isochrone_opts.check_if_opts_set()
+    isochrone_layer = IsochroneCreator(isochrone_opts).create_isochrone_layer()
+    # all distances are contoured from a single tree
+    assert server.request_count == 1
+    assert spy.call_args[0][0].endswith("/spt")
+    assert spy.call_args[1]["params"]["time_limit"] == 1980
+    areas = {
+        feature.attribute("isochrone_distance"): feature.geometry().area()
+        for feature in isochrone_layer.getFeatures()
+    }
+    assert sorted(areas) == [5, 6, 30]
+    assert areas[5] < areas[6] < areas[30]
@@ -0,0 +1,90 @@
+import threading
+import time
+
+from Catchment.core import isochrone_creator, job_queue
+from Catchment.core.isochrone_cache import IsochroneCache
+from Catchment.core.job_queue import IsochroneJobQueue, sweep_opts
+from Catchment.definitions.constants import Profile
+
+from .conftest import add_points, points_in_row
+
+
+def test_sweep_opts(isochrone_opts):
+    jobs = sweep_opts(
+        isochrone_opts, [isochrone_opts.layer], list(Profile), [[15, 30], [60]]
+    )
+    assert len(jobs) == 6
+    assert len({job.get_layer_name() for job in jobs}) == 6
+    assert jobs[0].profile == Profile.WALKING
+    assert jobs[0].distances == [15, 30]
+    # the base options are left as they were
+    assert isochrone_opts.distances == []
+    (job,) = sweep_opts(isochrone_opts, [isochrone_opts.layer], [Profile.DRIVING])
+    assert job.profile == Profile.DRIVING
+    assert job.get_distances() == [30]
+
+
+def test_job_queue_shares_budget_and_cache(
+    isochrone_opts, mock_fetch, mocker, tmp_path
+):
+    mocker.patch.object(
+        job_queue,
+        "IsochroneCache",
+        side_effect=lambda **kwargs: IsochroneCache(
+            str(tmp_path / "cache.sqlite"), **kwargs
+        ),
+    )
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    fetch = isochrone_creator.fetch
+    lock = threading.Lock()
+    in_flight = [0]
+    most_in_flight = [0]
+
+    def slow_fetch(*args, **kwargs):
+        with lock:
+            in_flight[0] += 1
+            most_in_flight[0] = max(most_in_flight[0], in_flight[0])
+        time.sleep(0.05)
+        try:
+            return fetch(*args, **kwargs)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    mocker.patch.object(isochrone_creator, "fetch", new=slow_fetch)
+    add_points(isochrone_opts.layer, points_in_row(9))
+    isochrone_opts.use_cache = True
+    jobs = sweep_opts(isochrone_opts, [isochrone_opts.layer], list(Profile))
+
+    queue = IsochroneJobQueue(jobs, max_concurrent_requests=2)
+    assert queue.parallel_jobs == 2
+    assert queue.run()
+    assert most_in_flight[0] == 2
+    assert queue.results == [True, True, True]
+    for creator in queue.creators:
+        assert creator.opts.max_concurrent_requests == 2
+        assert creator.cache is queue.cache
+        assert len(creator.metrics.latencies) == 10
+    queue.cache.close()
+
+
+def test_job_queue_single_request(isochrone_opts, mock_fetch):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    jobs = sweep_opts(isochrone_opts, [isochrone_opts.layer], list(Profile))
+    # the jobs run one at a time in the thread of the queue
+    queue = IsochroneJobQueue(jobs, max_concurrent_requests=1)
+    assert queue.parallel_jobs == 1
+    assert queue.run()
+    assert queue.failed_jobs == 0
+    assert queue.progress() == 100
+
+
+def test_job_queue_cancelled(isochrone_opts, mock_fetch):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    jobs = sweep_opts(isochrone_opts, [isochrone_opts.layer], list(Profile))
+    queue = IsochroneJobQueue(jobs, max_concurrent_requests=2)
+    queue.cancel()
+    assert all(creator.isCanceled() for creator in queue.creators)
+    assert not queue.run()
+    assert queue.results == [None, None, None]
+    assert queue.failed_jobs == 3
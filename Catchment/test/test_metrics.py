@@ -0,0 +1,35 @@
+import json
+
+from Catchment.core.metrics import RunMetrics, percentile
+
+
+def test_percentile():
+    assert percentile([], 0.5) == 0
+    assert percentile([3, 1, 2], 0.5) == 2
+    assert percentile(list(range(100)), 0.95) == 95
+
+
+def test_run_metrics(tmp_path):
+    metrics = RunMetrics()
+    for _ in range(2):
+        with metrics.phase("http"):
+            pass
+    metrics.record_request(0.05, 100)
+    metrics.record_request(0.3, 200)
+    metrics.record_request(100, 300)
+    metrics.finish()
+
+    assert list(metrics.phases) == ["http"]
+    assert metrics.response_bytes == 600
+    histogram = metrics.latency_histogram()
+    assert histogram["<=0.1s"] == 1
+    assert histogram["<=0.5s"] == 1
+    assert histogram[">60s"] == 1
+    assert sum(histogram.values()) == 3
+    assert "3 requests" in metrics.summary()
+
+    metrics.write(str(tmp_path / "metrics.json"))
+    with open(tmp_path / "metrics.json") as f:
+        written = json.load(f)
+    assert written["requests"]["count"] == 3
+    assert written["requests"]["latency_seconds"]["max"] == 100
@@ -0,0 +1,118 @@
+import json
+from email.utils import formatdate
+from time import time
+
+import pytest
+from PyQt5.QtNetwork import QNetworkReply
+
+from Catchment.core.network import (
+    CircuitBreaker,
+    HttpSession,
+    NetworkRequestException,
+    RetryPolicy,
+    fetch,
+    is_retryable,
+    parse_retry_after,
+)
+
+from ..qgis_plugin_tools.tools.exceptions import QgsPluginNetworkException
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after(formatdate(time() + 60, usegmt=True)) == pytest.approx(
+        60, abs=2
+    )
+    assert parse_retry_after("") is None
+    assert parse_retry_after("soon") is None
+
+
+def test_is_retryable():
+    too_many = NetworkRequestException(
+        "Too many requests", error=QNetworkReply.UnknownContentError, status_code=429
+    )
+    timeout = QgsPluginNetworkException("Timeout", error=QNetworkReply.TimeoutError)
+    bad_request = QgsPluginNetworkException(
+        "Bad request", error=QNetworkReply.ProtocolInvalidOperationError
+    )
+    assert is_retryable(too_many)
+    assert is_retryable(timeout)
+    assert not is_retryable(bad_request)
+
+
+def test_retry_policy_delay():
+    policy = RetryPolicy(base_delay=1, max_delay=5)
+    assert policy.delay(0, retry_after=3) == 3
+    # a server asking to wait for a day is retried after the maximum delay
+    assert policy.delay(0, retry_after=86400) == 5
+    for attempt in range(10):
+        assert 0 <= policy.delay(attempt) <= min(5, 2**attempt)
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    assert not breaker.record_failure()
+    assert breaker.wait_time() == 0
+    assert breaker.record_failure()
+    assert 0 < breaker.wait_time() <= 60
+    # failures during the cooldown don't open the circuit again
+    assert not breaker.record_failure()
+    breaker.record_success()
+    assert breaker.wait_time() == 0
+
+
+def test_session_falls_back_to_http1(mocker):
+    session = HttpSession()
+    reply = mocker.Mock()
+    reply.error.return_value = QNetworkReply.ContentNotFoundError
+    assert not session.fall_back_to_http1(reply)
+    assert session.http2
+    reply.error.return_value = QNetworkReply.ProtocolFailure
+    assert session.fall_back_to_http1(reply)
+    assert not session.http2
+    # HTTP/1.1 requests are not sent again
+    assert not session.fall_back_to_http1(reply)
+    assert not HttpSession(http2=False).fall_back_to_http1(reply)
+
+
+def test_fetch(stand_in_server):
+    server = stand_in_server(vertices=8)
+    response = json.loads(
+        fetch(
+            server.url + "/isochrone",
+            params={"point": "1.0,1.0", "buckets": 2, "time_limit": 1800},
+        )
+    )
+    assert [polygon["properties"]["bucket"] for polygon in response["polygons"]] == [
+        0,
+        1,
+    ]
+    assert len(response["polygons"][0]["geometry"]["coordinates"][0]) == 9
+
+
+def test_fetch_session(stand_in_server):
+    server = stand_in_server(vertices=256)
+    session = HttpSession()
+    for _ in range(5):
+        response = fetch(
+            server.url + "/isochrone",
+            params={"point": "1.0,1.0", "buckets": 4},
+            session=session,
+        )
+        assert len(json.loads(response)["polygons"]) == 4
+    # the connection is reused and the responses are compressed
+    assert server.connection_count == 1
+    assert session.requests == 5
+    assert session.connections == 1
+    assert session.bytes_decoded == 5 * len(response)
+    assert session.bytes_received < session.bytes_decoded
+
+
+def test_fetch_failed(stand_in_server):
+    server = stand_in_server(error_rate=1, error_status=429, retry_after=7)
+    with pytest.raises(NetworkRequestException) as e:
+        fetch(server.url + "/isochrone", params={"point": "1.0,1.0"})
+    assert e.value.status_code == 429
+    assert e.value.retry_after == 7
+    assert json.loads(e.value.message)["message"] == "Synthetic failure"
+    assert is_retryable(e.value)
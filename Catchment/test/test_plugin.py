@@ -7,7 +7,7 @@ from qgis.core import QgsProject, QgsWkbTypes
 from Catchment.plugin import Plugin
 from Catchment.qgis_plugin_tools.tools.settings import get_setting
 
-from .conftest import MOCK_URL, QGIS_APP
+from .conftest import IFACE, MOCK_URL, QGIS_APP
 
 
 def test_plugin(new_plugin, mock_fetch, qtbot):
@@ -42,3 +42,12 @@ def test_plugin_fail(new_plugin, mock_fetch, qtbot):
     blocker.wait()
     # check that empty layer is not added
     assert QgsProject.instance().count() == 0
+
+
+def test_plugin_without_gui():
+    # qgis_process only initializes the Processing provider
+    plugin = Plugin(IFACE)
+    plugin.initProcessing()
+    assert plugin.dlg is None
+    assert get_setting("gh_url")
+    QGIS_APP.processingRegistry().removeProvider(plugin.provider)
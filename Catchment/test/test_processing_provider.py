@@ -0,0 +1,146 @@
+import os
+
+from qgis.core import (
+    QgsPointXY,
+    QgsProcessing,
+    QgsProcessingContext,
+    QgsProcessingFeatureSourceDefinition,
+    QgsProcessingFeedback,
+    QgsProcessingUtils,
+)
+
+from Catchment.core import isochrone_creator
+from Catchment.processing_provider.assignment_algorithm import AssignmentAlgorithm
+from Catchment.processing_provider.isochrone_algorithm import (
+    API_KEY_VARIABLE,
+    IsochroneAlgorithm,
+)
+
+from .conftest import MOCK_URL, add_points
+
+
+def test_isochrone_algorithm(vector_layer, mock_fetch):
+    mock_fetch(MOCK_URL + "/isochrone")
+    algorithm = IsochroneAlgorithm()
+    algorithm.initAlgorithm()
+    context = QgsProcessingContext()
+    params = {
+        "INPUT": vector_layer,
+        "URL": MOCK_URL,
+        "DISTANCES": "15, 30",
+        "USE_CACHE": False,
+        "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
+    }
+    results, ok = algorithm.run(params, context, QgsProcessingFeedback())
+    assert ok
+    isochrone_layer = QgsProcessingUtils.mapLayerFromString(results["OUTPUT"], context)
+    assert isochrone_layer.featureCount() == 1
+    for feature in isochrone_layer.getFeatures():
+        assert feature.attribute("original_fid") == 1
+        assert feature.attribute("name") == "school"
+        assert feature.attribute("isochrone_distance") == 15
+
+
+def test_isochrone_algorithm_api_key_from_environment(vector_layer, mock_fetch, mocker):
+    mock_fetch(MOCK_URL + "/isochrone")
+    mocker.patch.dict(os.environ, {API_KEY_VARIABLE: "secret"})
+    spy = mocker.spy(isochrone_creator, "fetch")
+    algorithm = IsochroneAlgorithm()
+    algorithm.initAlgorithm()
+    params = {
+        "INPUT": vector_layer,
+        "URL": MOCK_URL,
+        "DISTANCES": "30",
+        "USE_CACHE": False,
+        "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
+    }
+    _, ok = algorithm.run(params, QgsProcessingContext(), QgsProcessingFeedback())
+    assert ok
+    assert spy.call_args[1]["params"]["key"] == "secret"
+
+
+def test_isochrone_algorithm_selected_features(vector_layer, mock_fetch):
+    mock_fetch(MOCK_URL + "/isochrone")
+    fids = add_points(vector_layer, [(2, QgsPointXY(2.0, 1.0))], name="selected school")
+    vector_layer.selectByIds([fids[2]])
+    algorithm = IsochroneAlgorithm()
+    algorithm.initAlgorithm()
+    context = QgsProcessingContext()
+    context.temporaryLayerStore().addMapLayer(vector_layer)
+    params = {
+        "INPUT": QgsProcessingFeatureSourceDefinition(
+            vector_layer.id(), selectedFeaturesOnly=True
+        ),
+        "URL": MOCK_URL,
+        "DISTANCES": "30",
+        "USE_CACHE": False,
+        "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
+    }
+    results, ok = algorithm.run(params, context, QgsProcessingFeedback())
+    assert ok
+    isochrone_layer = QgsProcessingUtils.mapLayerFromString(results["OUTPUT"], context)
+    assert isochrone_layer.featureCount() == 1
+    for isochrone in isochrone_layer.getFeatures():
+        assert isochrone.attribute("original_fid") == 2
+        assert isochrone.attribute("name") == "selected school"
+
+
+def test_isochrone_algorithm_cancelled(vector_layer, mock_fetch, mocker):
+    mock_fetch(MOCK_URL + "/isochrone")
+    add_points(vector_layer, [(2, QgsPointXY(2.0, 1.0))])
+    feedback = QgsProcessingFeedback()
+    fetch = isochrone_creator.fetch
+
+    def cancelling_fetch(*args, **kwargs):
+        # the user cancels while the first request is in flight
+        feedback.cancel()
+        return fetch(*args, **kwargs)
+
+    spy = mocker.patch.object(isochrone_creator, "fetch", side_effect=cancelling_fetch)
+    algorithm = IsochroneAlgorithm()
+    algorithm.initAlgorithm()
+    params = {
+        "INPUT": vector_layer,
+        "URL": MOCK_URL,
+        "DISTANCES": "30",
+        "USE_CACHE": False,
+        "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
+    }
+    algorithm.run(params, QgsProcessingContext(), feedback)
+    assert spy.call_count == 1
+
+
+def test_isochrone_algorithm_request_failed(vector_layer, mock_fetch):
+    mock_fetch("another.url")
+    algorithm = IsochroneAlgorithm()
+    algorithm.initAlgorithm()
+    params = {
+        "INPUT": vector_layer,
+        "URL": MOCK_URL,
+        "DISTANCES": "30",
+        "USE_CACHE": False,
+        "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
+    }
+    # reported by the algorithm instead of raised
+    _, ok = algorithm.run(params, QgsProcessingContext(), QgsProcessingFeedback())
+    assert not ok
+
+
+def test_assignment_algorithm(vector_layer, catchment_layer):
+    algorithm = AssignmentAlgorithm()
+    algorithm.initAlgorithm()
+    context = QgsProcessingContext()
+    params = {
+        "INPUT": vector_layer,
+        "ISOCHRONES": catchment_layer,
+        "ID_FIELD": "original_fid",
+        "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
+    }
+    results, ok = algorithm.run(params, context, QgsProcessingFeedback())
+    assert ok
+    assigned_layer = QgsProcessingUtils.mapLayerFromString(results["OUTPUT"], context)
+    assert assigned_layer.featureCount() == 1
+    for feature in assigned_layer.getFeatures():
+        assert feature.attribute("name") == "school"
+        assert feature.attribute("reachable_ids") == "1"
+        assert feature.attribute("isochrone_distance") == 15
@@ -0,0 +1,36 @@
+import pytest
+
+from Catchment.core.run_history import RunHistory
+
+
+@pytest.fixture(scope="function")
+def history(tmp_path) -> None:
+    history = RunHistory(str(tmp_path / "history.sqlite"))
+    yield history
+    history.close()
+
+
+def test_request_seconds_without_history(history):
+    assert history.request_seconds("http://server", "hike", "minutes", 30) is None
+
+
+def test_request_seconds_single_limit(history):
+    history.record("http://server", "hike", "minutes", 30, 100, 50)
+    history.record("http://server", "hike", "minutes", 30, 100, 150)
+    assert history.request_seconds("http://server", "hike", "minutes", 30) == 1
+    # scaled with the area of the isochrone
+    assert history.request_seconds("http://server", "hike", "minutes", 60) == 4
+    assert history.request_seconds("http://other", "hike", "minutes", 30) is None
+    assert history.request_seconds("http://server", "car", "minutes", 30) is None
+
+
+def test_request_seconds_fitted(history):
+    history.record("http://server", "car", "minutes", 10, 100, 100)
+    history.record("http://server", "car", "minutes", 30, 100, 400)
+    # doubles every 10 minutes
+    assert history.request_seconds(
+        "http://server", "car", "minutes", 20
+    ) == pytest.approx(2)
+    assert history.request_seconds(
+        "http://server", "car", "minutes", 40
+    ) == pytest.approx(8)
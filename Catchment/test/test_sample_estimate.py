@@ -0,0 +1,56 @@
+import pytest
+
+from Catchment.core.metrics import RunMetrics
+from Catchment.core.sample_estimate import (
+    SampleEstimator,
+    duration_string,
+    extrapolate,
+    sample_ids,
+)
+
+from .conftest import add_points, points_in_row
+
+
+def test_sample_ids():
+    assert sample_ids([1, 2, 3], 5) == [1, 2, 3]
+    sample = sample_ids(list(range(100)), 10, seed=1)
+    assert len(set(sample)) == 10
+    assert sample == sample_ids(list(range(100)), 10, seed=1)
+
+
+def test_duration_string():
+    assert duration_string(61) == "2 min"
+    assert duration_string(3 * 3600) == "3.0 h"
+
+
+def test_extrapolate():
+    metrics = RunMetrics()
+    assert extrapolate(metrics, 10, 1000, 4, (0, 0)) is None
+    metrics.latencies = [2.0] * 9
+    metrics.failed_requests = 1
+    metrics.phases.update({"http": 20.0, "json": 0.4, "geometry": 1.0, "write": 1.0})
+    estimate = extrapolate(metrics, 10, 1000, 4, (1024, 2048))
+    assert estimate.failure_rate == pytest.approx(0.1)
+    assert estimate.request_seconds == pytest.approx(2.0)
+    # the requests in parallel take longer than processing the isochrones
+    assert estimate.seconds == pytest.approx(20.4 * 100 / 4)
+    assert estimate.output_bytes == 102400
+    assert estimate.memory_bytes == 204800
+    # with enough parallel requests, processing takes longer
+    assert extrapolate(metrics, 10, 1000, 32, (0, 0)).seconds == pytest.approx(200)
+
+
+def test_sample_estimator(isochrone_opts, mock_fetch):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    add_points(isochrone_opts.layer, points_in_row(29))
+    isochrone_opts.use_cache = True
+    estimator = SampleEstimator(isochrone_opts, sample_size=10)
+    assert estimator.run()
+    estimate = estimator.estimate
+    assert estimate.points == 30
+    assert estimate.sample_points == 10
+    assert estimate.failure_rate == 0
+    assert estimate.output_bytes > 0
+    # the sample is fetched without the cache
+    assert not estimator.creator.opts.use_cache
+    assert estimator.creator.metrics.cached_responses == 0
@@ -0,0 +1,50 @@
+from Catchment.core.isochrone_creator import IsochroneCreator
+from Catchment.core.sharded_runner import merge_layers, split_ids, worker_parameters
+from Catchment.processing_provider.isochrone_algorithm import IsochroneAlgorithm
+
+
+def test_split_ids():
+    assert split_ids([5, 1, 4, 2, 3], 2) == [[1, 2, 3], [4, 5]]
+    assert split_ids([1, 2], 4) == [[1], [2]]
+    assert split_ids([], 4) == []
+
+
+def test_merge_layers(isochrone_opts, mock_fetch, tmp_path):
+    mock_fetch(isochrone_opts.url + "/isochrone")
+    isochrone_opts.write_to_directory = True
+    part_files = []
+    for index in range(2):
+        isochrone_opts.directory = str(tmp_path / f"part{index}")
+        (tmp_path / f"part{index}").mkdir()
+        creator = IsochroneCreator(isochrone_opts)
+        creator.create_isochrone_layer()
+        part_files.append(str(tmp_path / f"part{index}" / f"{creator.name}.gpkg"))
+
+    merged = merge_layers(part_files, str(tmp_path / "merged.gpkg"), "merged")
+    assert merged.featureCount() == 2
+    assert merged.fields().names() == [
+        "fid",
+        "original_fid",
+        "name",
+        "isochrone_distance",
+    ]
+    for feature in merged.getFeatures():
+        assert feature.attribute("original_fid") == 1
+        assert feature.attribute("name") == "school"
+        assert feature.attribute("isochrone_distance") == 30
+
+
+def test_worker_parameters(isochrone_opts):
+    isochrone_opts.buckets = 3
+    isochrone_opts.api_key = "secret"
+    parameters = worker_parameters(isochrone_opts, "points.gpkg", "ids.txt", "part")
+    # the key is passed in the environment instead of the command line
+    assert "secret" not in [str(value) for value in parameters.values()]
+    assert parameters[IsochroneAlgorithm.DISTANCES] == "30"
+    assert parameters[IsochroneAlgorithm.BUCKETS] == 3
+    assert parameters[IsochroneAlgorithm.HTTP2] == 1
+    # the buckets are not used with listed distances, even a single one
+    isochrone_opts.distances = [30]
+    parameters = worker_parameters(isochrone_opts, "points.gpkg", "ids.txt", "part")
+    assert parameters[IsochroneAlgorithm.DISTANCES] == "30"
+    assert parameters[IsochroneAlgorithm.BUCKETS] == 1
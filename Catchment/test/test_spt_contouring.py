@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from Catchment.core.spt_contouring import ShortestPathTree, parse_spt
+
+SPT_CSV = """latitude,longitude,time,distance
+1.0,2.0,0,0.0
+1.5,2.0,1000,50.5
+"""
+
+
+def grid_tree(steps: int = 4) -> ShortestPathTree:
+    """Nodes on the unit square, the value of each node is its x"""
+    xs, ys = np.meshgrid(np.linspace(0, 1, steps + 1), np.linspace(0, 1, steps + 1))
+    coordinates = np.column_stack([xs.ravel(), ys.ravel()])
+    return ShortestPathTree(coordinates, coordinates[:, 0].copy())
+
+
+def test_parse_spt():
+    coordinates, values = parse_spt(SPT_CSV, "distance")
+    assert coordinates.tolist() == [[2.0, 1.0], [2.0, 1.5]]
+    assert values.tolist() == [0.0, 50.5]
+    _, values = parse_spt(SPT_CSV, "time")
+    assert values.tolist() == [0, 1000]
+
+
+def test_duplicate_nodes_keep_lowest_value():
+    tree = ShortestPathTree(
+        np.array([[0.0, 0.0], [1.0, 0.0], [0.0, 0.0]]), np.array([5.0, 1.0, 2.0])
+    )
+    assert tree.coordinates.tolist() == [[0.0, 0.0], [1.0, 0.0]]
+    assert tree.values.tolist() == [2.0, 1.0]
+
+
+def test_contour():
+    tree = grid_tree()
+    assert len(tree.triangles) == 2 * 4 * 4
+    # linear values are interpolated exactly, between the nodes too
+    for threshold in (0.25, 0.6, 1.0):
+        contour = tree.contour(threshold)
+        assert contour.isGeosValid()
+        assert not contour.isMultipart()
+        assert contour.area() == pytest.approx(threshold)
+    assert tree.contour(-1) is None
+
+
+def test_contour_rings():
+    rings = grid_tree().contour_rings(0.5)
+    assert len(rings) == 1
+    assert rings[0][0] == rings[0][-1]
+    xs = [x for x, _ in rings[0]]
+    assert min(xs) == 0.0
+    assert max(xs) == pytest.approx(0.5)
+    assert grid_tree().contour_rings(-1) == []
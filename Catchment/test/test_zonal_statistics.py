@@ -0,0 +1,69 @@
+import struct
+
+import pytest
+from osgeo import gdal, osr
+from qgis.core import (
+    NULL,
+    QgsFeature,
+    QgsGeometry,
+    QgsRasterLayer,
+    QgsVectorLayer,
+)
+
+from Catchment.core import zonal_statistics
+from Catchment.core.geometry import polygon_rings
+from Catchment.core.zonal_statistics import PopulationRaster, polygon_mask
+
+SQUARE_WITH_HOLE = "POLYGON((1 1, 9 1, 9 9, 1 9, 1 1), (3 3, 3 5, 5 5, 5 3, 3 3))"
+
+
+@pytest.fixture
+def population_layer(tmp_path):
+    """10 x 10 raster of one person per cell, with a single cell of no data"""
+    path = str(tmp_path / "population.tif")
+    dataset = gdal.GetDriverByName("GTiff").Create(path, 10, 10, 1, gdal.GDT_Float32)
+    dataset.SetGeoTransform((0, 1, 0, 10, 0, -1))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    dataset.SetProjection(srs.ExportToWkt())
+    band = dataset.GetRasterBand(1)
+    band.Fill(1)
+    band.SetNoDataValue(-1)
+    # the cell from (8, 1) to (9, 2)
+    band.WriteRaster(8, 8, 1, 1, struct.pack("<f", -1))
+    del dataset
+    return QgsRasterLayer(path, "population")
+
+
+def test_polygon_mask():
+    rings = polygon_rings(QgsGeometry.fromWkt(SQUARE_WITH_HOLE))
+    mask = polygon_mask(rings, 0, 10, 1, 1, 10, 10)
+    assert mask.sum() == 64 - 4
+    # the top left cell and a cell in the hole are outside
+    assert not mask[0, 0]
+    assert not mask[6, 3]
+    assert mask[1, 1]
+
+
+def test_population_in_polygons(population_layer, mocker):
+    # several tiles, the polygons span tile borders
+    mocker.patch.object(zonal_statistics, "TILE_SIZE", 3)
+    polygon_layer = QgsVectorLayer("Polygon?crs=epsg:4326", "polygons", "memory")
+    features = []
+    for wkt in [
+        SQUARE_WITH_HOLE,
+        "POLYGON((0.2 0.2, 4.8 0.2, 4.8 4.8, 0.2 4.8, 0.2 0.2))",
+        "POLYGON((20 20, 21 20, 21 21, 20 20))",
+    ]:
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry.fromWkt(wkt))
+        features.append(feature)
+    polygon_layer.dataProvider().addFeatures(features)
+
+    population = PopulationRaster(population_layer)
+    population.add_population(polygon_layer)
+    assert [feature["population"] for feature in polygon_layer.getFeatures()] == [
+        64 - 4 - 1,
+        25,
+        NULL,
+    ]
@@ -1,10 +1,14 @@
 import logging
+import sqlite3
 from math import floor, pow
 from typing import Optional
 
 from PyQt5.QtWidgets import QDialog
-from qgis.core import QgsMapLayerProxyModel
+from qgis.core import QgsApplication, QgsMapLayerProxyModel
 
+from ..core.isochrone_creator import InvalidDistancesException, IsochroneOpts
+from ..core.run_history import RunHistory
+from ..core.sample_estimate import SampleEstimator
 from ..definitions.constants import Profile, Unit
 from ..definitions.gui import Panels
 from ..qgis_plugin_tools.tools.exceptions import QgsPluginException
@@ -22,9 +26,16 @@ class CatchmentAreaPanel(BasePanel):
     def __init__(self, dialog: QDialog) -> None:
         super().__init__(dialog)
         self.panel = Panels.CatchmentAreas
+        self.estimate_from_history = False
+        self.estimator: Optional[SampleEstimator] = None
+        # opened once, the estimate is updated whenever an option changes
+        self.history: Optional[RunHistory] = None
 
     def setup_panel(self) -> None:
         self.dlg.combobox_layer.setFilters(QgsMapLayerProxyModel.PointLayer)
+        self.dlg.combobox_population.setFilters(QgsMapLayerProxyModel.RasterLayer)
+        self.dlg.combobox_population.setAllowEmptyLayer(True)
+        self.dlg.combobox_population.setLayer(None)
         self.__update_duration_label()
 
         # connect the signals, since pyqt slot decorator cannot be used
@@ -45,27 +56,58 @@ class CatchmentAreaPanel(BasePanel):
         self.dlg.spinbox_buckets.valueChanged.connect(
             self.on_spinbox_buckets_valueChanged
         )
+        self.dlg.lineedit_distances.textChanged.connect(
+            self.on_lineedit_distances_textChanged
+        )
+        self.dlg.btn_estimate.clicked.connect(self.on_btn_estimate_clicked)
+        # contoured trees support more divisions of the distance
+        self.dlg.checkbox_spt.clicked.connect(self.on_checkbox_spt_clicked)
+        # the estimate depends on the number of parallel requests in settings
+        self.dlg.spinbox_concurrency.valueChanged.connect(
+            self.on_spinbox_concurrency_valueChanged
+        )
+        self.dlg.spinbox_processes.valueChanged.connect(
+            self.on_spinbox_processes_valueChanged
+        )
 
     def _get_duration(self) -> Optional[int]:
         """
-        Estimated duration of the calculation in minutes,
+        Estimated duration of the calculation in minutes.
+
+        If runs with the same server, profile and unit have been made before,
+        the estimate is based on how long their requests took. Otherwise,
         assuming O(2^(5K-1) - 2^(4K-4)) scaling.
 
         Here K is one step in the graph. Simplifies to
         O(2^(5K)-2^(4K))~=O(2^(5K)) for large K.
         """
+        self.estimate_from_history = False
         opts = self.dlg.read_isochrone_options()
+        # raises an exception if the distances cannot be requested together
+        distance, _ = opts.get_request_limit_and_buckets()
         if opts.check_if_opts_set():
-            buckets = opts.buckets
-            count = buckets * (
+            points = (
                 opts.layer.selectedFeatureCount()  # type: ignore
                 if opts.selected_only
                 else opts.layer.featureCount()  # type: ignore
             )
-            distance_in_minutes_by_foot: int = opts.distance  # type: ignore
+            request_seconds = self.__get_request_seconds(opts, distance)
+            if points and request_seconds is not None:
+                self.estimate_from_history = True
+                # all the distances of a point are fetched with a single request
+                parallel_requests = (
+                    opts.max_concurrent_requests * self.dlg.spinbox_processes.value()
+                )
+                total = points * request_seconds / parallel_requests / 60
+                if total > 120:
+                    raise TooHeavyOperationException()
+                return floor(total)
+            # all the distances of a point are fetched with a single request
+            count = points
+            distance_in_minutes_by_foot: int = distance
             if opts.unit == Unit.METERS:
                 # assuming walking speed 5 km/h = 83.3 m/min
-                distance_in_minutes_by_foot = opts.distance / 83.3  # type: ignore
+                distance_in_minutes_by_foot = distance / 83.3  # type: ignore
             elif opts.profile == Profile.CYCLING:
                 # assuming biking speed 25 km/h
                 distance_in_minutes_by_foot = 3 * distance_in_minutes_by_foot  # type: ignore  # noqa
@@ -89,6 +131,49 @@ class CatchmentAreaPanel(BasePanel):
                 return floor(total)
         return None
 
+    def __get_request_seconds(self, opts: IsochroneOpts, limit: int) -> Optional[float]:
+        """Time of a single request in previous runs, if any"""
+        try:
+            if self.history is None:
+                self.history = RunHistory()
+            return self.history.request_seconds(
+                opts.get_isochrone_url(),
+                opts.profile.value,  # type: ignore
+                opts.unit.value,  # type: ignore
+                limit,
+            )
+        except (OSError, sqlite3.Error) as e:
+            LOGGER.warning(f"Could not read the durations of previous runs: {e}")
+            return None
+
+    def on_btn_estimate_clicked(self) -> None:
+        """Estimates the run from a sample of the points in the background"""
+        try:
+            opts = self.dlg.read_isochrone_options()
+        except InvalidDistancesException as e:
+            LOGGER.error(e.message)
+            return
+        if not opts.check_if_opts_set():
+            LOGGER.warning("Please select the point layer and the distances first")
+            return
+        self.estimator = SampleEstimator(opts, self.dlg.spinbox_processes.value())
+        self.estimator.taskCompleted.connect(self.on_estimator_completed)
+        self.estimator.taskTerminated.connect(self.on_estimator_terminated)
+        self.dlg.btn_estimate.setEnabled(False)
+        self.dlg.duration_label.setText(
+            "Fetching isochrones for a sample of the points..."
+        )
+        self.dlg.duration_label.setStyleSheet("color: black")
+        QgsApplication.taskManager().addTask(self.estimator)
+
+    def on_estimator_completed(self) -> None:
+        self.dlg.btn_estimate.setEnabled(True)
+        self.dlg.duration_label.setText(self.estimator.estimate.summary())  # type: ignore  # noqa
+
+    def on_estimator_terminated(self) -> None:
+        self.dlg.btn_estimate.setEnabled(True)
+        self.__update_duration_label()
+
     def on_radiobtn_mins_clicked(self) -> None:
         self.__update_unit_selector(Unit.MINUTES)
         self.__update_duration_label()
@@ -118,6 +203,22 @@ class CatchmentAreaPanel(BasePanel):
     def on_spinbox_buckets_valueChanged(self) -> None:  # noqa
         self.__update_duration_label()
 
+    def on_checkbox_spt_clicked(self) -> None:
+        self.__update_duration_label()
+
+    def on_spinbox_concurrency_valueChanged(self) -> None:  # noqa
+        self.__update_duration_label()
+
+    def on_spinbox_processes_valueChanged(self) -> None:  # noqa
+        self.__update_duration_label()
+
+    def on_lineedit_distances_textChanged(self) -> None:  # noqa
+        # a list of distances overrides the single distance and its divisions
+        single_distance = not self.dlg.lineedit_distances.text().strip()
+        self.dlg.spinbox_distance.setEnabled(single_distance)
+        self.dlg.spinbox_buckets.setEnabled(single_distance)
+        self.__update_duration_label()
+
     def __update_unit_selector(self, selected_unit: Unit) -> None:
         """Sets unit spinbox min, max, and step values
         based on currently selected unit"""
@@ -145,14 +246,24 @@ class CatchmentAreaPanel(BasePanel):
         try:
             duration = self._get_duration()
             if duration is not None:
-                self.dlg.duration_label.setText(
-                    f"Approximate processing time: {duration} mins\nThe amount of "
-                    "road data in your area and your internet connection speed\n"
-                    "will affect the total processing time."
-                )
+                if self.estimate_from_history:
+                    self.dlg.duration_label.setText(
+                        f"Approximate processing time: {duration} mins\nBased on "
+                        "the requests of previous runs with the same server\n"
+                        "and mode of transit."
+                    )
+                else:
+                    self.dlg.duration_label.setText(
+                        f"Approximate processing time: {duration} mins\nThe amount of "
+                        "road data in your area and your internet connection speed\n"
+                        "will affect the total processing time."
+                    )
             else:
                 self.dlg.duration_label.setText("")
             self.dlg.duration_label.setStyleSheet("color: black")
+        except InvalidDistancesException as e:
+            self.dlg.duration_label.setText(e.message)
+            self.dlg.duration_label.setStyleSheet("color: red")
         except (OverflowError, TooHeavyOperationException):
             self.dlg.duration_label.setText(
                 "Too many points or too large distance selected.\nRunning with these "
@@ -1,4 +1,5 @@
 import logging
+from typing import List, Optional
 
 from PyQt5.QtWidgets import (
     QDesktopWidget,
@@ -9,8 +10,16 @@ from PyQt5.QtWidgets import (
 )
 from qgis.core import QgsApplication
 
-from ..core.isochrone_creator import IsochroneCreator, IsochroneOpts
-from ..definitions.constants import Profile, Unit
+from ..core.isochrone_cache import DEFAULT_CACHE_SIZE_MB
+from ..core.isochrone_creator import (
+    InvalidDistancesException,
+    IsochroneCreator,
+    IsochroneOpts,
+    parse_distances,
+)
+from ..core.job_queue import IsochroneJobQueue, sweep_opts
+from ..core.sharded_runner import ShardedIsochroneRunner, ShardingNotSupportedException
+from ..definitions.constants import Engine, Profile, Unit
 from ..definitions.gui import Panels
 from ..qgis_plugin_tools.tools.resources import load_ui, plugin_name
 from ..qgis_plugin_tools.tools.settings import get_setting, set_setting
@@ -35,10 +44,30 @@ class MainDialog(QDialog, FORM_CLASS):  # type: ignore
         self.buttonbox_main.button(QDialogButtonBox.Cancel).setText("Close")
         self.lineedit_url.setText(get_setting("gh_url"))
         self.lineedit_apikey.setText(get_setting("api_key"))
+        self.spinbox_concurrency.setValue(
+            int(get_setting("max_concurrent_requests", 1))
+        )
+        self.spinbox_processes.setValue(int(get_setting("worker_processes", 1)))
+        self.spinbox_retries.setValue(int(get_setting("max_retries", 3)))
+        self.checkbox_http2.setChecked(get_setting("allow_http2", True, bool))
+        self.checkbox_metrics.setChecked(get_setting("write_metrics", False, bool))
+        self.checkbox_profile.setChecked(get_setting("profile_run", False, bool))
         self.file_widget.setFilePath(get_setting("result_dir"))
+        self.checkbox_cache.setChecked(get_setting("use_cache", True, bool))
+        self.checkbox_coverage.setChecked(get_setting("create_coverage", False, bool))
+        self.checkbox_update.setChecked(get_setting("update_existing", False, bool))
+        self.checkbox_spt.setChecked(get_setting("contour_locally", False, bool))
+        self.spinbox_cache_size.setValue(
+            int(get_setting("cache_size_mb", DEFAULT_CACHE_SIZE_MB))
+        )
         # only check write to file if path was found
         if self.file_widget.filePath():
             self.checkbox_file.setChecked(True)
+        # jobs added to the queue, run together with a shared request budget
+        self.queue: List[IsochroneOpts] = []
+        self.job_queue: Optional[IsochroneJobQueue] = None
+        self.btn_queue_add.clicked.connect(self.on_btn_queue_add_clicked)
+        self.btn_queue_run.clicked.connect(self.on_btn_queue_run_clicked)
 
         self._set_window_location()
         self.panels = {
@@ -64,12 +93,27 @@ class MainDialog(QDialog, FORM_CLASS):  # type: ignore
         opts = IsochroneOpts()
         opts.url = self.lineedit_url.text()
         opts.api_key = self.lineedit_apikey.text()
+        opts.max_concurrent_requests = self.spinbox_concurrency.value()
+        opts.max_retries = self.spinbox_retries.value()
+        opts.http2 = self.checkbox_http2.isChecked()
         opts.write_to_directory = self.checkbox_file.isChecked()
         opts.directory = self.file_widget.filePath()
+        opts.update_existing = self.checkbox_update.isChecked()
+        opts.use_cache = self.checkbox_cache.isChecked()
+        opts.cache_size_mb = self.spinbox_cache_size.value()
+        opts.write_metrics = self.checkbox_metrics.isChecked()
+        opts.profile_run = self.checkbox_profile.isChecked()
         opts.layer = self.combobox_layer.currentLayer()
         opts.selected_only = self.checkbox_selected_only.isChecked()
         opts.distance = self.spinbox_distance.value()
         opts.buckets = self.spinbox_buckets.value()
+        opts.distances = parse_distances(self.lineedit_distances.text())
+        opts.snap_tolerance = self.spinbox_snap_tolerance.value()
+        opts.simplify_tolerance = self.spinbox_simplify_tolerance.value()
+        opts.coverage = self.checkbox_coverage.isChecked()
+        opts.population_layer = self.combobox_population.currentLayer()
+        if self.checkbox_spt.isChecked():
+            opts.engine = Engine.SPT
 
         unit = self.__get_radiobtn_name(self.groupbox_units)
         if unit == "radiobtn_mins":
@@ -105,10 +149,67 @@ class MainDialog(QDialog, FORM_CLASS):  # type: ignore
 
     def accept(self) -> None:
         # override default accept to prevent closing dialog, just run task instead
-        opts = self.read_isochrone_options()
+        try:
+            opts = self.read_isochrone_options()
+        except InvalidDistancesException as e:
+            LOGGER.error(e.message)
+            return
         if opts.check_if_opts_set():
             set_setting("gh_url", opts.url)
             set_setting("result_dir", opts.directory)
             set_setting("api_key", opts.api_key)
-            self.creator = IsochroneCreator(opts)
+            set_setting("max_concurrent_requests", opts.max_concurrent_requests)
+            set_setting("max_retries", opts.max_retries)
+            set_setting("allow_http2", opts.http2)
+            set_setting("use_cache", opts.use_cache)
+            set_setting("cache_size_mb", opts.cache_size_mb)
+            set_setting("write_metrics", opts.write_metrics)
+            set_setting("profile_run", opts.profile_run)
+            set_setting("create_coverage", opts.coverage)
+            set_setting("update_existing", opts.update_existing)
+            set_setting("contour_locally", opts.engine == Engine.SPT)
+            processes = self.spinbox_processes.value()
+            set_setting("worker_processes", processes)
+            if processes > 1:
+                try:
+                    self.creator = ShardedIsochroneRunner(opts, processes)
+                except ShardingNotSupportedException as e:
+                    LOGGER.error(e.message)
+                    return
+            else:
+                self.creator = IsochroneCreator(opts)
             QgsApplication.taskManager().addTask(self.creator)
+
+    def on_btn_queue_add_clicked(self) -> None:
+        try:
+            opts = self.read_isochrone_options()
+        except InvalidDistancesException as e:
+            LOGGER.error(e.message)
+            return
+        if not opts.check_if_opts_set():
+            LOGGER.warning("Please select the point layer and the distances first")
+            return
+        profiles = (
+            list(Profile) if self.checkbox_all_profiles.isChecked() else [opts.profile]
+        )
+        queued = {job.get_layer_name() for job in self.queue}
+        for job in sweep_opts(opts, [opts.layer], profiles):  # type: ignore
+            # jobs with the same name would write to the same file
+            if job.get_layer_name() in queued:
+                LOGGER.warning(f"{job.get_layer_name()} is already queued")
+                continue
+            queued.add(job.get_layer_name())
+            self.queue.append(job)
+        self.__update_queue_button()
+
+    def on_btn_queue_run_clicked(self) -> None:
+        if not self.queue:
+            return
+        self.job_queue = IsochroneJobQueue(self.queue, self.spinbox_concurrency.value())
+        QgsApplication.taskManager().addTask(self.job_queue)
+        self.queue = []
+        self.__update_queue_button()
+
+    def __update_queue_button(self) -> None:
+        self.btn_queue_run.setText(f"Run queue ({len(self.queue)})")
+        self.btn_queue_run.setEnabled(bool(self.queue))
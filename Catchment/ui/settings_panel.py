@@ -1,9 +1,11 @@
 import logging
+import sqlite3
 import webbrowser
 
 from PyQt5.QtWidgets import QDialog
 from qgis.gui import QgsFileWidget
 
+from ..core.isochrone_cache import IsochroneCache
 from ..definitions.gui import Panels
 from ..qgis_plugin_tools.tools.custom_logging import (
     LogTarget,
@@ -27,6 +29,9 @@ class SettingsPanel(BasePanel):
     def setup_panel(self) -> None:
         # connect the signals, since pyqt slot decorator cannot be used
         self.dlg.checkbox_file.clicked.connect(self.on_checkbox_file_clicked)
+        self.dlg.checkbox_cache.clicked.connect(self.on_checkbox_cache_clicked)
+        self.dlg.btn_clear_cache.clicked.connect(self.on_btn_clear_cache_clicked)
+        self.on_checkbox_cache_clicked()
 
         self.dlg.file_widget.setStorageMode(QgsFileWidget.StorageMode.GetDirectory)
 
@@ -56,3 +61,19 @@ class SettingsPanel(BasePanel):
 
     def on_checkbox_file_clicked(self) -> None:
         self.dlg.file_widget.setEnabled(self.dlg.checkbox_file.isChecked())
+        self.dlg.checkbox_update.setEnabled(self.dlg.checkbox_file.isChecked())
+
+    def on_checkbox_cache_clicked(self) -> None:
+        self.dlg.spinbox_cache_size.setEnabled(self.dlg.checkbox_cache.isChecked())
+
+    def on_btn_clear_cache_clicked(self) -> None:
+        try:
+            cache = IsochroneCache()
+            try:
+                cache.clear()
+            finally:
+                cache.close()
+        except (OSError, sqlite3.Error) as e:
+            LOGGER.warning(f"Could not clear isochrone cache: {e}")
+            return
+        LOGGER.info("Isochrone cache cleared")